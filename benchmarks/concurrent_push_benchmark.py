@@ -0,0 +1,173 @@
+#!/usr/bin/env python
+from __future__ import print_function
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import datetime
+import tempfile
+import threading
+import subprocess
+from optparse import OptionParser
+
+benchmarks_directory = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, benchmarks_directory)
+import synthetic_repo
+from run_benchmarks import percentile
+
+commit_message = "Generated change Issue: BENCH-4 Reviewer: someone"
+
+def create_server(path, options, rng):
+	"""Creates a bare repository with the generated files on its master branch, then enables the server side hooks in it.
+
+	Returns:
+		the path of the seed clone the pushers are cloned from
+	"""
+
+	bare_path = os.path.join(path, "server.git")
+	_git(path, "init", "-q", "--bare", bare_path)
+	seed_path = os.path.join(path, "seed")
+	os.makedirs(seed_path)
+	_git(seed_path, "init", "-q")
+	_git(seed_path, "config", "user.name", "Benchmark User")
+	_git(seed_path, "config", "user.email", "benchmark@example.com")
+	synthetic_repo._write_files(seed_path, synthetic_repo.generate_files(options, rng))
+	_git(seed_path, "add", "-A")
+	_git(seed_path, "commit", "-q", "-m", "Generated files Issue: BENCH-1")
+	# the history from before the hooks were enabled is never validated
+	_git(seed_path, "push", "-q", bare_path, "HEAD:master")
+
+	shutil.copytree(synthetic_repo.hooks_directory, os.path.join(bare_path, "git-hooks"), ignore=shutil.ignore_patterns(".git", "*.pyc", "__pycache__"))
+	with open(os.path.join(bare_path, "git-hooks-config.json"), "w") as config_file:
+		json.dump(_generate_config(options), config_file, indent=4)
+	with open(os.devnull, "w") as devnull:
+		subprocess.check_call([sys.executable, "enable.py"], cwd=os.path.join(bare_path, "git-hooks"), stdout=devnull)
+	return seed_path
+
+def create_pushers(path, seed_path, options, rng):
+	"""Clones a repository per pusher, each with a branch changing some of the files.
+
+	Returns:
+		a list of (clone path, branch, whether the push should be rejected)
+	"""
+
+	paths = sorted(subprocess.check_output(["git", "ls-files"], cwd=seed_path, universal_newlines=True).splitlines())
+	# public API classes would need javadoc added as well
+	java_paths = [p for p in paths if p.endswith(".java") and b"api_1_0" not in _read(os.path.join(seed_path, p))]
+	feature_paths = [p for p in paths if p.endswith(".feature")]
+	# changed java files must have an up to date copyright
+	copyright_years = ("2010 - %d" % datetime.date.today().year).encode("utf-8")
+	pushers = []
+	for i in range(options.pushers):
+		clone_path = os.path.join(path, "pusher-%d" % i)
+		_git(path, "clone", "-q", os.path.join(path, "server.git"), clone_path)
+		_git(clone_path, "config", "user.name", "Pusher %d" % i)
+		_git(clone_path, "config", "user.email", "pusher%d@example.com" % i)
+		branch = "feature-%d" % i
+		_git(clone_path, "checkout", "-q", "-b", branch)
+		for changed_path in rng.sample(java_paths, min(options.changed_files, len(java_paths))):
+			contents = _read(os.path.join(clone_path, changed_path))
+			with open(os.path.join(clone_path, changed_path), "wb") as fp:
+				fp.write(contents.replace(b"2010 - 2019", copyright_years) + ("\n// changed by pusher %d\n" % i).encode("utf-8"))
+		# every few pushers tag a scenario with an unallowed tag, which the server must reject
+		rejected = options.rejected_every > 0 and i % options.rejected_every == options.rejected_every - 1
+		if rejected:
+			feature_path = os.path.join(clone_path, rng.choice(feature_paths))
+			contents = _read(feature_path)
+			with open(feature_path, "wb") as fp:
+				fp.write(contents.replace(b"\t@scenario0\n", b"\t@wip @scenario0\n", 1))
+		_git(clone_path, "commit", "-q", "-a", "-m", commit_message)
+		pushers.append((clone_path, branch, rejected))
+	return pushers
+
+def push_concurrently(pushers, branch_suffix=""):
+	"""Pushes every pusher's branch at the same time.
+
+	Returns:
+		a list of (seconds, exit code, output) in the order of the pushers
+	"""
+
+	results = [None] * len(pushers)
+	start_barrier = threading.Event()
+
+	def push(i, clone_path, branch):
+		start_barrier.wait()
+		start = time.time()
+		process = subprocess.Popen(["git", "push", "origin", "%s:%s%s" % (branch, branch, branch_suffix)], cwd=clone_path,
+			stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+		output = process.communicate()[0]
+		results[i] = (time.time() - start, process.returncode, output.decode("utf-8", "replace"))
+
+	threads = [threading.Thread(target=push, args=(i, clone_path, branch)) for i, (clone_path, branch, rejected) in enumerate(pushers)]
+	for thread in threads:
+		thread.start()
+	start_barrier.set()
+	for thread in threads:
+		thread.join()
+	return results
+
+def report(name, pushers, results, wall_seconds):
+	"""Prints the latencies of a round of pushes and checks each push was accepted or rejected as expected.
+
+	Returns:
+		True if every push ended as expected
+	"""
+
+	latencies_ms = sorted(seconds * 1000 for seconds, return_code, output in results)
+	print("%-12s %7d %10.2f %10.0f %10.0f %10.0f" % (name, len(results), wall_seconds, percentile(latencies_ms, 0.5),
+		percentile(latencies_ms, 0.95), latencies_ms[-1]))
+	all_expected = True
+	for (clone_path, branch, rejected), (seconds, return_code, output) in zip(pushers, results):
+		if (return_code != 0) != rejected or (rejected and "@wip" not in output):
+			print("Unexpected result pushing %s (exit code %d):\n%s" % (branch, return_code, output))
+			all_expected = False
+	return all_expected
+
+def _generate_config(options):
+	config = synthetic_repo._generate_config(options)
+	config["validation_cache"] = {"enabled": True}
+	config["server_validation"] = {"max_workers": options.max_workers, "queue_timeout_seconds": options.queue_timeout}
+	return config
+
+def _read(path):
+	with open(path, "rb") as fp:
+		return fp.read()
+
+def _git(path, *args):
+	subprocess.check_call(["git"] + list(args), cwd=path)
+
+if __name__ == "__main__":
+	parser = OptionParser(usage="python %s [options]" % __file__)
+	parser.set_description("Pushes branches to a bare repository running the server side hooks from many clients at once")
+	parser.add_option("-p", "--pushers", type="int", dest="pushers", default=24, help="Number of concurrent pushes")
+	parser.add_option("-f", "--changed-files", type="int", dest="changed_files", default=40, help="Number of java files each push changes")
+	parser.add_option("-e", "--rejected-every", type="int", dest="rejected_every", default=4, help="Every how many pushes one has an error, 0 for none")
+	parser.add_option("-w", "--max-workers", type="int", dest="max_workers", default=4, help="Worker slots the server shares between pushes")
+	parser.add_option("-t", "--queue-timeout", type="float", dest="queue_timeout", default=300, help="Seconds a push waits for a worker slot")
+	parser.add_option("--keep", action="store_true", dest="keep", default=False, help="Keep the generated repositories")
+	synthetic_repo.add_generator_options(parser)
+	parser.set_defaults(java_files=200, feature_files=20, js_files=0, json_files=0, xml_files=0)
+	(options, args) = parser.parse_args()
+
+	path = tempfile.mkdtemp(prefix="git-hooks-push-")
+	try:
+		rng = random.Random(options.seed)
+		seed_path = create_server(path, options, rng)
+		pushers = create_pushers(path, seed_path, options, rng)
+
+		print("%d pushers, %d worker slots" % (options.pushers, options.max_workers))
+		print("%-12s %7s %10s %10s %10s %10s" % ("round", "pushes", "wall s", "p50 ms", "p95 ms", "max ms"))
+		start = time.time()
+		all_expected = report("cold", pushers, push_concurrently(pushers), time.time() - start)
+		# the same commits to new branches are no longer new, only rejected ones are validated again, from the cache
+		start = time.time()
+		all_expected = report("cached", pushers, push_concurrently(pushers, "-again"), time.time() - start) and all_expected
+		if not all_expected:
+			sys.exit(1)
+	finally:
+		if options.keep:
+			print("Kept the repositories in %s" % path)
+		else:
+			shutil.rmtree(path)
@@ -0,0 +1,42 @@
+#!/usr/bin/env python
+from __future__ import print_function
+import os
+import sys
+import time
+from optparse import OptionParser
+
+hooks_directory = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, hooks_directory)
+from file_validators import feature_file_validator
+from synthetic_repo import generate_feature_file
+
+unallowed_tags = frozenset(["@wip"])
+
+def time_validation(corpus, fast_scan):
+	start = time.time()
+	errors = [feature_file_validator.validate_feature_file(("M", path), unallowed_tags, contents, fast_scan=fast_scan) for path, contents in corpus]
+	return time.time() - start, errors
+
+if __name__ == "__main__":
+	parser = OptionParser(usage="python %s [options]" % __file__)
+	parser.set_description("Compares the line scan of feature files against the full gherkin parse on a corpus of large feature files")
+	parser.add_option("-n", "--files", type="int", dest="files", default=50, help="Number of feature files")
+	parser.add_option("-s", "--scenarios", type="int", dest="scenarios", default=40, help="Number of scenarios per file")
+	parser.add_option("-r", "--example-rows", type="int", dest="example_rows", default=200, help="Number of example rows per scenario")
+	(options, args) = parser.parse_args()
+
+	corpus = [("generated_%d.feature" % index, generate_feature_file(index, options.scenarios, options.example_rows)) for index in range(options.files)]
+	corpus_bytes = sum(len(contents) for path, contents in corpus)
+	scanned_count = sum(1 for path, contents in corpus if feature_file_validator.scan_feature_file(contents.decode("utf-8")) is not None)
+
+	parse_seconds, parse_errors = time_validation(corpus, False)
+	scan_seconds, scan_errors = time_validation(corpus, True)
+	if parse_errors != scan_errors:
+		print("The line scan reported different errors than the full parse!")
+		sys.exit(1)
+
+	print("%d files, %.1f MB, %d scanned without falling back to the parser" % (options.files, corpus_bytes / 1048576.0, scanned_count))
+	print("%-12s %10s %12s" % ("path", "seconds", "files/sec"))
+	print("%-12s %10.2f %12.1f" % ("full parse", parse_seconds, options.files / parse_seconds))
+	print("%-12s %10.2f %12.1f" % ("line scan", scan_seconds, options.files / scan_seconds))
+	print("speedup: %.1fx" % (parse_seconds / scan_seconds))
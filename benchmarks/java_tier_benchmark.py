@@ -0,0 +1,45 @@
+#!/usr/bin/env python
+from __future__ import print_function
+import os
+import sys
+import time
+import random
+from optparse import OptionParser
+
+hooks_directory = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, hooks_directory)
+from file_validators import java_file_validator
+from synthetic_repo import generate_java_file
+
+def time_validation(corpus, tiered):
+	start = time.time()
+	errors = [java_file_validator.validate_java_file(("M", path), contents, tiered=tiered) for path, contents in corpus]
+	return time.time() - start, errors
+
+if __name__ == "__main__":
+	parser = OptionParser(usage="python %s [options]" % __file__)
+	parser.set_description("Compares tiered java validation against parsing every file on a corpus of mixed java files")
+	parser.add_option("-n", "--files", type="int", dest="files", default=200, help="Number of java files")
+	parser.add_option("-m", "--methods", type="int", dest="methods", default=30, help="Number of methods per file")
+	parser.add_option("-p", "--plain-ratio", type="float", dest="plain_ratio", default=0.8, help="Share of files no AST rule applies to")
+	parser.add_option("-s", "--seed", type="int", dest="seed", default=0, help="Random seed of the corpus")
+	(options, args) = parser.parse_args()
+
+	random.seed(options.seed)
+	corpus = []
+	for index in range(options.files):
+		kind = "plain" if random.random() < options.plain_ratio else random.choice(["api", "osgi", "interface"])
+		corpus.append(("Service%d.java" % index, generate_java_file(kind, index, options.methods)))
+	corpus_bytes = sum(len(contents) for path, contents in corpus)
+
+	full_seconds, full_errors = time_validation(corpus, False)
+	tiered_seconds, tiered_errors = time_validation(corpus, True)
+	if full_errors != tiered_errors:
+		print("The tiered path reported different errors than the full parse!")
+		sys.exit(1)
+
+	print("%d files, %.1f MB, %d%% plain" % (options.files, corpus_bytes / 1048576.0, options.plain_ratio * 100))
+	print("%-12s %10s %12s" % ("path", "seconds", "files/sec"))
+	print("%-12s %10.2f %12.1f" % ("full parse", full_seconds, options.files / full_seconds))
+	print("%-12s %10.2f %12.1f" % ("tiered", tiered_seconds, options.files / tiered_seconds))
+	print("speedup: %.1fx" % (full_seconds / tiered_seconds))
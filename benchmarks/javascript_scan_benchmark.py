@@ -0,0 +1,62 @@
+#!/usr/bin/env python
+from __future__ import print_function
+import os
+import re
+import sys
+import time
+from optparse import OptionParser
+
+hooks_directory = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, hooks_directory)
+from file_validators import javascript_file_validator
+
+# what the validator did before it tokenized, kept to compare against
+old_debugger_pattern = re.compile(r"(\s+|;)debugger;*\s+", flags=re.MULTILINE)
+
+def generate_bundle(size, minified):
+	"""Generates javascript of about size bytes, mentioning debugger in strings and comments but never as a statement.
+
+	Unminified code mentions it at the very end, so the whole file is tokenized.
+	"""
+
+	module = ("function m%d(a,b){var s='debugger';return a.map(function(x){return x*b+/\\d+/.exec(s)})}" if minified else
+		"/* module %d, see the debugger docs */\nfunction m(a, b) {\n\tvar s = 'use the debugger';\n\treturn a.map(function (x) {\n\t\treturn x * b / 2;\n\t});\n}\n")
+	chunks = []
+	length = 0
+	index = 0
+	while length < size:
+		chunk = (module % index).encode("utf-8")
+		chunks.append(chunk)
+		length += len(chunk)
+		index += 1
+	return b"".join(chunks)
+
+def time_call(function, *args):
+	# the best of a few runs, big buffers make single runs noisy
+	seconds = []
+	for _ in range(3):
+		start = time.time()
+		result = function(*args)
+		seconds.append(time.time() - start)
+	return min(seconds), result
+
+if __name__ == "__main__":
+	parser = OptionParser(usage="python %s [options]" % __file__)
+	parser.set_description("Times the javascript debugger scan on bundles of growing size against the regex it replaced")
+	parser.add_option("-s", "--sizes", dest="sizes", default="1,2,4,8,16", help="Comma separated bundle sizes in MB")
+	(options, args) = parser.parse_args()
+
+	# the old regex stops at the first mention of debugger in a comment or string, which it wrongly flags
+	print("%-10s %8s %12s %12s %12s %10s" % ("bundle", "MB", "old regex s", "old flagged", "scanner s", "MB/sec"))
+	for minified in [False, True]:
+		for size_mb in [float(size) for size in options.sizes.split(",")]:
+			contents = generate_bundle(int(size_mb * 1024 * 1024), minified)
+			path = "bundle.js"
+			old_seconds, old_match = time_call(lambda: old_debugger_pattern.search(" %s " % contents.decode("utf-8", "replace")))
+			new_seconds, errors = time_call(javascript_file_validator.validate_javascript_file, ("M", path), contents)
+			if errors:
+				print("The scanner flagged a debugger that is only in strings and comments!")
+				sys.exit(1)
+			print("%-10s %8.1f %12.3f %12s %12.3f %10.1f" % ("minified" if minified else "plain", len(contents) / 1048576.0, old_seconds,
+				"yes" if old_match is not None else "no", new_seconds,
+				len(contents) / 1048576.0 / max(new_seconds, 0.000001)))
@@ -0,0 +1,264 @@
+#!/usr/bin/env python
+from __future__ import print_function
+import os
+import sys
+import json
+import time
+import shutil
+import datetime
+import platform
+import tempfile
+import subprocess
+from optparse import OptionParser
+
+benchmarks_directory = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, benchmarks_directory)
+import synthetic_repo
+
+commit_message = "Generated change issue BENCH-3 reviewer someone"
+
+# the metrics compared against a baseline, lower is better for all of them
+compared_metrics = ["p50_ms", "p95_ms", "peak_rss_mb"]
+
+def run_process(command, cwd, stdin_data=None, env=None):
+	"""Runs a process to completion and measures it.
+
+	Args:
+		command: the command to run
+		cwd: the directory to run it in
+		stdin_data: bytes written to the process' stdin, if any
+		env: the environment of the process
+	Returns:
+		the wall time in seconds, the peak RSS in MB and everything the process wrote to stdout
+	"""
+
+	start = time.time()
+	process = subprocess.Popen(command, cwd=cwd, env=env, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+	if stdin_data:
+		process.stdin.write(stdin_data)
+	process.stdin.close()
+	output = process.stdout.read()
+	process.stdout.close()
+	# wait4 instead of wait so the resource usage of this one child is available
+	pid, status, rusage = os.wait4(process.pid, 0)
+	elapsed = time.time() - start
+	process.returncode = os.WEXITSTATUS(status) if os.WIFEXITED(status) else -1
+	return elapsed, _max_rss_mb(rusage.ru_maxrss), output
+
+class ProcessLauncher(object):
+	"""Runs the measured processes from a separate python process that does nothing else.
+
+	The peak RSS of a child counts the memory its parent had when it forked, so a child of the benchmark, which holds
+	the generated repository, would report at least that. The launcher only holds the interpreter, less than any hook needs.
+	"""
+
+	def __init__(self):
+		self._process = subprocess.Popen([sys.executable, os.path.abspath(__file__), "--launcher"], stdin=subprocess.PIPE,
+			stdout=subprocess.PIPE, universal_newlines=True)
+
+	def run(self, command, cwd, stdin_data=None, env=None):
+		"""Runs a process from the launcher, see run_process."""
+
+		# bytes travel as latin-1 text, which maps every byte to one character
+		request = {"command": command, "cwd": cwd, "stdin": stdin_data.decode("latin-1") if stdin_data else None, "env": env}
+		self._process.stdin.write(json.dumps(request) + "\n")
+		self._process.stdin.flush()
+		response = json.loads(self._process.stdout.readline())
+		return response["elapsed"], response["rss_mb"], response["output"].encode("latin-1")
+
+	def close(self):
+		self._process.stdin.close()
+		self._process.wait()
+
+def run_launcher():
+	# serves ProcessLauncher.run, one JSON request per line
+	for line in iter(sys.stdin.readline, ""):
+		request = json.loads(line)
+		stdin_data = request["stdin"].encode("latin-1") if request["stdin"] is not None else None
+		elapsed, rss_mb, output = run_process(request["command"], request["cwd"], stdin_data, request["env"])
+		sys.stdout.write(json.dumps({"elapsed": elapsed, "rss_mb": rss_mb, "output": output.decode("latin-1")}) + "\n")
+		sys.stdout.flush()
+
+def summarize(latencies_ms, file_count, peak_rss_mb):
+	latencies_ms = sorted(latencies_ms)
+	p50_ms = percentile(latencies_ms, 0.5)
+	return {
+		"runs": len(latencies_ms),
+		"files": file_count,
+		"p50_ms": p50_ms,
+		"p95_ms": percentile(latencies_ms, 0.95),
+		"files_per_sec": file_count / (p50_ms / 1000.0) if p50_ms else 0,
+		"peak_rss_mb": peak_rss_mb,
+	}
+
+def percentile(sorted_values, fraction):
+	if not sorted_values:
+		return 0
+	return sorted_values[int(round(fraction * (len(sorted_values) - 1)))]
+
+def benchmark_hooks(repository, runs, env, launcher):
+	"""Times every hook end to end in the synthetic repository.
+
+	Returns:
+		a dict of hook name to its metrics
+	"""
+
+	hooks_path = os.path.join(repository, "git-hooks")
+	master_sha1 = _git_output(repository, "rev-parse", "master")
+	benchmark_sha1 = _git_output(repository, "rev-parse", "benchmark")
+	message_path = os.path.join(repository, ".git", "BENCHMARK_MSG")
+
+	def write_commit_message():
+		# commit-msg rewrites the message so it's reset before every run
+		with open(message_path, "w") as message_file:
+			message_file.write(commit_message)
+
+	hooks = [
+		("pre-commit", [sys.executable, os.path.join(hooks_path, "pre-commit")], repository, None, None,
+			len(_git_output(repository, "diff", "--cached", "--name-only").split())),
+		("pre-push", [sys.executable, os.path.join(hooks_path, "pre-push")], repository,
+			("refs/heads/benchmark %s refs/heads/benchmark %s\n" % (benchmark_sha1, master_sha1)).encode("ascii"), None,
+			len(_git_output(repository, "diff", "--name-only", master_sha1, benchmark_sha1).split())),
+		("commit-msg", [sys.executable, os.path.join(hooks_path, "commit-msg"), message_path], repository, None, write_commit_message, 1),
+		("ref_validator.py", [sys.executable, "ref_validator.py", "master"], hooks_path, None, None,
+			len(_git_output(repository, "ls-tree", "-r", "--name-only", "master").split())),
+	]
+
+	results = {}
+	for name, command, cwd, stdin_data, setup, file_count in hooks:
+		latencies_ms = []
+		peak_rss_mb = 0
+		for _ in range(runs):
+			if setup is not None:
+				setup()
+			elapsed, rss_mb, output = launcher.run(command, cwd, stdin_data, env)
+			latencies_ms.append(elapsed * 1000)
+			peak_rss_mb = max(peak_rss_mb, rss_mb)
+		results[name] = summarize(latencies_ms, file_count, peak_rss_mb)
+		_print_metrics(name, results[name])
+	return results
+
+def benchmark_validators(repository, runs, env, launcher):
+	"""Times each validator alone, in its own process so its peak RSS can be measured.
+
+	Returns:
+		a dict of extension to the validator's metrics
+	"""
+
+	results = {}
+	for extension in [".java", ".feature", ".json", ".xml", ".js"]:
+		latencies_ms = []
+		peak_rss_mb = 0
+		file_count = 0
+		for _ in range(runs):
+			command = [sys.executable, os.path.abspath(__file__), "--validator-worker", extension, repository]
+			elapsed, rss_mb, output = launcher.run(command, repository, env=env)
+			try:
+				worker_result = json.loads(output.decode("utf-8").strip().splitlines()[-1])
+			except (ValueError, IndexError):
+				print("The %s validator failed:\n%s" % (extension, output.decode("utf-8", "replace")))
+				break
+			latencies_ms.extend(worker_result["latencies_ms"])
+			file_count = worker_result["files"]
+			peak_rss_mb = max(peak_rss_mb, rss_mb)
+		if not file_count:
+			continue
+		results[extension] = summarize(latencies_ms, 1, peak_rss_mb)
+		results[extension]["files"] = file_count
+		_print_metrics(extension, results[extension])
+	return results
+
+def run_validator_worker(extension, repository):
+	"""Validates every file of one extension on master and prints the latency of each file as JSON."""
+
+	os.chdir(repository)
+	sys.path.insert(0, os.path.join(repository, "git-hooks"))
+	import utils
+
+	paths = [path for path in _git_output(repository, "ls-files").split("\n") if path.endswith(extension)]
+	latencies_ms = []
+	for path in paths:
+		with open(path, "rb") as fp:
+			contents = fp.read()
+		start = time.time()
+		utils.validate_file(("M", path), contents)
+		latencies_ms.append((time.time() - start) * 1000)
+	print(json.dumps({"files": len(paths), "latencies_ms": latencies_ms}))
+
+def compare_with_baseline(results, baseline):
+	print("\n%-24s %-12s %12s %12s %9s" % ("benchmark", "metric", "baseline", "current", "change"))
+	for group in ["hooks", "validators"]:
+		for name in sorted(results[group]):
+			if name not in baseline.get(group, {}):
+				continue
+			for metric in compared_metrics:
+				old_value = baseline[group][name][metric]
+				new_value = results[group][name][metric]
+				change = (new_value - old_value) / old_value * 100 if old_value else 0
+				print("%-24s %-12s %12.1f %12.1f %+8.1f%%" % (name, metric, old_value, new_value, change))
+
+def _print_metrics(name, metrics):
+	print("%-24s %6d files %10.1f p50 ms %10.1f p95 ms %10.1f files/sec %8.1f MB" %
+		(name, metrics["files"], metrics["p50_ms"], metrics["p95_ms"], metrics["files_per_sec"], metrics["peak_rss_mb"]))
+
+def _max_rss_mb(max_rss):
+	# ru_maxrss is in bytes on macOS and in kilobytes everywhere else
+	return max_rss / 1048576.0 if sys.platform == "darwin" else max_rss / 1024.0
+
+def _git_output(repository, *args):
+	return subprocess.check_output(["git"] + list(args), cwd=repository, universal_newlines=True).strip()
+
+if __name__ == "__main__":
+	if len(sys.argv) == 4 and sys.argv[1] == "--validator-worker":
+		run_validator_worker(sys.argv[2], sys.argv[3])
+		sys.exit(0)
+	if sys.argv[1:] == ["--launcher"]:
+		run_launcher()
+		sys.exit(0)
+
+	parser = OptionParser(usage="python %s [options]" % __file__)
+	parser.set_description("Times the hooks end to end and each validator alone in a synthetic repository, reporting files/sec, p50/p95 latency and peak RSS")
+	synthetic_repo.add_generator_options(parser)
+	parser.add_option("-r", "--runs", type="int", dest="runs", default=5, help="Number of runs per benchmark")
+	parser.add_option("--repository", dest="repository", help="Reuse a repository created by synthetic_repo.py instead of generating one")
+	parser.add_option("--keep", action="store_true", dest="keep", default=False, help="Keep the generated repository")
+	parser.add_option("-w", "--workers", dest="workers", help="GIT_HOOKS_WORKERS for the hooks")
+	parser.add_option("-o", "--output", dest="output", help="Save the results to this JSON file")
+	parser.add_option("-b", "--baseline", dest="baseline", help="Compare the results with a JSON file saved by an earlier run")
+	(options, args) = parser.parse_args()
+
+	if not hasattr(os, "wait4"):
+		print("The benchmarks need os.wait4 to measure peak RSS, which this platform doesn't have")
+		sys.exit(1)
+
+	# started before the repository is generated, while this process is still small
+	launcher = ProcessLauncher()
+	repository = options.repository
+	if repository is None:
+		repository = os.path.join(tempfile.mkdtemp(prefix="git-hooks-benchmark-"), "repository")
+		print("Generating a synthetic repository in %s" % repository)
+		synthetic_repo.create_repository(repository, options)
+
+	env = dict(os.environ)
+	if options.workers is not None:
+		env["GIT_HOOKS_WORKERS"] = options.workers
+
+	try:
+		results = {
+			"created": datetime.datetime.now().isoformat(),
+			"python": platform.python_version(),
+			"options": vars(options),
+			"hooks": benchmark_hooks(repository, options.runs, env, launcher),
+			"validators": benchmark_validators(repository, options.runs, env, launcher),
+		}
+	finally:
+		launcher.close()
+		if options.repository is None and not options.keep:
+			shutil.rmtree(os.path.dirname(repository))
+
+	if options.output:
+		with open(options.output, "w") as output_file:
+			json.dump(results, output_file, indent=4, sort_keys=True)
+	if options.baseline:
+		with open(options.baseline) as baseline_file:
+			compare_with_baseline(results, json.load(baseline_file))
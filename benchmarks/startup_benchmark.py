@@ -0,0 +1,52 @@
+#!/usr/bin/env python
+from __future__ import print_function
+import os
+import sys
+import time
+import subprocess
+from optparse import OptionParser
+
+hooks_directory = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, hooks_directory)
+import file_validators
+
+# the validators each hook ends up importing for a typical commit
+scenarios = [
+	("commit-msg", []),
+	("pre-commit, .json files only", [".json"]),
+	("pre-commit, .java files", [".java"]),
+	("pre-commit, .feature files", [".feature"]),
+	("pre-push, every file type", sorted(file_validators.validators_by_extension)),
+]
+
+import_script = "import sys; sys.path.insert(0, %r); import utils, file_validators; [file_validators.get_validator(e) for e in %r]"
+
+def time_imports(extensions, runs):
+	"""Times a fresh interpreter that imports utils and the validators of some extensions.
+
+	Args:
+		extensions: the extensions whose validators are imported
+		runs: how many interpreters to time
+	Returns:
+		the median wall time in milliseconds
+	"""
+
+	command = [sys.executable, "-c", import_script % (hooks_directory, extensions)]
+	timings = []
+	for _ in range(runs):
+		start = time.time()
+		subprocess.check_call(command)
+		timings.append((time.time() - start) * 1000)
+	return sorted(timings)[len(timings) // 2]
+
+if __name__ == "__main__":
+	parser = OptionParser(usage="python %s [--runs N]" % __file__)
+	parser.set_description("Compares the startup time of each hook with lazily imported validators against importing every validator up front")
+	parser.add_option("-r", "--runs", type="int", dest="runs", default=20, help="Number of interpreters to time per scenario")
+	(options, args) = parser.parse_args()
+
+	eager_ms = time_imports(sorted(file_validators.validators_by_extension), options.runs)
+	print("%-32s %10s %10s %10s" % ("hook", "eager ms", "lazy ms", "saved ms"))
+	for name, extensions in scenarios:
+		lazy_ms = time_imports(extensions, options.runs)
+		print("%-32s %10.1f %10.1f %10.1f" % (name, eager_ms, lazy_ms, eager_ms - lazy_ms))
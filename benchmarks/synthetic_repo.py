@@ -0,0 +1,227 @@
+#!/usr/bin/env python
+from __future__ import print_function
+import os
+import sys
+import json
+import random
+import shutil
+import subprocess
+from optparse import OptionParser
+
+hooks_directory = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+java_kinds = ["plain", "api", "osgi", "interface"]
+
+def generate_java_file(kind, index, methods):
+	"""Generates the source of a java file.
+
+	Args:
+		kind: one of 'plain', 'api', 'osgi' or 'interface'
+		index: a number that makes the names unique
+		methods: the number of methods in the file
+	Returns:
+		the source as bytes
+	"""
+
+	package = "com.example.api_1_0" if kind == "api" else "com.example.impl"
+	lines = ["/*", " * Copyright 2010 - 2019", " */", "package %s;" % package, "", "import java.util.List;", ""]
+	if kind == "interface":
+		lines.append("public interface Service%d {" % index)
+		lines.extend("\tvoid method%d(List<String> values);" % i for i in range(methods))
+	else:
+		if kind == "osgi":
+			lines.append("@OsgiServiceImpl")
+		lines.append("public class Service%d {" % index)
+		for i in range(methods):
+			lines.append("\t/** Adds up the values. */")
+			lines.append("\tpublic int method%d(List<String> values) {" % i)
+			lines.append("\t\tint total = 0;")
+			lines.append("\t\tfor (String value : values) { total += value.length() * %d; }" % i)
+			lines.append("\t\treturn total;")
+			lines.append("\t}")
+	lines.append("}")
+	return "\n".join(lines).encode("utf-8")
+
+def generate_feature_file(index, scenarios, example_rows):
+	"""Generates a feature file with numbered scenarios, each with an example table.
+
+	Args:
+		index: a number that makes the names unique
+		scenarios: the number of scenarios
+		example_rows: the number of rows in each example table
+	Returns:
+		the contents as bytes
+	"""
+
+	lines = ["@regression", "Feature: Generated feature %d" % index, ""]
+	for i in range(scenarios):
+		lines.append("\t@scenario%d" % i)
+		lines.append("\tScenario Outline: %d. Generated scenario %d" % (i + 1, i))
+		lines.append("\t\tGiven a value of <value>")
+		lines.append("\t\tWhen it is doubled")
+		lines.append("\t\tThen the result is <result>")
+		lines.append("")
+		lines.append("\t\tExamples:")
+		lines.append("\t\t\t| value | result |")
+		lines.extend("\t\t\t| %d | %d |" % (row, row * 2) for row in range(example_rows))
+		lines.append("")
+	return "\n".join(lines).encode("utf-8")
+
+def generate_javascript_file(index, functions):
+	"""Generates a javascript module mentioning debugger in comments and strings, so the validator tokenizes all of it.
+
+	Args:
+		index: a number that makes the names unique
+		functions: the number of functions in the module
+	Returns:
+		the contents as bytes
+	"""
+
+	lines = ["/* generated module %d */" % index, "'use strict';", ""]
+	for i in range(functions):
+		lines.append("// function %d, see the debugger docs before changing it" % i)
+		lines.append("function f%d(values, factor) {" % i)
+		lines.append("\tvar label = 'no debugger here %d';" % i)
+		lines.append("\treturn values.map(function (value) {")
+		lines.append("\t\treturn value * factor / %d + /\\d+/.exec(label).length;" % (i + 1))
+		lines.append("\t});")
+		lines.append("}")
+		lines.append("")
+	return "\n".join(lines).encode("utf-8")
+
+def generate_json_file(entries):
+	document = [{"id": i, "name": "entry %d" % i, "tags": ["a", "b", "c"], "values": list(range(10))} for i in range(entries)]
+	return json.dumps(document, indent=2).encode("utf-8")
+
+def generate_xml_file(elements):
+	lines = ['<?xml version="1.0" encoding="UTF-8"?>', "<entries>"]
+	for i in range(elements):
+		lines.append('\t<entry id="%d"><name>entry %d</name><values>%s</values></entry>' % (i, i, " ".join(str(v) for v in range(10))))
+	lines.append("</entries>")
+	return "\n".join(lines).encode("utf-8")
+
+def generate_files(options, rng):
+	"""Generates the contents of every file of a synthetic repository.
+
+	Returns:
+		a dict of path to contents
+	"""
+
+	kind_weights = [options.plain_ratio] + [(1 - options.plain_ratio) / 3] * 3
+	files = {}
+	for i in range(options.java_files):
+		kind = _weighted_choice(rng, java_kinds, kind_weights)
+		files["src/main/java/com/example/Service%d.java" % i] = generate_java_file(kind, i, options.methods)
+	for i in range(options.feature_files):
+		files["src/test/features/generated_%d.feature" % i] = generate_feature_file(i, options.scenarios, options.example_rows)
+	for i in range(options.js_files):
+		files["src/main/js/module_%d.js" % i] = generate_javascript_file(i, options.js_functions)
+	for i in range(options.json_files):
+		files["data/generated_%d.json" % i] = generate_json_file(options.json_entries)
+	for i in range(options.xml_files):
+		files["data/generated_%d.xml" % i] = generate_xml_file(options.xml_elements)
+	return files
+
+def create_repository(path, options):
+	"""Creates a synthetic git repository to benchmark the hooks in.
+
+	The master branch holds every generated file. The 'benchmark' branch changes a share of them,
+	and the same share is changed again and staged on top of it for pre-commit.
+	The hooks are copied into a git-hooks directory next to a generated git-hooks-config.json.
+
+	Args:
+		path: the directory of the repository, must not exist yet
+		options: the generator options, see add_generator_options
+	"""
+
+	rng = random.Random(options.seed)
+	files = generate_files(options, rng)
+	os.makedirs(path)
+	_git(path, "init", "-q")
+	_git(path, "config", "user.name", "Benchmark User")
+	_git(path, "config", "user.email", "benchmark@example.com")
+
+	shutil.copytree(hooks_directory, os.path.join(path, "git-hooks"), ignore=shutil.ignore_patterns(".git", "*.pyc", "__pycache__"))
+	with open(os.path.join(path, ".git", "info", "exclude"), "a") as exclude_file:
+		exclude_file.write("git-hooks\n")
+	with open(os.path.join(path, "git-hooks-config.json"), "w") as config_file:
+		json.dump(_generate_config(options), config_file, indent=4)
+
+	_write_files(path, files)
+	_git(path, "add", "-A")
+	_git(path, "commit", "-q", "-m", "Generated files Issue: BENCH-1")
+	_git(path, "branch", "-M", "master")
+
+	changed_paths = sorted(rng.sample(sorted(files), int(len(files) * options.changed_ratio)))
+	_git(path, "checkout", "-q", "-b", "benchmark")
+	_write_files(path, dict((changed_path, _change(changed_path, files[changed_path], 1)) for changed_path in changed_paths))
+	_git(path, "commit", "-q", "-a", "-m", "Changed files Issue: BENCH-2")
+	_write_files(path, dict((changed_path, _change(changed_path, files[changed_path], 2)) for changed_path in changed_paths))
+	_git(path, "add", "-A")
+
+def add_generator_options(parser):
+	parser.add_option("--java-files", type="int", dest="java_files", default=200, help="Number of java files")
+	parser.add_option("--methods", type="int", dest="methods", default=30, help="Number of methods per java file")
+	parser.add_option("--plain-ratio", type="float", dest="plain_ratio", default=0.8, help="Share of plain java files, the rest are split between API, OSGi and interface files")
+	parser.add_option("--feature-files", type="int", dest="feature_files", default=50, help="Number of feature files")
+	parser.add_option("--scenarios", type="int", dest="scenarios", default=20, help="Number of scenarios per feature file")
+	parser.add_option("--example-rows", type="int", dest="example_rows", default=20, help="Number of example rows per scenario")
+	parser.add_option("--js-files", type="int", dest="js_files", default=20, help="Number of javascript files")
+	parser.add_option("--js-functions", type="int", dest="js_functions", default=200, help="Number of functions per javascript file")
+	parser.add_option("--json-files", type="int", dest="json_files", default=10, help="Number of json files")
+	parser.add_option("--json-entries", type="int", dest="json_entries", default=20000, help="Number of entries per json file")
+	parser.add_option("--xml-files", type="int", dest="xml_files", default=10, help="Number of XML files")
+	parser.add_option("--xml-elements", type="int", dest="xml_elements", default=20000, help="Number of elements per XML file")
+	parser.add_option("--changed-ratio", type="float", dest="changed_ratio", default=0.5, help="Share of files changed on the benchmark branch")
+	parser.add_option("--cache", action="store_true", dest="cache", default=False, help="Leave the validation cache enabled in the generated config")
+	parser.add_option("--seed", type="int", dest="seed", default=0, help="Random seed of the generated files")
+
+def _generate_config(options):
+	return {
+		"file_validation": {
+			".java": {"validate": True, "skip_test_directories": True},
+			".js": {"validate": True},
+			".feature": {"validate": True, "unallowed_annotations": ["@wip"]},
+			".json": {"validate": True},
+			".xml": {"validate": True},
+		},
+		"test_directories": ["src/test/java/"],
+		"validation_cache": {"enabled": options.cache},
+	}
+
+def _change(path, contents, generation):
+	# the appended text keeps every file type valid
+	if path.endswith(".java"):
+		return contents + ("\n// changed %d\n" % generation).encode("utf-8")
+	elif path.endswith(".feature"):
+		return contents + ("\n# changed %d\n" % generation).encode("utf-8")
+	return contents + b"\n" * generation
+
+def _write_files(path, files):
+	for relative_path, contents in files.items():
+		file_path = os.path.join(path, relative_path)
+		if not os.path.isdir(os.path.dirname(file_path)):
+			os.makedirs(os.path.dirname(file_path))
+		with open(file_path, "wb") as fp:
+			fp.write(contents)
+
+def _weighted_choice(rng, choices, weights):
+	point = rng.random() * sum(weights)
+	for choice, weight in zip(choices, weights):
+		point -= weight
+		if point < 0:
+			return choice
+	return choices[-1]
+
+def _git(path, *args):
+	subprocess.check_call(["git"] + list(args), cwd=path)
+
+if __name__ == "__main__":
+	parser = OptionParser(usage="python %s [options] <repository path>" % __file__)
+	parser.set_description("Generates a synthetic git repository to benchmark the hooks in")
+	add_generator_options(parser)
+	(options, args) = parser.parse_args()
+	if len(args) != 1:
+		parser.print_help()
+		sys.exit(1)
+	create_repository(args[0], options)
@@ -0,0 +1,62 @@
+#!/usr/bin/env python
+from __future__ import print_function
+import os
+import re
+import sys
+import time
+from optparse import OptionParser
+
+hooks_directory = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, hooks_directory)
+import text_rules
+from synthetic_repo import generate_java_file
+
+def generate_rules(count, regex_ratio):
+	"""Generates banned pattern rules that never match the generated java files, so the whole file is always scanned."""
+
+	rules = []
+	regex_count = int(round(count * regex_ratio))
+	for i in range(count):
+		if i < regex_count:
+			rules.append(text_rules.TextRule("regex-%d" % i, None, r"\bBanned%dCall\s*\(" % i, "Banned call"))
+		else:
+			rules.append(text_rules.TextRule("literal-%d" % i, "com.example.banned%d." % i, None, "Banned package"))
+	return rules
+
+def scan_per_rule(rules, text):
+	# one pass over the text per rule, how rules used to be added
+	matches = []
+	for rule in rules:
+		pattern = re.compile(re.escape(rule.literal) if rule.literal is not None else rule.regex, re.MULTILINE)
+		matches.extend((rule.rule_id, match.start()) for match in pattern.finditer(text))
+	return matches
+
+def time_call(function, *args):
+	# the best of a few runs
+	seconds = []
+	for _ in range(3):
+		start = time.time()
+		result = function(*args)
+		seconds.append(time.time() - start)
+	return min(seconds), result
+
+if __name__ == "__main__":
+	parser = OptionParser(usage="python %s [options]" % __file__)
+	parser.set_description("Times the combined text rule scan against one pass per rule as rules are added")
+	parser.add_option("-c", "--counts", dest="counts", default="1,5,10,25,50,100", help="Comma separated rule counts")
+	parser.add_option("-r", "--regex-ratio", type="float", dest="regex_ratio", default=0.2, help="Share of regex rules, the rest are literals")
+	parser.add_option("-n", "--files", type="int", dest="files", default=200, help="Number of generated java files scanned as one text")
+	(options, args) = parser.parse_args()
+
+	text = "\n".join(generate_java_file("plain", i, 30).decode("utf-8") for i in range(options.files))
+	print("%.1f MB of java, %d%% regex rules" % (len(text) / 1048576.0, options.regex_ratio * 100))
+	print("%8s %14s %14s %10s" % ("rules", "per rule s", "combined s", "speedup"))
+	for count in [int(count) for count in options.counts.split(",")]:
+		rules = generate_rules(count, options.regex_ratio)
+		matcher = text_rules.TextRuleMatcher(rules)
+		per_rule_seconds, per_rule_matches = time_call(scan_per_rule, rules, text)
+		combined_seconds, combined_matches = time_call(matcher.find_matches, text)
+		if sorted(per_rule_matches) != sorted(combined_matches):
+			print("The combined scan found different matches than one pass per rule!")
+			sys.exit(1)
+		print("%8d %14.3f %14.3f %9.1fx" % (count, per_rule_seconds, combined_seconds, per_rule_seconds / max(combined_seconds, 0.000001)))
@@ -0,0 +1,35 @@
+#!/usr/bin/env python
+from __future__ import print_function
+import re
+import git_objects
+import profiling
+
+commit_message_pattern = re.compile("^(.+?)Issue(?:[-:\s]*)(.+?)(?:Reviewer(?:[-:\s]*)(.+?))?$", re.IGNORECASE | re.DOTALL)
+reverse_commit_message_pattern = re.compile("^Revert \".*\"$")
+merge_commit_message_pattern = re.compile("^Merge (commit|branch|remote-tracking branch|pull request) .*")
+
+commit_message_format_error = "[ERROR] All commit messages must be in one of the following formats...\n\t<message> Issue: <issue> [Reviewer: <reviewer>]"
+
+def is_valid_commit_message(message):
+	return (commit_message_pattern.match(message) is not None or reverse_commit_message_pattern.match(message) is not None
+		or merge_commit_message_pattern.match(message) is not None)
+
+def get_invalid_commits(revision_args):
+	"""Validates the message of every commit in a range, reading them all from one git log.
+
+	Args:
+		revision_args: the commits as git log arguments, e.g. ["<remote sha1>..<local sha1>"]
+	Returns:
+		a list of (commit SHA, subject) of the commits whose message is invalid
+	"""
+
+	with profiling.span("git log", "git", args=revision_args):
+		return [(sha1, message.strip().split("\n", 1)[0]) for sha1, message in git_objects.iter_commit_messages(revision_args)
+			if not is_valid_commit_message(message)]
+
+def get_commit_message_errors(invalid_commits):
+	if not invalid_commits:
+		return []
+	errors = [commit_message_format_error, "The following commits don't follow it:"]
+	errors.extend("\t%s %s" % (sha1[:10], subject) for sha1, subject in invalid_commits)
+	return errors
@@ -0,0 +1,225 @@
+#!/usr/bin/env python
+from __future__ import print_function
+import os
+import re
+import sys
+import json
+import hashlib
+import utils
+import text_rules
+import file_validators
+
+config_path = "./git-hooks-config.json"
+schema_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "git-hooks-config.schema.json")
+snapshot_file_name = "config-snapshot.json"
+
+# 0 workers means one worker per cpu
+default_workers = 0
+default_min_parallel_batch_size = 50
+default_cache_max_entries = 100000
+default_fail_fast_threshold = 1
+# pushes to a server wait this long for a worker slot before they're rejected
+default_server_queue_timeout_seconds = 300
+# the runs of each hook kept in the performance history
+default_history_max_runs = 1000
+
+# the config is loaded at most once per process
+_user_config = None
+_compiled_config = None
+_loaded_stat_signature = None
+
+class CompiledConfig(object):
+	"""An immutable view of the user config that is cheap to query per file.
+
+	Args:
+		user_config: the schema validated contents of 'git-hooks-config.json'
+	"""
+
+	__slots__ = ("enabled_extensions", "workers", "min_parallel_batch_size", "cache_enabled", "cache_max_entries",
+		"fail_fast_threshold", "changed_lines_only_extensions", "server_max_workers", "server_queue_timeout_seconds", "has_validation_budgets", "_validation_budgets", "_default_validation_budget", "history_enabled", "history_max_runs", "_text_rule_matchers", "_validator_arguments", "_test_directory_matcher", "_frozen")
+
+	def __init__(self, user_config):
+		file_validation = user_config["file_validation"]
+		self.enabled_extensions = frozenset(extension for extension in file_validation if file_validation[extension]["validate"])
+		# validators that can check only the changed lines do so when the config asks them to
+		self.changed_lines_only_extensions = frozenset(extension for extension, entry in file_validators.validators_by_extension.items()
+			if entry.checks_changed_lines and file_validation.get(extension, {}).get("changed_lines_only", False))
+		self._validator_arguments = {}
+		for extension, entry in file_validators.validators_by_extension.items():
+			if extension in file_validation:
+				# lists become frozen sets, validators only check membership in them
+				self._validator_arguments[extension] = dict((argument, _freeze(file_validation[extension][key]))
+					for argument, key in entry.config_arguments.items() if key in file_validation[extension])
+		# the default rules of an extension apply even if none are configured
+		self._text_rule_matchers = {}
+		for extension in self.enabled_extensions:
+			rules = text_rules.get_rules(extension, file_validation[extension].get("text_rules", []))
+			if rules:
+				try:
+					self._text_rule_matchers[extension] = text_rules.TextRuleMatcher(rules)
+				except ValueError as e:
+					utils.print_error("Invalid text rule for '%s' files in 'git-hooks-config.json': %s" % (extension, e))
+					sys.exit(1)
+		parallel_validation = user_config.get("parallel_validation", {})
+		self.workers = parallel_validation.get("workers", default_workers)
+		self.min_parallel_batch_size = parallel_validation.get("min_batch_size", default_min_parallel_batch_size)
+		server_validation = user_config.get("server_validation", {})
+		# the workers all concurrent pushes share, None means one per cpu
+		self.server_max_workers = server_validation.get("max_workers")
+		self.server_queue_timeout_seconds = server_validation.get("queue_timeout_seconds", default_server_queue_timeout_seconds)
+		validation_cache = user_config.get("validation_cache", {})
+		self.cache_enabled = validation_cache.get("enabled", True)
+		self.cache_max_entries = validation_cache.get("max_entries", default_cache_max_entries)
+		validation_budget = user_config.get("validation_budget", {})
+		# 0 or a missing value means no limit
+		self._default_validation_budget = (validation_budget.get("seconds") or None, validation_budget.get("memory_mb") or None)
+		self._validation_budgets = dict((extension, (budget.get("seconds", self._default_validation_budget[0]) or None,
+			budget.get("memory_mb", self._default_validation_budget[1]) or None))
+			for extension, budget in validation_budget.get("extensions", {}).items())
+		self.has_validation_budgets = any(self._default_validation_budget) or any(any(budget) for budget in self._validation_budgets.values())
+		hook_history = user_config.get("hook_history", {})
+		self.history_enabled = hook_history.get("enabled", True)
+		self.history_max_runs = hook_history.get("max_runs", default_history_max_runs)
+		fail_fast = user_config.get("fail_fast", {})
+		# None means every file is validated however many have errors
+		self.fail_fast_threshold = fail_fast.get("error_threshold", default_fail_fast_threshold) if fail_fast.get("enabled", False) else None
+		test_directories = user_config["test_directories"]
+		if test_directories:
+			# one combined regex instead of a startswith per test directory
+			self._test_directory_matcher = re.compile("|".join(re.escape(d) for d in test_directories))
+		else:
+			self._test_directory_matcher = None
+		self._frozen = True
+
+	def __setattr__(self, name, value):
+		if getattr(self, "_frozen", False):
+			raise AttributeError("CompiledConfig is immutable")
+		object.__setattr__(self, name, value)
+
+	def validation_enabled(self, file_extension):
+		return file_extension in self.enabled_extensions
+
+	def checks_changed_lines_only(self, extension):
+		return extension in self.changed_lines_only_extensions
+
+	def get_validator_arguments(self, extension):
+		"""Returns the keyword arguments the validator of an extension reads from the config."""
+
+		return self._validator_arguments.get(extension, {})
+
+	def get_text_rule_matcher(self, extension):
+		"""Returns the TextRuleMatcher of an extension, or None if no text rule applies to it."""
+
+		return self._text_rule_matchers.get(extension)
+
+	def get_validation_budget(self, extension):
+		"""Returns the (seconds, memory MB) budget of the validator of an extension, None meaning no limit."""
+
+		return self._validation_budgets.get(extension, self._default_validation_budget)
+
+	def is_in_test_directory(self, path):
+		return self._test_directory_matcher is not None and self._test_directory_matcher.match(path) is not None
+
+def get_config():
+	"""Loads and validates 'git-hooks-config.json' the first time it is called.
+
+	Returns:
+		the user config as a dict
+	"""
+
+	global _user_config
+	if _user_config is None:
+		_user_config = _load_config()
+	return _user_config
+
+def get_compiled_config():
+	global _compiled_config
+	if _compiled_config is None:
+		_compiled_config = CompiledConfig(get_config())
+	return _compiled_config
+
+def reload_if_changed():
+	"""Forgets the loaded config if the config or schema changed since it was loaded.
+
+	Long running processes like the validation daemon call this before using the config.
+	"""
+
+	global _user_config, _compiled_config
+	if _user_config is not None and _loaded_stat_signature != _get_stat_signature():
+		_user_config = None
+		_compiled_config = None
+
+def get_config_hash():
+	"""Returns a hash of the user config that changes whenever the config does."""
+
+	return hashlib.sha1(json.dumps(get_config(), sort_keys=True).encode("utf-8")).hexdigest()
+
+def _load_config():
+	if not os.path.isfile(config_path):
+		utils.print_error("You must have a file named 'git-hooks-config.json' one level outside of your git-hooks submodule directory.")
+		sys.exit(1)
+
+	global _loaded_stat_signature
+	snapshot_path = os.path.join(utils.get_hooks_data_dir(), snapshot_file_name)
+	snapshot = _read_snapshot(snapshot_path)
+	stat_signature = _loaded_stat_signature = _get_stat_signature()
+
+	# neither file has been touched since the snapshot was taken
+	if snapshot and snapshot.get("stat_signature") == stat_signature:
+		return snapshot["config"]
+
+	with open(config_path, "rb") as config_file:
+		config_bytes = config_file.read()
+	with open(schema_path, "rb") as schema_file:
+		schema_bytes = schema_file.read()
+	content_hash = hashlib.sha1(config_bytes + b"\0" + schema_bytes).hexdigest()
+
+	# the files were touched but their contents are the same so the old validation still holds
+	if snapshot and snapshot.get("content_hash") == content_hash:
+		user_config = snapshot["config"]
+	else:
+		user_config = _validate_config(config_bytes, schema_bytes)
+
+	_write_snapshot(snapshot_path, {"stat_signature": stat_signature, "content_hash": content_hash, "config": user_config})
+	return user_config
+
+def _validate_config(config_bytes, schema_bytes):
+	# jsonschema is only needed when the config has changed since the last snapshot
+	import jsonschema
+
+	config_schema = json.loads(schema_bytes.decode("utf-8"))
+	try:
+		user_config = json.loads(config_bytes.decode("utf-8"))
+		if not user_config:
+			utils.print_error("'git-hooks-config.json' is empty!")
+			sys.exit(1)
+		jsonschema.validate(user_config, config_schema)
+	except (ValueError, jsonschema.exceptions.ValidationError) as ve:
+		utils.print_error(getattr(ve, "message", str(ve)))
+		utils.print_error("Ensure that your 'git-hooks-config.json' file adheres to the schema provided in the git-hooks submodule.")
+		sys.exit(1)
+	return user_config
+
+def _freeze(value):
+	return frozenset(value) if isinstance(value, list) else value
+
+def _get_stat_signature():
+	signature = []
+	for path in [config_path, schema_path]:
+		stat = os.stat(path)
+		signature.append([stat.st_mtime, stat.st_size])
+	return signature
+
+def _read_snapshot(snapshot_path):
+	try:
+		with open(snapshot_path, "r") as snapshot_file:
+			return json.load(snapshot_file)
+	except (IOError, OSError, ValueError):
+		return None
+
+def _write_snapshot(snapshot_path, snapshot):
+	try:
+		utils.write_file_atomically(snapshot_path, json.dumps(snapshot))
+	except (IOError, OSError):
+		# the snapshot is only an optimization
+		pass
@@ -3,8 +3,11 @@ from __future__ import print_function
 from utils import versioned_hooks, print_success, print_error
 import sys
 import os
+import subprocess
 
-hooks_arg = sys.argv[1:]
+# --daemon also stops the validation daemon
+stop_daemon = "--daemon" in sys.argv[1:]
+hooks_arg = [arg for arg in sys.argv[1:] if arg != "--daemon"]
 for hook in hooks_arg:
 	if hook not in versioned_hooks:
 		print_error("'" + str(hook) + "' is not implemented and cannot be disabled. Terminating...")
@@ -12,10 +15,15 @@ for hook in hooks_arg:
 
 hooks_to_disable = hooks_arg if hooks_arg else versioned_hooks
 
-# delete existing symlinks and local unversioned hooks
-os.chdir("../.git/hooks")
+# delete existing symlinks and local unversioned hooks, a bare repository keeps them in the repository itself
+is_bare_repository = not os.path.exists("../.git") and os.path.isfile("../HEAD") and os.path.isdir("../hooks")
+os.chdir("../hooks" if is_bare_repository else "../.git/hooks")
 for f in os.listdir("."):
 	if f in hooks_to_disable:
 		os.remove(f)
 
 print_success("Successfully disabled the following git hooks: " + ", ".join(hooks_to_disable))
+
+# nothing uses the daemon once every hook is disabled
+if not is_bare_repository and (stop_daemon or not hooks_arg):
+	subprocess.call([sys.executable, "validation_daemon.py", "stop"], cwd="../../git-hooks")
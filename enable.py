@@ -27,27 +27,44 @@ except ImportError:
 	print("Git hooks require the gherkin module but it was not found!\nPlease run '%s" % version_of_pip_to_use + " install gherkin-official'")
 	sys.exit(1)
 
-from utils import versioned_hooks, print_error, print_success
+from utils import versioned_hooks, server_hooks, print_error, print_success
 import os
 import subprocess
 
+# a bare repository receiving pushes on a server keeps its hooks in the repository itself, next to the git-hooks directory
+is_bare_repository = not os.path.exists("../.git") and os.path.isfile("../HEAD") and os.path.isdir("../hooks")
+hooks_path = "../git-hooks/" if is_bare_repository else "../../git-hooks/"
+
 # delete existing git hooks from the .git folder
-os.chdir("../.git/hooks")
+os.chdir("../hooks" if is_bare_repository else "../.git/hooks")
 for f in os.listdir("."):
 	if f in versioned_hooks:
 		os.remove(f)
 
-hooks_arg = sys.argv[1:]
+# --daemon also starts the validation daemon
+start_daemon = "--daemon" in sys.argv[1:]
+hooks_arg = [arg for arg in sys.argv[1:] if arg != "--daemon"]
 for hook in hooks_arg:
 	if hook not in versioned_hooks:
 		print_error(str(hook) + " is not implemented and cannot be enabled. Terminating...")
 		sys.exit(1)
 
-hooks_to_enable = hooks_arg if hooks_arg else versioned_hooks
+# a checkout runs the client side hooks and a bare repository pre-receive, unless told otherwise,
+# update would validate every push a second time, one ref at a time, so it's only enabled when asked for instead of pre-receive
+if hooks_arg:
+	hooks_to_enable = hooks_arg
+elif is_bare_repository:
+	hooks_to_enable = ["pre-receive"]
+else:
+	hooks_to_enable = [hook for hook in versioned_hooks if hook not in server_hooks]
 
 # make the versioned hooks executable and create symlinks to the hooks in the .git folder
 for hook in hooks_to_enable:
-	os.chmod("../../git-hooks/" + hook, os.stat("../../git-hooks/" + hook).st_mode | 0o111)
-	subprocess.call(["ln", "-s", "-f", "../../git-hooks/" + hook, hook])
+	os.chmod(hooks_path + hook, os.stat(hooks_path + hook).st_mode | 0o111)
+	subprocess.call(["ln", "-s", "-f", hooks_path + hook, hook])
 
 print_success("Successfully enabled the following git hooks: " + ", ".join(hooks_to_enable))
+
+# pushes received by a server are validated without the daemon
+if start_daemon and not is_bare_repository:
+	sys.exit(subprocess.call([sys.executable, "validation_daemon.py", "start"], cwd="../../git-hooks"))
@@ -1 +1,86 @@
+import os
+import hashlib
+import importlib
+from collections import namedtuple
+
 __all__ = ["javascript_file_validator", "java_file_validator", "json_file_validator", "xml_file_validator", "feature_file_validator"]
+
+# module_name: the validator module, relative to this package unless it contains a '.'
+# function_name: the function that takes the (status, path) of a file and its contents as bytes and returns a list of errors
+# skips_test_directories: whether files in the configured test directories are skipped
+# config_arguments: keyword arguments of the function mapped to the keys of the extension's config they are read from,
+#	the function's default is used when the key isn't in the config
+# checks_changed_lines: whether the function takes the changed_lines keyword argument to only check the lines a diff changed
+# depends_on_path: whether the errors depend on the path of the file and not only its contents, so the path is part of its cache key
+ValidatorEntry = namedtuple("ValidatorEntry", ["module_name", "function_name", "skips_test_directories", "config_arguments", "checks_changed_lines",
+	"depends_on_path"])
+
+# the default text rules run after every validator, so they're part of every validator's version
+text_rules_source_path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "text_rules.py")
+
+# validator modules are only imported the first time a file with their extension is validated
+validators_by_extension = {
+	".java": ValidatorEntry("java_file_validator", "validate_java_file", True, {}, True, False),
+	# minified and vendored files are recognized by their path
+	".js": ValidatorEntry("javascript_file_validator", "validate_javascript_file", False, {"minified_files": "minified_files"}, False, True),
+	".json": ValidatorEntry("json_file_validator", "validate_json_file", False, {}, False, False),
+	".xml": ValidatorEntry("xml_file_validator", "validate_xml_file", False, {}, False, False),
+	".feature": ValidatorEntry("feature_file_validator", "validate_feature_file", False, {"unallowed_tags": "unallowed_annotations"}, False, False),
+}
+
+_loaded_validators = {}
+_validator_versions = {}
+
+def register_validator(extension, module_name, function_name, skips_test_directories=False, config_arguments=None, checks_changed_lines=False,
+		depends_on_path=False):
+	"""Registers the validator of an extension, replacing any existing one.
+
+	The extension also needs a "validate" entry under "file_validation" in the config.
+	"""
+
+	validators_by_extension[extension] = ValidatorEntry(module_name, function_name, skips_test_directories, config_arguments or {}, checks_changed_lines,
+		depends_on_path)
+	_loaded_validators.pop(extension, None)
+	_validator_versions.pop(extension, None)
+
+def get_validator(extension):
+	"""Returns the validator function of an extension, importing its module the first time.
+
+	Args:
+		extension: the file extension, including the period
+	Returns:
+		the validator function
+	"""
+
+	if extension not in _loaded_validators:
+		entry = validators_by_extension[extension]
+		_loaded_validators[extension] = getattr(_import_module(entry.module_name), entry.function_name)
+	return _loaded_validators[extension]
+
+def get_validator_id(extension):
+	entry = validators_by_extension[extension]
+	return entry.module_name + "." + entry.function_name
+
+def get_validator_version(extension):
+	"""Returns a hash of the source of a validator module and the text rules without importing them, so edits to a validator can be detected."""
+
+	if extension not in _validator_versions:
+		source_hash = hashlib.sha1()
+		for source_path in [_get_source_path(validators_by_extension[extension].module_name), text_rules_source_path]:
+			with open(source_path, "rb") as source_file:
+				source_hash.update(source_file.read())
+		_validator_versions[extension] = source_hash.hexdigest()
+	return _validator_versions[extension]
+
+def _import_module(module_name):
+	if "." in module_name:
+		return importlib.import_module(module_name)
+	return importlib.import_module(__name__ + "." + module_name)
+
+def _get_source_path(module_name):
+	if "." not in module_name:
+		return os.path.join(os.path.dirname(os.path.abspath(__file__)), module_name + ".py")
+	source_path = _import_module(module_name).__file__
+	if source_path.endswith((".pyc", ".pyo")):
+		source_path = source_path[:-1]
+	return source_path
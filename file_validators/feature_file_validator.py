@@ -1,51 +1,84 @@
 #!/usr/bin/env python
+import collections
 from gherkin.token_scanner import TokenScanner
+from gherkin.token_matcher import TokenMatcher
 from gherkin.parser import Parser
+from gherkin.dialect import Dialect
+import profiling
 
-def validate_feature_file(feature_file, unallowed_tags):
+FeatureSummary = collections.namedtuple("FeatureSummary", ["tag_names", "scenarios"])
+ScenarioSummary = collections.namedtuple("ScenarioSummary", ["name", "tag_names"])
+
+# the scan only knows the keywords of the default dialect, files in other languages are parsed
+dialect = Dialect.for_name("en")
+feature_keywords = tuple(keyword + ":" for keyword in dialect.feature_keywords)
+background_keywords = tuple(keyword + ":" for keyword in dialect.background_keywords)
+scenario_keywords = tuple(keyword + ":" for keyword in dialect.scenario_keywords)
+scenario_outline_keywords = tuple(keyword + ":" for keyword in dialect.scenario_outline_keywords)
+examples_keywords = tuple(keyword + ":" for keyword in dialect.examples_keywords)
+step_keywords = tuple(set(dialect.given_keywords + dialect.when_keywords + dialect.then_keywords + dialect.and_keywords + dialect.but_keywords))
+docstring_separators = ('"""', "```")
+
+# the section of the file a line is in
+before_feature, feature_section, background_section, scenario_section, scenario_outline_section, examples_section = range(6)
+# where a line is in the description that may follow a feature, background, scenario or examples line
+description_expected, in_description, after_description = range(3)
+
+def validate_feature_file(feature_file, unallowed_tags, contents=None, fast_scan=True):
 	"""Validates a feature file.
 
+	Only the tags and scenario names are checked, so they're scanned line by line and the file is only parsed
+	with gherkin when the scan can't tell how gherkin would read it.
+
 	Args:
-		feature_file_path: the path to the feature file.
+		feature_file: the (status, path) of the feature file.
+		unallowed_tags: the tags that may not be committed.
+		contents: the contents of the file as bytes, read from the path if not given.
+		fast_scan: whether the gherkin parse may be skipped, only turned off to benchmark the scan.
 	Returns:
 		a list of errors.
 	"""
 
 	file_status, feature_file_path = feature_file
 
-	with open(feature_file_path, "r") as fp:
-		contents = fp.read()
+	if contents is None:
+		with open(feature_file_path, "rb") as fp:
+			contents = fp.read()
+	contents = contents.decode("utf-8", "replace")
 
-	parser = Parser()
-	try:
-		feature_file = parser.parse(TokenScanner(contents))
-	except Exception as e:
-		return ["[ERROR] Errors exist in " + feature_file_path, "\t- Could not parse the file! " + str(e)]
+	with profiling.parse_span():
+		feature = scan_feature_file(contents) if fast_scan else None
+		if feature is None:
+			parser = Parser()
+			try:
+				gherkin_document = parser.parse(TokenScanner(contents))
+			except Exception as e:
+				return ["[ERROR] Errors exist in " + feature_file_path, "\t- Could not parse the file! " + str(e)]
+			feature = get_feature_summary(gherkin_document)
 
 	errors = []
-	feature_tag_names = [tag["name"] for tag in feature_file["feature"]["tags"]]
-	scenarios = [feature_child for feature_child in feature_file["feature"]["children"] if feature_child['type'] == 'Scenario' or feature_child['type'] == 'ScenarioOutline']
+	scenarios = feature.scenarios
 
 	# validate tags in the feature
-	for unallowed_tag in set(unallowed_tags).intersection(feature_tag_names):
+	for unallowed_tag in set(unallowed_tags).intersection(feature.tag_names):
 		errors.append("\t- Remove the %s tag from the feature before you commit" % unallowed_tag)
 
 	# validate tags in all the scenarios
 	for scenario in scenarios:
-		for tag in scenario["tags"]:
-			if tag["name"] in unallowed_tags:
-				errors.append("\t- Before you commit, remove the %s tag from the following scenario:\n\t\t'%s'" % (tag["name"], scenario["name"]))
+		for tag_name in scenario.tag_names:
+			if tag_name in unallowed_tags:
+				errors.append("\t- Before you commit, remove the %s tag from the following scenario:\n\t\t'%s'" % (tag_name, scenario.name))
 
 	# validate scenario numbers
 	prev_scenario_num = "0"
 	for curr_scenario in scenarios:
 		# validate prescence
-		if "." not in curr_scenario["name"]:
-			errors.append("\t- The following scenario needs to start with a number followed by a period: '%s'" % curr_scenario["name"])
+		if "." not in curr_scenario.name:
+			errors.append("\t- The following scenario needs to start with a number followed by a period: '%s'" % curr_scenario.name)
 			break
-		curr_scenario_num = curr_scenario["name"].split(".")[0].strip()
+		curr_scenario_num = curr_scenario.name.split(".")[0].strip()
 		if not curr_scenario_num or curr_scenario_num.isalpha():
-			errors.append("\t- The following scenario needs to start with a number: '%s'" % curr_scenario["name"])
+			errors.append("\t- The following scenario needs to start with a number: '%s'" % curr_scenario.name)
 			break
 		# validate ordering
 		if prev_scenario_num.isdigit():
@@ -87,3 +120,124 @@ def validate_feature_file(feature_file, unallowed_tags):
 		errors.insert(0, "[ERROR] Errors exist in " + feature_file_path)
 
 	return errors
+
+def get_feature_summary(gherkin_document):
+	"""Takes the tags and scenarios the rules check out of a gherkin AST."""
+
+	feature = gherkin_document["feature"]
+	scenarios = [ScenarioSummary(child["name"], [tag["name"] for tag in child["tags"]])
+		for child in feature["children"] if child["type"] == "Scenario" or child["type"] == "ScenarioOutline"]
+	return FeatureSummary([tag["name"] for tag in feature["tags"]], scenarios)
+
+def scan_feature_file(contents):
+	"""Finds the tags and scenario names of a feature file line by line, without building its AST.
+
+	The scan follows the gherkin grammar closely enough to know each line is read the same way by the parser.
+	Whenever it isn't sure, e.g. for another language, escaped table cells, keywords inside descriptions or
+	anything the parser would reject, it gives up so the file is parsed instead.
+
+	Args:
+		contents: the contents of the feature file as text
+	Returns:
+		a FeatureSummary, or None if the file has to be parsed
+	"""
+
+	feature_tag_names = None
+	scenarios = []
+	tag_names = []
+	section = before_feature
+	description = None
+	# a step may be followed by a table or a doc string, and examples by a table
+	table_allowed = False
+	docstring_allowed = False
+	table_cell_count = None
+	open_docstring = None
+
+	# split like gherkin's scanner, on line feeds only
+	for line in contents.split("\n"):
+		text = line.lstrip()
+		if open_docstring is not None:
+			if text.startswith(open_docstring):
+				open_docstring = None
+			continue
+		if not text:
+			continue
+		if text.startswith("#"):
+			if TokenMatcher.LANGUAGE_RE.match(line):
+				return None
+			if description is not None:
+				description = after_description
+			continue
+
+		if text.startswith("@"):
+			tag_names.extend("@" + item.strip() for item in text.strip().split("@")[1:])
+			description = None
+			table_allowed = docstring_allowed = False
+			continue
+
+		if section == before_feature:
+			if not text.startswith(feature_keywords):
+				return None
+			feature_tag_names = tag_names
+			section = feature_section
+		elif text.startswith(scenario_keywords) or text.startswith(scenario_outline_keywords):
+			scenarios.append(ScenarioSummary(_get_title(text), tag_names))
+			section = scenario_section if text.startswith(scenario_keywords) else scenario_outline_section
+		elif tag_names:
+			# tags are only allowed before a feature, a scenario or examples
+			if text.startswith(examples_keywords) and section in (scenario_outline_section, examples_section):
+				section = examples_section
+				table_allowed = True
+				table_cell_count = None
+			else:
+				return None
+		elif text.startswith(background_keywords):
+			if section != feature_section:
+				return None
+			section = background_section
+		elif text.startswith(examples_keywords):
+			if section not in (scenario_outline_section, examples_section):
+				return None
+			section = examples_section
+			table_allowed = True
+			table_cell_count = None
+		elif text.startswith(step_keywords) and section in (background_section, scenario_section, scenario_outline_section):
+			description = None
+			table_allowed = docstring_allowed = True
+			table_cell_count = None
+			continue
+		elif text.startswith("|") and table_allowed and (description is None or section == examples_section):
+			if "\\" in text:
+				# escaped pipes change the number of cells
+				return None
+			cell_count = text.strip().count("|") - 1
+			if table_cell_count is not None and cell_count != table_cell_count:
+				return None
+			table_cell_count = cell_count
+			description = None
+			docstring_allowed = False
+			continue
+		elif text.startswith(docstring_separators) and docstring_allowed and description is None:
+			open_docstring = text[:3]
+			table_allowed = docstring_allowed = False
+			continue
+		elif description == description_expected or description == in_description:
+			description = in_description
+			continue
+		else:
+			# anything else is either part of a description the scan can't tell apart or a syntax error
+			return None
+
+		# a feature, background, scenario or examples line was read, which may be followed by a description
+		tag_names = []
+		description = description_expected
+		if section != examples_section:
+			table_allowed = False
+		docstring_allowed = False
+
+	if open_docstring is not None or tag_names or section == before_feature:
+		return None
+	return FeatureSummary(feature_tag_names, scenarios)
+
+def _get_title(text):
+	return text[text.index(":") + 1:].strip()
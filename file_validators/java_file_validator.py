@@ -1,46 +1,67 @@
 #!/usr/bin/env python
 import re
+import bisect
 import datetime
 import javalang
+import profiling
 
 api_pattern = re.compile("(api|spi)_\d+_\d+")
 
-def validate_java_file(java_file):
+# cheap scans that decide whether any AST rule could fire on a file
+package_pattern = re.compile(r"^\s*package\s+([\w.]+)\s*;", re.MULTILINE)
+osgi_annotation_pattern = re.compile(r"@\s*OsgiServiceImpl\b")
+interface_pattern = re.compile(r"\binterface\b")
+
+# the end of a declaration is found by matching its brackets, skipping strings and comments
+declaration_token_pattern = re.compile(r'"(?:\\.|[^"\\\n])*"|\'(?:\\.|[^\'\\\n])*\'|//[^\n]*|/\*.*?\*/|[{}();]', re.DOTALL)
+# the constants of an enum are also separated by commas
+enum_constant_token_pattern = re.compile(declaration_token_pattern.pattern + "|,", re.DOTALL)
+non_space_pattern = re.compile(r"\S")
+
+def validate_java_file(java_file, contents=None, tiered=True, changed_lines=None):
 	"""Validates a java file.
 
+	Files that no AST rule applies to (not in an API package, no interfaces, not an OSGi service) are never parsed,
+	the text rules like the print statement one run on every file after the validator, see text_rules.
+
 	Args:
-		java_file_path: the path to the java file.
+		java_file: the (status, path) of the java file.
+		contents: the contents of the file as bytes, read from the path if not given.
+		tiered: whether the full parse may be skipped, only turned off to benchmark the tiers.
+		changed_lines: the [first line, last line] ranges a diff changed, to only check the declarations
+			and text they touch, or None to check the whole file.
 	Returns:
 		a list of errors.
 	"""
 
 	file_status, java_file_path = java_file
 
-	with open(java_file_path, "r") as fp:
-		contents = fp.read()
+	if contents is None:
+		with open(java_file_path, "rb") as fp:
+			contents = fp.read()
+	contents = contents.decode("utf-8", "replace")
 
 	if not contents:
 		return ["[ERROR] Errors exist in " + java_file_path, "\t- File is empty"]
 
-	try:
-		tree = javalang.parse.parse(contents)
-	except javalang.parser.JavaSyntaxError:
-		print("Javalang failed to parse '%s'. Skipping file..." % java_file_path)
-		return []
+	if changed_lines is not None:
+		changed_lines = ChangedLines(contents, changed_lines)
 
-	errors = []
+	if not tiered or requires_full_parse(contents):
+		try:
+			with profiling.parse_span():
+				tree = javalang.parse.parse(contents)
+		except javalang.parser.JavaSyntaxError:
+			print("Javalang failed to parse '%s'. Skipping file..." % java_file_path)
+			return []
+
+		is_api = tree.package and api_pattern.search(tree.package.name) is not None
+		visitor = JavaRuleVisitor(is_api, changed_lines)
+		visitor.visit(tree)
+		errors = visitor.get_errors()
+	else:
+		errors = []
 
-	is_api = tree.package and api_pattern.search(tree.package.name) is not None
-	for path, class_declaration in tree.filter(javalang.tree.ClassDeclaration):
-		is_osgi = "OsgiServiceImpl" in [annotation.name for annotation in class_declaration.annotations]
-		errors.extend(validate_class(class_declaration, is_api, is_osgi))
-	for path, interface_declaration in tree.filter(javalang.tree.InterfaceDeclaration):
-		errors.extend(validate_interface(interface_declaration, is_api))
-	for path, enum_declaration in tree.filter(javalang.tree.EnumDeclaration):
-		errors.extend(validate_enum(enum_declaration, is_api))
-	for path, import_declaration in tree.filter(javalang.tree.Import):
-		errors.extend(validate_import(import_declaration))
-	errors.extend(validate_print_statements(contents))
 	if file_status == "A":
 		errors.extend(validate_copyright_statement(contents))
 
@@ -49,12 +70,231 @@ def validate_java_file(java_file):
 
 	return errors
 
-def validate_class(class_declaration, is_api, is_osgi):
+class DeclarationFacts(object):
+	"""The facts about a declaration that several rules look at, computed once per declaration.
+
+	Args:
+		declaration: the javalang declaration
+		changed_lines: the ChangedLines of the file, or None if the whole file is checked
+	"""
+
+	__slots__ = ("annotation_names", "modifiers", "_declaration", "_changed_lines", "_javadoc_is_missing", "_is_changed", "_header_is_changed")
+
+	def __init__(self, declaration, changed_lines=None):
+		self.annotation_names = frozenset(annotation.name for annotation in declaration.annotations)
+		self.modifiers = declaration.modifiers
+		self._declaration = declaration
+		self._changed_lines = changed_lines
+		self._javadoc_is_missing = None
+		self._is_changed = True if changed_lines is None else None
+		self._header_is_changed = True if changed_lines is None else None
+
+	@property
+	def javadoc_is_missing(self):
+		# only API rules look at javadoc so it's worked out on first use
+		if self._javadoc_is_missing is None:
+			self._javadoc_is_missing = javadoc_is_missing(self._declaration)
+		return self._javadoc_is_missing
+
+	@property
+	def is_changed(self):
+		"""Whether any line of the declaration changed, from its javadoc to its closing bracket."""
+
+		if self._is_changed is None:
+			self._is_changed = self._changed_lines.overlaps(*self._changed_lines.get_span(self._declaration))
+		return self._is_changed
+
+	@property
+	def header_is_changed(self):
+		"""Whether the javadoc, annotations, modifiers or name of the declaration changed."""
+
+		if self._header_is_changed is None:
+			self._header_is_changed = self._changed_lines.overlaps(*self._changed_lines.get_header_span(self._declaration))
+		return self._header_is_changed
+
+	def get_changed_constants(self):
+		"""Returns the constants of an enum with a changed line, from their javadoc to the comma after them."""
+
+		constants = self._declaration.body.constants
+		if self._changed_lines is None:
+			return constants
+		spans = self._changed_lines.get_enum_constant_spans(self._declaration)
+		if len(spans) != len(constants):
+			# the text didn't split the way javalang did, so every constant counts as changed
+			return constants
+		return [constant for constant, span in zip(constants, spans) if self._changed_lines.overlaps(*span)]
+
+class ChangedLines(object):
+	"""The lines a diff changed in a java file, and the line spans of its declarations to compare them with.
+
+	Args:
+		contents: the contents of the java file
+		line_ranges: the [first line, last line] ranges that changed
+	"""
+
+	def __init__(self, contents, line_ranges):
+		self.line_ranges = sorted(line_ranges)
+		self._contents = contents
+		self._line_offsets = [0] + [newline.end() for newline in re.finditer("\n", contents)]
+
+	def overlaps(self, first_line, last_line):
+		for range_first, range_last in self.line_ranges:
+			if range_first > last_line:
+				break
+			if range_last >= first_line:
+				return True
+		return False
+
+	def get_span(self, declaration):
+		if declaration.position is None:
+			# nothing to go on, so it counts as changed
+			return 1, len(self._line_offsets)
+		return self._get_first_line(declaration), self._get_last_line(declaration)
+
+	def get_header_span(self, declaration):
+		if declaration.position is None:
+			return 1, len(self._line_offsets)
+		return self._get_first_line(declaration), declaration.position.line
+
+	def get_enum_constant_spans(self, enum_declaration):
+		"""Finds the (first line, last line) of every constant of an enum, javalang gives constants no position.
+
+		Returns:
+			a list of spans in the order of the constants, empty if the enum has no position
+		"""
+
+		if enum_declaration.position is None:
+			return []
+		spans = []
+		depth = 0
+		constant_start = None
+		for token_match in enum_constant_token_pattern.finditer(self._contents, self._get_offset(enum_declaration.position)):
+			token = token_match.group()
+			if constant_start is None:
+				# the constants start after the opening bracket of the body
+				if token == "{":
+					constant_start = token_match.end()
+				continue
+			if token == "{" or token == "(":
+				depth += 1
+			elif depth > 0 and (token == "}" or token == ")"):
+				depth -= 1
+			elif depth == 0 and token in (",", ";", "}"):
+				first_match = non_space_pattern.search(self._contents, constant_start, token_match.start())
+				# a trailing comma leaves nothing between it and the end of the constants
+				if first_match is not None:
+					spans.append((self._get_line(first_match.start()), self._get_line(token_match.start())))
+				if token != ",":
+					break
+				constant_start = token_match.end()
+		return spans
+
+	def _get_first_line(self, declaration):
+		# javalang's position is the keyword or type after the modifiers, the javadoc and annotations come before it
+		documentation = getattr(declaration, "documentation", None)
+		if documentation:
+			documentation_offset = self._contents.rfind(documentation, 0, self._get_offset(declaration.position))
+			if documentation_offset >= 0:
+				return self._get_line(documentation_offset)
+		line = declaration.position.line
+		while line > 1 and self._contents[self._line_offsets[line - 2]:self._get_line_end(line - 1)].lstrip().startswith("@"):
+			line -= 1
+		return line
+
+	def _get_last_line(self, declaration):
+		depth = 0
+		for token_match in declaration_token_pattern.finditer(self._contents, self._get_offset(declaration.position)):
+			token = token_match.group()
+			if token == "{" or token == "(":
+				depth += 1
+			elif token == "}" or token == ")":
+				depth -= 1
+				# a closed body, or the end of the enclosing one
+				if depth < 0 or (depth == 0 and token == "}"):
+					return self._get_line(token_match.start())
+			elif token == ";" and depth == 0:
+				return self._get_line(token_match.start())
+		return len(self._line_offsets)
+
+	def _get_offset(self, position):
+		return self._line_offsets[position.line - 1] + position.column - 1
+
+	def _get_line(self, offset):
+		return bisect.bisect_right(self._line_offsets, offset)
+
+	def _get_line_end(self, line):
+		return self._line_offsets[line] - 1 if line < len(self._line_offsets) else len(self._contents)
+
+class JavaRuleVisitor(object):
+	"""Walks a javalang tree once and runs the rules for every declaration it passes.
+
+	Args:
+		is_api: whether the file is in an API/SPI package
+		changed_lines: the ChangedLines of the file to only check the declarations they touch, or None to check all of them
+	"""
+
+	# declarations whose subtree isn't walked when none of their lines changed
+	pruned_types = (javalang.tree.ClassDeclaration, javalang.tree.InterfaceDeclaration, javalang.tree.EnumDeclaration,
+		javalang.tree.MethodDeclaration, javalang.tree.ConstructorDeclaration, javalang.tree.FieldDeclaration)
+
+	def __init__(self, is_api, changed_lines=None):
+		self.is_api = is_api
+		self.changed_lines = changed_lines
+		# errors are kept per declaration kind so they're reported in the same order as before
+		self._class_errors = []
+		self._interface_errors = []
+		self._enum_errors = []
+		self._facts = {}
+		self._handlers = {
+			javalang.tree.ClassDeclaration: self.visit_class,
+			javalang.tree.InterfaceDeclaration: self.visit_interface,
+			javalang.tree.EnumDeclaration: self.visit_enum,
+		}
+
+	def visit(self, tree):
+		"""Visits every node in the same pre-order as javalang's own walk, without building a path per node."""
+
+		handlers = self._handlers
+		stack = [tree]
+		while stack:
+			item = stack.pop()
+			if isinstance(item, javalang.ast.Node):
+				if self.changed_lines is not None and isinstance(item, self.pruned_types) and not self.get_facts(item).is_changed:
+					continue
+				handler = handlers.get(type(item))
+				if handler is not None:
+					handler(item)
+				children = item.children
+			else:
+				children = item
+			stack.extend(child for child in reversed(children) if isinstance(child, (javalang.ast.Node, list, tuple)))
+
+	def get_errors(self):
+		return self._class_errors + self._interface_errors + self._enum_errors
+
+	def get_facts(self, declaration):
+		facts = self._facts.get(id(declaration))
+		if facts is None:
+			facts = self._facts[id(declaration)] = DeclarationFacts(declaration, self.changed_lines)
+		return facts
+
+	def visit_class(self, class_declaration):
+		is_osgi = "OsgiServiceImpl" in self.get_facts(class_declaration).annotation_names
+		self._class_errors.extend(validate_class(class_declaration, self.is_api, is_osgi, self.get_facts))
+
+	def visit_interface(self, interface_declaration):
+		self._interface_errors.extend(validate_interface(interface_declaration, self.is_api, self.get_facts))
+
+	def visit_enum(self, enum_declaration):
+		self._enum_errors.extend(validate_enum(enum_declaration, self.is_api, self.get_facts))
+
+def validate_class(class_declaration, is_api, is_osgi, get_facts):
 	errors = []
+	osgi_methods = set()
 	if is_osgi:
 		osgi_unsetters_by_setters = {}
 		for method_declaration in class_declaration.methods:
-			if "OsgiServiceReference" in [annotation.name for annotation in method_declaration.annotations]:
+			if "OsgiServiceReference" in get_facts(method_declaration).annotation_names:
 				osgi_unsetters_by_setters[method_declaration.name] = None
 		for method_declaration in class_declaration.methods:
 			for setter in osgi_unsetters_by_setters:
@@ -62,70 +302,91 @@ def validate_class(class_declaration, is_api, is_osgi):
 				if method_declaration.name == "un" + setter or method_declaration.name == "remove" + setter:
 					osgi_unsetters_by_setters[setter] = method_declaration.name
 					break
-		errors.extend(help_validate_osgi_class(class_declaration, osgi_unsetters_by_setters))
+		osgi_methods = set(osgi_unsetters_by_setters.keys()) | set(osgi_unsetters_by_setters.values())
+		errors.extend(help_validate_osgi_class(class_declaration, osgi_unsetters_by_setters, osgi_methods, get_facts))
 
-	if "public" in class_declaration.modifiers:
-		if is_api and javadoc_is_missing(class_declaration):
+	class_facts = get_facts(class_declaration)
+	if "public" in class_facts.modifiers and class_facts.header_is_changed:
+		if is_api and class_facts.javadoc_is_missing:
 			errors.append("\t- Public API class requires javadoc")
 	for method in class_declaration.methods:
+		method_facts = get_facts(method)
+		if not method_facts.is_changed:
+			continue
 		# Overridden don't require javadoc
-		if "Override" in [annotation.name for annotation in method.annotations]:
+		if "Override" in method_facts.annotation_names:
 			continue
 		# Osgi setters and unsetters don't require javadoc
-		if is_osgi and method.name in osgi_unsetters_by_setters.keys() + osgi_unsetters_by_setters.values():
+		if method.name in osgi_methods:
 			continue
-		if "public" in method.modifiers:
-			if is_api and javadoc_is_missing(method):
+		if "public" in method_facts.modifiers:
+			if is_api and method_facts.javadoc_is_missing:
 				method_signature = get_method_signature(method)
 				errors.append("\t- Public method '%s' in public API class requires javadoc" % method_signature)
 	return errors
 
-def validate_interface(interface_declaration, is_api):
+def validate_interface(interface_declaration, is_api, get_facts):
 	errors = []
-	if is_api and javadoc_is_missing(interface_declaration):
-		errors.append("\t- Public API interface requires javadoc")
-	if "abstract" in interface_declaration.modifiers:
-		errors.append("\t- Interface declaration contains the redundant 'abstract' modifier")
+	interface_facts = get_facts(interface_declaration)
+	if interface_facts.header_is_changed:
+		if is_api and interface_facts.javadoc_is_missing:
+			errors.append("\t- Public API interface requires javadoc")
+		if "abstract" in interface_facts.modifiers:
+			errors.append("\t- Interface declaration contains the redundant 'abstract' modifier")
 	for method in interface_declaration.methods:
+		method_facts = get_facts(method)
+		if not method_facts.is_changed:
+			continue
 		method_signature = get_method_signature(method)
-		is_overridden = "Override" in [annotation.name for annotation in method.annotations]
-		if not is_overridden and is_api and javadoc_is_missing(method):
+		is_overridden = "Override" in method_facts.annotation_names
+		if not is_overridden and is_api and method_facts.javadoc_is_missing:
 			errors.append("\t- Public method '%s' in public API interface requires javadoc" % method_signature)
-		if "public" in method.modifiers:
+		if "public" in method_facts.modifiers:
 			errors.append("\t- Method '%s' contains the redundant 'public' modifier" % method_signature)
-		if "abstract" in method.modifiers:
+		if "abstract" in method_facts.modifiers:
 			errors.append("\t- Method '%s' contains the redundant 'abstract' modifier" % method_signature)
 	for field in interface_declaration.fields:
+		field_facts = get_facts(field)
+		if not field_facts.is_changed:
+			continue
+		field_modifiers = field_facts.modifiers
 		declarator_names = [declarator.name for declarator in field.declarators]
-		if "public" in method.modifiers:
+		if "public" in field_modifiers:
 			errors.append("\t- Field '%s' contains the redundant 'public' modifier" % (", ".join(declarator_names)))
-		if "static" in method.modifiers:
+		if "static" in field_modifiers:
 			errors.append("\t- Field '%s' contains the redundant 'static' modifier" % (", ".join(declarator_names)))
-		if "final" in method.modifiers:
+		if "final" in field_modifiers:
 			errors.append("\t- Field '%s' contains the redundant 'final' modifier" % (", ".join(declarator_names)))
 	return errors
 
-def validate_enum(enum_declaration, is_api):
+def validate_enum(enum_declaration, is_api, get_facts):
 	errors = []
-	if "public" in enum_declaration.modifiers:
-		if is_api and javadoc_is_missing(enum_declaration):
+	enum_facts = get_facts(enum_declaration)
+	if "public" in enum_facts.modifiers and enum_facts.header_is_changed:
+		if is_api and enum_facts.javadoc_is_missing:
 			errors.append("\t- Public API enum requires javadoc")
-	for enum_constant in enum_declaration.body.constants:
-		if is_api and javadoc_is_missing(enum_constant):
+	if not is_api:
+		return errors
+	for enum_constant in enum_facts.get_changed_constants():
+		if javadoc_is_missing(enum_constant):
 			errors.append("\t- Public enum constant '%s' in public API enum requires javadoc" % enum_constant.name)
 	return errors
 
-def validate_import(import_declaration):
-	errors = []
-	if import_declaration.path.startswith("edu.emory.mathcs.backport.java.util"):
-		errors.append("\t- Are you sure you want to be importing something from 'edu.emory' and not 'java.util'? If so, bypass the git hooks!")
-	return errors
+def requires_full_parse(contents):
+	"""Pre-scans the text of a java file for anything an AST rule could report on.
 
-def validate_print_statements(contents):
-	errors = []
-	if "System.out.print" in contents:
-		errors.append("\t- Print statement found")
-	return errors
+	The scan errs on the side of parsing, e.g. 'interface' in a comment still triggers the full parse.
+
+	Args:
+		contents: the contents of the java file.
+	Returns:
+		True if the file has to be parsed.
+	"""
+
+	package_match = package_pattern.search(contents)
+	if package_match and api_pattern.search(package_match.group(1)):
+		return True
+	return osgi_annotation_pattern.search(contents) is not None or interface_pattern.search(contents) is not None
 
 def validate_copyright_statement(contents):
 	if not contents.strip().startswith("/*"):
@@ -137,18 +398,24 @@ def validate_copyright_statement(contents):
 		return ["\t- Copyright end date should be '%s'" % datetime.datetime.now().year]
 	return []
 
-def help_validate_osgi_class(class_declaration, osgi_unsetters_by_setters):
+def help_validate_osgi_class(class_declaration, osgi_unsetters_by_setters, osgi_methods, get_facts):
 	errors = []
 
 	has_declared_activator = False
 	has_declared_deactivator = False
+	changed_method_names = set()
 	for method_declaration in class_declaration.methods:
-		if method_declaration.name == "activate" and "protected" in method_declaration.modifiers:
+		method_facts = get_facts(method_declaration)
+		method_modifiers = method_facts.modifiers
+		if method_declaration.name == "activate" and "protected" in method_modifiers:
 			has_declared_activator = True
-		if method_declaration.name == "deactivate" and "protected" in method_declaration.modifiers:
+		if method_declaration.name == "deactivate" and "protected" in method_modifiers:
 			has_declared_deactivator = True
-		if method_declaration.name in osgi_unsetters_by_setters.keys() + osgi_unsetters_by_setters.values():
-			if "protected" not in method_declaration.modifiers:
+		if not method_facts.is_changed:
+			continue
+		changed_method_names.add(method_declaration.name)
+		if method_declaration.name in osgi_methods:
+			if "protected" not in method_modifiers:
 				errors.append("\t- @OsgiServiceReference method '%s' must be declared with the 'protected' visibility modifier" % method_declaration.name)
 	if class_declaration.name.endswith("Activator") and not has_declared_activator:
 		errors.append("\t- OSGi service activator classes must declare a protected activate method")
@@ -156,7 +423,7 @@ def help_validate_osgi_class(class_declaration, osgi_unsetters_by_setters):
 		errors.append("\t- OSGi service activator classes must declare a protected deactivate method")
 
 	for setter in osgi_unsetters_by_setters:
-		if osgi_unsetters_by_setters[setter] is None:
+		if osgi_unsetters_by_setters[setter] is None and setter in changed_method_names:
 			errors.append("\t- @OsgiServiceReference set/unset method '%s' does not have a corresponding unset/remove" % setter)
 	return errors
 
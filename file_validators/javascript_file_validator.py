@@ -1,24 +1,186 @@
 #!/usr/bin/env python
+import os
 import re
+import mmap
+import profiling
 
-def validate_javascript_file(javascript_file):
+debugger_keyword = b"debugger"
+
+# comments and strings are skipped whole by the regex, the keyword is matched as a statement, not as part of another name,
+# a property or an object key, and what's left are the template literals and slashes that need a closer look
+code_token_pattern = br"""//[^\n]*|/\*[^*]*\*+(?:[^/*][^*]*\*+)*/|'[^'\\\n]*(?:\\[\s\S][^'\\\n]*)*'?|"[^"\\\n]*(?:\\[\s\S][^"\\\n]*)*"?|debugger(?<![\w$.]debugger)(?![\w$]|\s*:)|[`/]"""
+code_pattern = re.compile(code_token_pattern)
+# inside a template literal's ${...} the braces are counted to find where the expression ends
+template_code_pattern = re.compile(code_token_pattern + br"|[{}]")
+template_text_pattern = re.compile(br"[^`\\$]*(?:(?:\\[\s\S]|\$(?!\{))[^`\\$]*)*")
+# the rest of a regular expression literal after its opening slash
+regex_literal_pattern = re.compile(br"(?:[^/\\\[\n]|\\.|\[(?:[^\]\\\n]|\\.)*\])+/")
+# a slash after one of these starts a regular expression rather than a division
+regex_preceding_bytes = frozenset(bytearray(b"(,=:[!&|?{};+-*%<>~^"))
+regex_preceding_keywords = frozenset([b"return", b"typeof", b"instanceof", b"in", b"of", b"new", b"delete", b"void",
+	b"throw", b"case", b"do", b"else", b"yield", b"await"])
+preceding_word_pattern = re.compile(br"[\w$]+\Z")
+
+# minified code is recognized by its file name, the directory it's vendored in or its long lines
+minified_suffixes = (".min.js", "-min.js")
+vendored_directories = frozenset(["node_modules", "bower_components", "vendor"])
+minified_sample_bytes = 64 * 1024
+minified_min_sample_bytes = 4 * 1024
+minified_line_length = 1000
+# in minified code the keyword only counts as a statement between these, e.g. 'a();debugger;b()'
+minified_statement_starts = (b";", b"{", b"}", b")", b"\n", b" ", b"")
+minified_statement_ends = (b";", b"}", b"\n", b"")
+
+def validate_javascript_file(javascript_file, contents=None, minified_files="statements"):
 	"""Validates a javascript file.
 
+	The file is only tokenized when the debugger keyword appears in it, and then only up to its last occurrence,
+	to skip the keyword inside strings, comments and regular expressions.
+
 	Args:
-		javascript_file_path: the path to the javascript file.
+		javascript_file: the (status, path) of the javascript file.
+		contents: the contents of the file as bytes, memory mapped from the path if not given. The hooks always give the
+			contents, which they also need for the blob SHA, so only direct callers get the file mapped.
+		minified_files: how minified and vendored files are checked, 'scan' like any other file, 'statements' for the keyword
+			between statement delimiters only, without tokenizing, or 'skip' to not check them.
 	Returns:
 		a list of errors.
 	"""
 
 	file_status, javascript_file_path = javascript_file
 
-	with open(javascript_file_path, "r") as fp:
-		contents = fp.read()
+	if contents is not None:
+		return _validate_javascript_buffer(javascript_file_path, contents, minified_files)
+	if os.path.getsize(javascript_file_path) == 0:
+		# empty files can't be memory mapped
+		return _validate_javascript_buffer(javascript_file_path, b"", minified_files)
+	with open(javascript_file_path, "rb") as fp:
+		buffer = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+		try:
+			return _validate_javascript_buffer(javascript_file_path, buffer, minified_files)
+		finally:
+			buffer.close()
 
-	if not contents:
+def _validate_javascript_buffer(javascript_file_path, buffer, minified_files):
+	if not len(buffer):
 		return ["[ERROR] Errors exist in " + javascript_file_path, "\t- File is empty"]
 
-	if re.search("(\s+|;)debugger;*\s+", " %s " % contents, flags=re.MULTILINE) is not None:
+	# most files don't contain the keyword at all, which is found out without tokenizing anything
+	first_hit = buffer.find(debugger_keyword)
+	if first_hit == -1:
+		return []
+
+	with profiling.parse_span():
+		if minified_files != "scan" and is_minified(javascript_file_path, buffer):
+			if minified_files == "skip":
+				return []
+			found = find_minified_debugger_statement(buffer, first_hit) is not None
+		else:
+			found = find_debugger_statement(buffer, buffer.rfind(debugger_keyword)) is not None
+
+	if found:
 		return ["[ERROR] Errors exist in " + javascript_file_path, "\t- Remove the debugger keyword before you commit"]
 
 	return []
+
+def is_minified(path, buffer):
+	"""Guesses whether a javascript file is minified or vendored code from its path and the line lengths at its start.
+
+	Args:
+		path: the path of the file
+		buffer: the contents of the file as bytes or a memory map
+	Returns:
+		True if the file looks minified or vendored
+	"""
+
+	if path.endswith(minified_suffixes) or not vendored_directories.isdisjoint(path.replace("\\", "/").split("/")[:-1]):
+		return True
+	# only the start of the file is copied
+	sample = buffer[:minified_sample_bytes]
+	return len(sample) >= minified_min_sample_bytes and len(sample) / (sample.count(b"\n") + 1) >= minified_line_length
+
+def find_debugger_statement(buffer, end):
+	"""Finds the debugger keyword in code, skipping strings, template literals, comments and regular expressions.
+
+	Args:
+		buffer: the contents of the file as bytes or a memory map
+		end: the offset of the last occurrence of the keyword, the scan stops there
+	Returns:
+		the offset of the keyword or None if it only appears in strings, comments or regular expressions
+	"""
+
+	pos = 0
+	in_template = False
+	# the number of unclosed braces in each template literal expression being scanned
+	template_depths = []
+	while pos <= end:
+		if in_template:
+			pos = template_text_pattern.match(buffer, pos).end()
+			in_template = False
+			if buffer[pos:pos + 2] == b"${":
+				template_depths.append(0)
+				pos += 2
+			else:
+				# the closing backtick or the end of the file
+				pos += 1
+			continue
+
+		match = (template_code_pattern if template_depths else code_pattern).search(buffer, pos)
+		if match is None or match.start() > end:
+			return None
+		token = match.group()
+		pos = match.end()
+		if token == debugger_keyword:
+			return match.start()
+		elif token == b"`":
+			in_template = True
+		elif token == b"{":
+			template_depths[-1] += 1
+		elif token == b"}":
+			if template_depths[-1]:
+				template_depths[-1] -= 1
+			else:
+				template_depths.pop()
+				in_template = True
+		elif token != b"/":
+			# a comment or a string
+			continue
+		elif buffer[pos:pos + 1] == b"*":
+			# a comment that is never closed
+			return None
+		elif _starts_regex_literal(buffer, match.start()):
+			# a slash that can't be a regular expression on its line is a division after all
+			regex_match = regex_literal_pattern.match(buffer, pos)
+			if regex_match is not None:
+				pos = regex_match.end()
+	return None
+
+def find_minified_debugger_statement(buffer, start):
+	"""Finds the debugger keyword between statement delimiters without tokenizing, for minified code.
+
+	Args:
+		buffer: the contents of the file as bytes or a memory map
+		start: the offset of the first occurrence of the keyword
+	Returns:
+		the offset of the keyword or None
+	"""
+
+	pos = start
+	while pos != -1:
+		if buffer[max(pos - 1, 0):pos] in minified_statement_starts and buffer[pos + len(debugger_keyword):pos + len(debugger_keyword) + 1] in minified_statement_ends:
+			return pos
+		pos = buffer.find(debugger_keyword, pos + 1)
+	return None
+
+def _starts_regex_literal(buffer, slash_pos):
+	# whether a slash starts a regular expression depends on what comes before it
+	pos = slash_pos - 1
+	while pos >= 0 and buffer[pos:pos + 1].isspace():
+		pos -= 1
+	if pos < 0:
+		return True
+	previous_byte = buffer[pos:pos + 1]
+	if ord(previous_byte) in regex_preceding_bytes:
+		return True
+	word_match = preceding_word_pattern.search(buffer, max(pos - 10, 0), pos + 1)
+	return word_match is not None and word_match.group() in regex_preceding_keywords
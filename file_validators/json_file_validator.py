@@ -1,21 +1,202 @@
 #!/usr/bin/env python
+import os
+import re
 import json
+import codecs
+import profiling
 
-def validate_json_file(json_file):
+# smaller files are checked with json.loads, bigger ones are tokenized chunk by chunk so their object tree is never built
+streaming_threshold_bytes = 4 * 1024 * 1024
+chunk_size = 1024 * 1024
+# tokens ending this close to the end of the buffer might carry on in the next chunk, e.g. numbers
+lookahead_chars = 64
+
+string_pattern = r'"(?:[^"\\\x00-\x1f]|\\(?:["\\/bfnrt]|u[0-9a-fA-F]{4}))*"'
+literal_pattern = r'true|false|null|NaN|Infinity|-Infinity'
+number_pattern = r'-?(?:0|[1-9][0-9]*)(?:\.[0-9]+)?(?:[eE][-+]?[0-9]+)?'
+scalar_pattern = "(?:%s|%s|%s)" % (string_pattern, literal_pattern, number_pattern)
+
+# the groups are the token kinds
+string_token, literal_token, number_token, punctuation_token = 1, 2, 3, 4
+token_pattern = re.compile(r'[ \t\n\r]*(?:(%s)|(%s)|(%s)|([{}\[\]:,]))' % (string_pattern, literal_pattern, number_pattern))
+# runs of scalar array elements and object members are skipped with one match instead of token by token,
+# each only once the delimiter after it is in the buffer
+array_run_pattern = re.compile(r'(?:[ \t\n\r]*,[ \t\n\r]*%s(?=[ \t\n\r]*[,\]]))*' % scalar_pattern)
+object_run_pattern = re.compile(r'(?:[ \t\n\r]*,[ \t\n\r]*%s[ \t\n\r]*:[ \t\n\r]*%s(?=[ \t\n\r]*[,}]))*' % (string_pattern, scalar_pattern))
+# the start of a token that the next chunk could still complete
+partial_token_pattern = re.compile(r'[ \t\n\r]*(?:"(?:[^"\\\x00-\x1f]|\\[\s\S]?)*|[a-zA-Z-]+|-?[0-9.eE+-]+)?\Z')
+whitespace_pattern = re.compile(r'[ \t\n\r]*')
+
+# what the tokenizer expects next
+expecting_value, expecting_first_value, expecting_first_key, expecting_key, expecting_colon, expecting_comma, expecting_end = range(7)
+expectation_messages = {
+	expecting_value: "Expecting value",
+	expecting_first_value: "Expecting value",
+	expecting_first_key: "Expecting property name enclosed in double quotes",
+	expecting_key: "Expecting property name enclosed in double quotes",
+	expecting_colon: "Expecting ':' delimiter",
+	expecting_comma: "Expecting ',' delimiter",
+	expecting_end: "Extra data",
+}
+closing_brackets = {"[": "]", "{": "}"}
+
+# values that fit in the buffer are checked by json's own scanner, only containers spanning chunks are tokenized
+value_decoder = json.JSONDecoder()
+
+class JsonSyntaxError(ValueError):
+	pass
+
+def validate_json_file(json_file, contents=None):
 	"""Validates the syntax of a json file.
 
 	Args:
-		json_file_path: the path to the json file.
+		json_file: the (status, path) of the json file.
+		contents: the contents of the file as bytes, read from the path if not given. The hooks always give the contents,
+			so only direct callers get a big file read from disk chunk by chunk, for the hooks its object tree is still never built.
 	Returns:
 		a list of errors.
 	"""
 
 	file_status, json_file_path = json_file
 
-	with open(json_file_path, "r") as fp:
-		try:
-			json.load(fp)
-		except ValueError as e:
-			return ["[ERROR] Errors exist in " + json_file_path, "\t- Could not parse the file! " + str(e)]
+	try:
+		with profiling.parse_span():
+			if contents is None and os.path.getsize(json_file_path) > streaming_threshold_bytes:
+				with open(json_file_path, "rb") as fp:
+					check_json_syntax(iter(lambda: fp.read(chunk_size), b""))
+			else:
+				if contents is None:
+					with open(json_file_path, "rb") as fp:
+						contents = fp.read()
+				if len(contents) > streaming_threshold_bytes:
+					check_json_syntax(contents[i:i + chunk_size] for i in range(0, len(contents), chunk_size))
+				else:
+					json.loads(contents.decode("utf-8"))
+	except ValueError as e:
+		# UnicodeDecodeError is a ValueError too
+		return ["[ERROR] Errors exist in " + json_file_path, "\t- Could not parse the file! " + str(e)]
 
 	return []
+
+def check_json_syntax(chunks):
+	"""Checks the syntax of a json document chunk by chunk, never holding more than a chunk's worth of it in memory.
+
+	Args:
+		chunks: the utf-8 contents of the document as an iterable of bytes
+	Raises:
+		JsonSyntaxError: with the line and column of the first syntax error
+		UnicodeDecodeError: if the contents aren't utf-8
+	"""
+
+	decoder = codecs.getincrementaldecoder("utf-8")()
+	chunks = iter(chunks)
+	position = _BufferPosition()
+	text = u""
+	pos = 0
+	eof = False
+	stack = []
+	expecting = expecting_value
+
+	while True:
+		if expecting == expecting_comma:
+			run_pattern = array_run_pattern if stack[-1] == "[" else object_run_pattern
+			pos = run_pattern.match(text, pos, len(text) if eof else max(pos, len(text) - lookahead_chars)).end()
+		elif expecting == expecting_value or expecting == expecting_first_value:
+			try:
+				end = value_decoder.raw_decode(text, whitespace_pattern.match(text, pos).end())[1]
+			except ValueError:
+				# cut off by the end of the buffer or invalid, the tokens below work out which
+				end = None
+			if end is not None and (eof or end <= len(text) - lookahead_chars):
+				pos = end
+				expecting = expecting_comma if stack else expecting_end
+				continue
+		match = token_pattern.match(text, pos)
+		if not eof and (match.end() > len(text) - lookahead_chars if match is not None else partial_token_pattern.match(text, pos) is not None):
+			chunk = next(chunks, None)
+			if chunk is None:
+				eof = True
+				text += decoder.decode(b"", True)
+			else:
+				position.advance(text, pos)
+				text = text[pos:] + decoder.decode(chunk)
+				pos = 0
+			continue
+
+		if match is None:
+			error_pos = whitespace_pattern.match(text, pos).end()
+			if error_pos == len(text) and expecting == expecting_end:
+				return
+			# a string where a delimiter is expected is a missing delimiter to json.loads, however the string ends
+			if text.startswith('"', error_pos) and expecting not in (expecting_comma, expecting_colon, expecting_end):
+				raise JsonSyntaxError(_describe_string_error(position, text, error_pos))
+			raise JsonSyntaxError(position.describe(expectation_messages[expecting], text, error_pos))
+
+		kind = match.lastindex
+		token = match.group(kind)
+		if expecting == expecting_value or expecting == expecting_first_value:
+			if kind != punctuation_token:
+				expecting = expecting_comma if stack else expecting_end
+			elif token == "[":
+				stack.append(token)
+				expecting = expecting_first_value
+			elif token == "{":
+				stack.append(token)
+				expecting = expecting_first_key
+			elif token == "]" and expecting == expecting_first_value:
+				stack.pop()
+				expecting = expecting_comma if stack else expecting_end
+			else:
+				raise JsonSyntaxError(position.describe(expectation_messages[expecting], text, match.start(kind)))
+		elif expecting == expecting_comma and kind == punctuation_token and token == ",":
+			expecting = expecting_value if stack[-1] == "[" else expecting_key
+		elif expecting == expecting_comma and kind == punctuation_token and token == closing_brackets[stack[-1]]:
+			stack.pop()
+			expecting = expecting_comma if stack else expecting_end
+		elif (expecting == expecting_key or expecting == expecting_first_key) and kind == string_token:
+			expecting = expecting_colon
+		elif expecting == expecting_first_key and token == "}":
+			stack.pop()
+			expecting = expecting_comma if stack else expecting_end
+		elif expecting == expecting_colon and token == ":":
+			expecting = expecting_value
+		else:
+			raise JsonSyntaxError(position.describe(expectation_messages[expecting], text, match.start(kind)))
+		pos = match.end()
+
+def _describe_string_error(position, text, start):
+	# json's own scanner tells what's wrong with the string and where, as json.loads would,
+	# the buffer holds the string up to its error since a string the chunk cut short is read on first
+	try:
+		json.decoder.scanstring(text, start + 1)
+	except ValueError as e:
+		# python 2 only has the message with the position in the buffer baked in
+		if hasattr(e, "msg") and hasattr(e, "pos"):
+			return position.describe(e.msg, text, e.pos)
+	return position.describe("Unterminated string starting at", text, start)
+
+class _BufferPosition(object):
+	"""Keeps track of where the tokenizer's buffer starts in the document, so errors can give a line and column."""
+
+	def __init__(self):
+		self.line = 1
+		self.column = 0
+		self.offset = 0
+
+	def advance(self, text, pos):
+		# text[:pos] is about to be dropped from the buffer
+		newlines = text.count("\n", 0, pos)
+		if newlines:
+			self.line += newlines
+			self.column = pos - text.rfind("\n", 0, pos) - 1
+		else:
+			self.column += pos
+		self.offset += pos
+
+	def describe(self, message, text, pos):
+		newlines = text.count("\n", 0, pos)
+		if newlines:
+			column = pos - text.rfind("\n", 0, pos)
+		else:
+			column = self.column + pos + 1
+		return "%s: line %d column %d (char %d)" % (message, self.line + newlines, column, self.offset + pos)
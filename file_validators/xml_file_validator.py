@@ -1,23 +1,52 @@
 #!/usr/bin/env python
+import io
 from xml.etree import ElementTree as ET
+import profiling
 
-def validate_xml_file(xml_file):
-	"""Validates the syntax of an XML file.
+def validate_xml_file(xml_file, contents=None):
+	"""Validates the syntax of an XML file, parsing it incrementally so big files don't need the whole tree in memory.
 
 	Args:
-		xml_file_path: the path to the XML file.
+		xml_file: the (status, path) of the XML file.
+		contents: the contents of the file as bytes, read from the path if not given.
 	Returns:
 		a list of errors.
 	"""
 
 	file_status, xml_file_path = xml_file
 
-	with open(xml_file_path, "r") as fp:
-		contents = fp.read()
-
+	# the parser works on the bytes so it honours the encoding in the XML declaration
 	try:
-		ET.fromstring(contents)
+		with profiling.parse_span():
+			if contents is None:
+				with open(xml_file_path, "rb") as fp:
+					check_xml_syntax(fp)
+			else:
+				check_xml_syntax(io.BytesIO(contents))
 	except Exception as e:
 		return ["[ERROR] Errors exist in " + xml_file_path, "\t- Could not parse the file! " + str(e)]
 
 	return []
+
+def check_xml_syntax(source):
+	"""Checks that an XML document is well-formed, clearing every element once it's parsed so the tree is never built.
+
+	Args:
+		source: a binary file object with the document
+	Raises:
+		ET.ParseError: with the line and column of the first syntax error
+	"""
+
+	depth = 0
+	root = None
+	for event, element in ET.iterparse(source, events=("start", "end")):
+		if event == "start":
+			if root is None:
+				root = element
+			depth += 1
+		else:
+			depth -= 1
+			element.clear()
+			if depth == 1:
+				# the cleared children of the root would still pile up in it
+				root.clear()
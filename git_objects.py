@@ -0,0 +1,240 @@
+#!/usr/bin/env python
+from __future__ import print_function
+import re
+import ast
+import subprocess
+import profiling
+
+empty_tree_sha1 = "4b825dc642cb6eb9a060e54bf8d69288fbee4904"
+null_sha1 = "0000000000000000000000000000000000000000"
+
+# only regular files are validated, not symlinks (120000) or submodules (160000)
+regular_file_modes = ("100644", "100755")
+
+# '@@ -<old start>[,<old count>] +<new start>[,<new count>] @@'
+hunk_header_pattern = re.compile(r"^@@ -\d+(?:,(\d+))? \+(\d+)(?:,(\d+))? @@")
+
+class BlobReader(object):
+	"""Reads blob contents from one long-lived 'git cat-file --batch' process."""
+
+	def __init__(self):
+		self._process = None
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, exc_type, exc_value, traceback):
+		self.close()
+
+	def read(self, blob_sha):
+		"""Reads the contents of a blob.
+
+		Args:
+			blob_sha: the SHA of the blob
+		Returns:
+			the contents as bytes or None if the object does not exist
+		"""
+
+		if self._process is None:
+			self._process = subprocess.Popen(["git", "cat-file", "--batch"], stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+		self._process.stdin.write(blob_sha.encode("ascii") + b"\n")
+		self._process.stdin.flush()
+
+		# the header is '<sha> <type> <size>' or '<sha> missing'
+		header = self._process.stdout.readline().split()
+		if len(header) != 3:
+			return None
+		contents = self._process.stdout.read(int(header[2]))
+		self._process.stdout.read(1) # the LF after the contents
+		return contents
+
+	def close(self):
+		if self._process is not None:
+			self._process.stdin.close()
+			self._process.stdout.close()
+			self._process.wait()
+			self._process = None
+
+def get_object_types(object_names):
+	"""Looks up the types of many objects with one 'git cat-file --batch-check'.
+
+	Args:
+		object_names: the SHAs or other names of the objects
+	Returns:
+		a dict of each object name to its type, e.g. 'commit', or None if the object does not exist
+	"""
+
+	if not object_names:
+		return {}
+	with profiling.span("git cat-file --batch-check", "git", objects=len(object_names)):
+		process = subprocess.Popen(["git", "cat-file", "--batch-check"], stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+		output = process.communicate("".join(name + "\n" for name in object_names).encode("utf-8"))[0]
+
+	# one line per object in the order they were asked for, '<sha> <type> <size>' or '<name> missing'
+	object_types = {}
+	for object_name, line in zip(object_names, output.decode("utf-8").splitlines()):
+		fields = line.split()
+		object_types[object_name] = fields[1] if len(fields) == 3 else None
+	return object_types
+
+def get_changed_files(diff_args):
+	"""Lists the files changed by a git diff command along with their new blob SHAs.
+
+	Args:
+		diff_args: the git diff command, e.g. ["diff-index", "--cached", "HEAD"] or ["diff", old_ref, new_ref]
+	Returns:
+		a list of [status, path, blob SHA] for every non deleted regular file
+	"""
+
+	with profiling.span("git " + diff_args[0], "git", args=diff_args):
+		return list(iter_changed_files(diff_args))
+
+def iter_changed_files(diff_args):
+	"""Streams the files changed by a git diff command as git outputs them, so huge diffs are never held in memory.
+
+	Args:
+		diff_args: the git diff command, e.g. ["diff", old_ref, new_ref]
+	Returns:
+		a generator of [status, path, blob SHA] for every non deleted regular file
+	"""
+
+	command = ["git"] + diff_args + ["--raw", "-z", "--no-renames", "--no-abbrev"]
+	process = subprocess.Popen(command, stdout=subprocess.PIPE)
+	try:
+		fields = _iter_nul_separated(process.stdout)
+		# each file is ':<old mode> <new mode> <old sha> <new sha> <status>' NUL '<path>' NUL
+		for header in fields:
+			changed_file = _parse_raw_diff_entry(header, next(fields, b""))
+			if changed_file is not None:
+				yield changed_file
+	finally:
+		process.stdout.close()
+		return_code = process.wait()
+	if return_code != 0:
+		raise subprocess.CalledProcessError(return_code, command)
+
+def get_changed_line_ranges(diff_args, pathspecs):
+	"""Finds the lines a git diff command changed in each file, from one zero context diff.
+
+	Args:
+		diff_args: the git diff command, e.g. ["diff-index", "--cached", "HEAD"] or ["diff", old_ref, new_ref]
+		pathspecs: limit the diff to these paths or patterns, e.g. ["*.java"]
+	Returns:
+		a dict of each changed path to a list of [first line, last line] ranges in the new file,
+		a deletion counting as a change to the lines on either side of it
+	"""
+
+	with profiling.span("git " + diff_args[0] + " -U0", "git", args=diff_args):
+		return _get_changed_line_ranges(diff_args, pathspecs)
+
+def iter_commit_messages(revision_args):
+	"""Streams the messages of the commits git log lists, from one git log however many commits there are.
+
+	Args:
+		revision_args: the commits as git log arguments, e.g. ["<old sha1>..<new sha1>"]
+	Returns:
+		a generator of (commit SHA, message)
+	"""
+
+	command = ["git", "log", "-z", "--format=%H%x00%B"] + revision_args
+	process = subprocess.Popen(command, stdout=subprocess.PIPE)
+	try:
+		# '<sha>' NUL '<message>', the commits themselves separated by NUL too
+		fields = _iter_nul_separated(process.stdout)
+		for sha1 in fields:
+			yield sha1.decode("ascii"), next(fields, b"").decode("utf-8", "replace")
+	finally:
+		process.stdout.close()
+		return_code = process.wait()
+	if return_code != 0:
+		raise subprocess.CalledProcessError(return_code, command)
+
+def iter_commit_changes(revision_args):
+	"""Streams the files each commit changed, from one git log however many commits there are.
+
+	Merge commits are left out, the changes they bring in are listed with the commits that made them.
+
+	Args:
+		revision_args: the commits as git log arguments, e.g. ["<old sha1>..<new sha1>"]
+	Returns:
+		a generator of (commit SHA, subject, changed files) from the oldest commit to the newest, the changed files being
+		a list of (status, path, old blob SHA, new blob SHA) for every non deleted regular file
+	"""
+
+	command = ["git", "log", "--reverse", "--no-merges", "--raw", "-z", "--no-renames", "--no-abbrev", "--format=%H %s"] + revision_args
+	process = subprocess.Popen(command, stdout=subprocess.PIPE)
+	commit = None
+	try:
+		# '<sha> <subject>' NUL, then ':<old mode> <new mode> <old sha> <new sha> <status>' NUL '<path>' NUL per file
+		fields = _iter_nul_separated(process.stdout)
+		for field in fields:
+			field = field.lstrip(b"\n")
+			if field.startswith(b":"):
+				old_mode, new_mode, old_sha, new_sha, status = field.decode("ascii").lstrip(":").split()
+				path = next(fields, b"").decode("utf-8")
+				if not status.startswith("D") and new_mode in regular_file_modes:
+					commit[2].append((status, path, old_sha, new_sha))
+				continue
+			if commit is not None:
+				yield commit
+			sha1, subject = (field.decode("utf-8", "replace").split(" ", 1) + [""])[:2]
+			commit = (sha1, subject, [])
+		if commit is not None:
+			yield commit
+	finally:
+		process.stdout.close()
+		return_code = process.wait()
+	if return_code != 0:
+		raise subprocess.CalledProcessError(return_code, command)
+
+def _get_changed_line_ranges(diff_args, pathspecs):
+	command = ["git"] + diff_args + ["-p", "-U0", "--no-color", "--no-ext-diff", "--no-renames", "--src-prefix=a/", "--dst-prefix=b/", "--"] + pathspecs
+	process = subprocess.Popen(command, stdout=subprocess.PIPE)
+	line_ranges_by_path = {}
+	line_ranges = None
+	# the lines left in the current hunk, counted so changed lines that look like headers aren't taken for them
+	hunk_lines = 0
+	try:
+		for line in process.stdout:
+			if hunk_lines:
+				if line[:1] in (b"+", b"-"):
+					hunk_lines -= 1
+			elif line.startswith(b"+++ "):
+				path = line[4:].rstrip(b"\n")
+				if path.startswith(b"\""):
+					# paths with special characters are C quoted
+					path = ast.literal_eval("b" + path.decode("ascii"))
+				line_ranges = None if path == b"/dev/null" else line_ranges_by_path.setdefault(path[2:].decode("utf-8"), [])
+			elif line.startswith(b"@@ ") and line_ranges is not None:
+				hunk_match = hunk_header_pattern.match(line.decode("utf-8", "replace"))
+				old_count = int(hunk_match.group(1)) if hunk_match.group(1) is not None else 1
+				start = int(hunk_match.group(2))
+				count = int(hunk_match.group(3)) if hunk_match.group(3) is not None else 1
+				line_ranges.append([start, start + count - 1] if count else [start, start + 1])
+				hunk_lines = old_count + count
+	finally:
+		process.stdout.close()
+		return_code = process.wait()
+	if return_code != 0:
+		raise subprocess.CalledProcessError(return_code, command)
+	return line_ranges_by_path
+
+def _iter_nul_separated(stream, chunk_size=65536):
+	remainder = b""
+	while True:
+		chunk = stream.read(chunk_size)
+		if not chunk:
+			break
+		fields = (remainder + chunk).split(b"\0")
+		remainder = fields.pop()
+		for field in fields:
+			yield field
+	# the last field isn't NUL terminated when NUL only separates them
+	if remainder:
+		yield remainder
+
+def _parse_raw_diff_entry(header, path):
+	old_mode, new_mode, old_sha, new_sha, status = header.decode("ascii").lstrip(":").split()
+	if status.startswith("D") or new_mode not in regular_file_modes:
+		return None
+	return [status, path.decode("utf-8"), new_sha]
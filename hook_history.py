@@ -0,0 +1,216 @@
+#!/usr/bin/env python
+from __future__ import print_function
+import os
+import sys
+import json
+import time
+import atexit
+import hashlib
+
+history_file_name = "hook-history.jsonl"
+
+# the hooks whose runs are recorded, the other scripts only collect statistics for the hook they validate for
+recorded_hooks = ("pre-commit", "commit-msg", "pre-push", "pre-receive", "update")
+
+# a regression is flagged when a hook's median gets this much slower, and by at least this many ms, after a change
+regression_ratio = 1.2
+regression_min_ms = 20
+# the runs needed on either side of a change to compare them
+min_compared_runs = 5
+
+_hook_name = os.path.basename(sys.argv[0])
+_start = time.time()
+_stats = {}
+
+def clear_stats():
+	global _stats
+	# files: the files checked, validated or found in the cache
+	# bytes: the bytes run through the validators
+	# validators: the seconds and files per validator extension
+	_stats = {"files": 0, "bytes": 0, "cache_hits": 0, "cache_misses": 0, "validators": {}}
+
+def add_validation(extension, seconds, size):
+	"""Records a file run through its validator."""
+
+	seconds_and_files = _stats["validators"].setdefault(extension, [0.0, 0])
+	seconds_and_files[0] += seconds
+	seconds_and_files[1] += 1
+	_stats["bytes"] += size
+
+def add_files(file_count, cache_hits=0, cache_misses=0):
+	"""Records files checked by the hook and how many of them the validation cache had."""
+
+	_stats["files"] += file_count
+	_stats["cache_hits"] += cache_hits
+	_stats["cache_misses"] += cache_misses
+
+def take_stats():
+	"""Returns the statistics collected so far and forgets them, to hand them over to another process."""
+
+	stats = _stats
+	clear_stats()
+	return stats
+
+def add_stats(stats):
+	for key in ("files", "bytes", "cache_hits", "cache_misses"):
+		_stats[key] += stats.get(key, 0)
+	for extension, (seconds, file_count) in stats.get("validators", {}).items():
+		seconds_and_files = _stats["validators"].setdefault(extension, [0.0, 0])
+		seconds_and_files[0] += seconds
+		seconds_and_files[1] += file_count
+
+def get_history_path():
+	import utils
+	return os.path.join(utils.get_hooks_data_dir(), history_file_name)
+
+def read_history(last_runs=None):
+	"""Reads the recorded hook runs, oldest first.
+
+	Args:
+		last_runs: only the most recent runs of each hook are returned, all of them if None
+	Returns:
+		a list of run records
+	"""
+
+	try:
+		with open(get_history_path(), "r") as history_file:
+			lines = history_file.read().splitlines()
+	except (IOError, OSError):
+		return []
+	runs = []
+	for line in lines:
+		try:
+			runs.append(json.loads(line))
+		except ValueError:
+			# a line cut short by a concurrent trim
+			continue
+	if last_runs is not None:
+		runs_by_hook = {}
+		for run in runs:
+			runs_by_hook.setdefault(run["hook"], []).append(run)
+		kept_runs = set(id(run) for hook_runs in runs_by_hook.values() for run in hook_runs[-last_runs:])
+		runs = [run for run in runs if id(run) in kept_runs]
+	return runs
+
+def append_run(run, max_runs):
+	"""Appends a run to the history, dropping the oldest runs once there are about twice as many as max_runs.
+
+	The history is only trimmed now and then so most hooks just append a line.
+	"""
+
+	line = json.dumps(run, sort_keys=True, separators=(",", ":")) + "\n"
+	history_path = get_history_path()
+	with open(history_path, "a") as history_file:
+		history_file.write(line)
+		size = history_file.tell()
+	# the size of this run stands in for the size of every run
+	if size <= len(line) * max_runs * 2:
+		return
+	with open(history_path, "r") as history_file:
+		lines = history_file.read().splitlines(True)
+	import utils
+	# a run another hook appends meanwhile is lost
+	utils.write_file_atomically(history_path, "".join(lines[-max_runs:]))
+
+def summarize(runs):
+	"""Sums up the latency of each hook.
+
+	Args:
+		runs: the run records, oldest first
+	Returns:
+		a list of (hook, run count, p50 ms, p95 ms, median files, cache hit rate or None, {extension: median ms per file})
+	"""
+
+	summaries = []
+	for hook, hook_runs in sorted(_group_by(runs, lambda run: run["hook"]).items()):
+		latencies_ms = sorted(run["seconds"] * 1000 for run in hook_runs)
+		cache_hits = sum(run["cache_hits"] for run in hook_runs)
+		cache_lookups = cache_hits + sum(run["cache_misses"] for run in hook_runs)
+		summaries.append((hook, len(hook_runs), percentile(latencies_ms, 0.5), percentile(latencies_ms, 0.95),
+			percentile(sorted(run["files"] for run in hook_runs), 0.5), cache_hits / float(cache_lookups) if cache_lookups else None,
+			_get_ms_per_file(hook_runs)))
+	return summaries
+
+def find_regressions(runs):
+	"""Compares each hook's runs since the config or the hooks last changed with the runs before.
+
+	Args:
+		runs: the run records, oldest first
+	Returns:
+		a list of messages, one per regression
+	"""
+
+	regressions = []
+	for hook, hook_runs in sorted(_group_by(runs, lambda run: run["hook"]).items()):
+		current = hook_runs[-1]
+		after = [run for run in hook_runs if (run["config"], run["code"]) == (current["config"], current["code"])]
+		before = [run for run in hook_runs if (run["config"], run["code"]) != (current["config"], current["code"])]
+		if len(after) < min_compared_runs or len(before) < min_compared_runs:
+			continue
+		# only the runs just before the change, older ones may be from long gone versions
+		before = before[-len(after):]
+		changes = [name for name, key in (("config", "config"), ("hooks or validators", "code")) if before[-1][key] != current[key]]
+		change = " and ".join(changes) if changes else "config or validators"
+
+		before_ms = percentile(sorted(run["seconds"] * 1000 for run in before), 0.5)
+		after_ms = percentile(sorted(run["seconds"] * 1000 for run in after), 0.5)
+		if _is_regression(before_ms, after_ms):
+			regressions.append("%s got slower after the %s changed: p50 %.0f ms -> %.0f ms over %d runs" % (hook, change, before_ms, after_ms, len(after)))
+		# per file so a run that happened to validate more files isn't taken for a slower validator
+		before_ms_per_file = _get_ms_per_file(before)
+		for extension, ms_per_file in sorted(_get_ms_per_file(after).items()):
+			if extension in before_ms_per_file and _is_regression(before_ms_per_file[extension], ms_per_file, 1):
+				regressions.append("%s validator in %s got slower after the %s changed: %.1f ms -> %.1f ms per file" % (extension, hook,
+					change, before_ms_per_file[extension], ms_per_file))
+	return regressions
+
+def percentile(sorted_values, fraction):
+	if not sorted_values:
+		return 0
+	return sorted_values[int(round(fraction * (len(sorted_values) - 1)))]
+
+def start():
+	"""Records the run of this hook when it exits, unless the history is disabled in the config."""
+
+	clear_stats()
+	atexit.register(_finish)
+
+def _finish():
+	import config
+	import validation_daemon
+	try:
+		# hooks like commit-msg don't need the config, and must not fail for the history's sake
+		if not os.path.isfile(config.config_path):
+			return
+		compiled_config = config.get_compiled_config()
+		if not compiled_config.history_enabled:
+			return
+		code_signature = json.dumps(validation_daemon.get_code_signature())
+		run = dict(_stats, hook=_hook_name, time=int(_start), seconds=round(time.time() - _start, 4),
+			config=config.get_config_hash()[:12], code=hashlib.sha1(code_signature.encode("utf-8")).hexdigest()[:12])
+		run["validators"] = dict((extension, [round(seconds, 4), file_count]) for extension, (seconds, file_count) in _stats["validators"].items())
+		append_run(run, compiled_config.history_max_runs)
+	except (IOError, OSError, ValueError, SystemExit):
+		pass
+
+def _get_ms_per_file(runs):
+	# the median over the runs of the ms each validator took per file
+	ms_per_file = {}
+	for run in runs:
+		for extension, (seconds, file_count) in run["validators"].items():
+			if file_count:
+				ms_per_file.setdefault(extension, []).append(seconds * 1000 / file_count)
+	return dict((extension, percentile(sorted(values), 0.5)) for extension, values in ms_per_file.items())
+
+def _is_regression(before_ms, after_ms, min_ms=regression_min_ms):
+	return after_ms > before_ms * regression_ratio and after_ms - before_ms >= min_ms
+
+def _group_by(runs, get_key):
+	groups = {}
+	for run in runs:
+		groups.setdefault(get_key(run), []).append(run)
+	return groups
+
+clear_stats()
+if _hook_name in recorded_hooks:
+	start()
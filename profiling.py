@@ -0,0 +1,167 @@
+#!/usr/bin/env python
+from __future__ import print_function
+import os
+import sys
+import json
+import time
+import atexit
+
+# GIT_HOOKS_PROFILE=1 writes the trace to the hooks data dir, any other value is the path of the trace file
+profile_env_variable = "GIT_HOOKS_PROFILE"
+slowest_env_variable = "GIT_HOOKS_PROFILE_TOP"
+trace_file_name = "trace.json"
+default_slowest_count = 10
+
+try:
+	_cpu_time = time.process_time
+except AttributeError:
+	_cpu_time = time.clock
+
+# checked by every span so profiling costs one function call when it's off
+enabled = False
+
+_events = []
+_trace_path = None
+_start = None
+# the args of the file being validated, where the parse time of its validator is added up
+_current_file = None
+
+class _Span(object):
+	"""Records the wall and CPU time of a block as a Chrome trace 'complete' event."""
+
+	__slots__ = ("name", "category", "args", "_start", "_cpu_start")
+
+	def __init__(self, name, category, args):
+		self.name = name
+		self.category = category
+		self.args = args
+
+	def __enter__(self):
+		global _current_file
+		if self.category == "file":
+			_current_file = self.args
+		self._start = time.time()
+		self._cpu_start = _cpu_time()
+		return self
+
+	def __exit__(self, exc_type, exc_value, traceback):
+		global _current_file
+		wall = time.time() - self._start
+		self.args["cpu_ms"] = (_cpu_time() - self._cpu_start) * 1000
+		if self.category == "file":
+			_current_file = None
+		elif self.category == "parse" and _current_file is not None:
+			_current_file["parse_ms"] = _current_file.get("parse_ms", 0) + wall * 1000
+		_events.append({"name": self.name, "cat": self.category, "ph": "X", "ts": int(self._start * 1000000),
+			"dur": int(wall * 1000000), "pid": os.getpid(), "tid": 0, "args": self.args})
+		return False
+
+class _NullSpan(object):
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, exc_type, exc_value, traceback):
+		return False
+
+_null_span = _NullSpan()
+
+def span(name, category, **args):
+	"""Times a block of code when profiling is enabled.
+
+	Args:
+		name: the name of the event, e.g. the path of a file or a git command
+		category: one of 'file', 'parse', 'git' or 'validation'
+		args: details shown with the event, e.g. the number of bytes read
+	Returns:
+		a context manager
+	"""
+
+	if not enabled:
+		return _null_span
+	return _Span(name, category, args)
+
+def parse_span():
+	"""Times the parse inside a validator, which is added to the parse time of the file being validated."""
+
+	if not enabled:
+		return _null_span
+	return _Span("parse", "parse", {})
+
+def enable(trace_path=None):
+	"""Starts profiling this process, writing the trace and printing a summary when it exits.
+
+	Args:
+		trace_path: the path of the trace file, in the hooks data dir if not given
+	"""
+
+	global enabled, _trace_path, _start
+	if enabled:
+		return
+	enabled = True
+	# made absolute now since the scripts change directory before they validate
+	_trace_path = os.path.abspath(trace_path) if trace_path else None
+	_start = time.time()
+	atexit.register(_finish)
+
+def take_events():
+	"""Returns the events recorded so far and forgets them, to hand them over to another process."""
+
+	global _events
+	events = _events
+	_events = []
+	return events
+
+def add_events(events):
+	_events.extend(events)
+
+def clear_events():
+	del _events[:]
+
+def _finish():
+	import utils
+	hook_name = os.path.basename(sys.argv[0])
+	_events.append({"name": hook_name, "cat": "hook", "ph": "X", "ts": int(_start * 1000000),
+		"dur": int((time.time() - _start) * 1000000), "pid": os.getpid(), "tid": 0, "args": {}})
+	trace_path = _trace_path or os.path.join(utils.get_hooks_data_dir(), trace_file_name)
+	with open(trace_path, "w") as trace_file:
+		json.dump({"traceEvents": _events, "displayTimeUnit": "ms"}, trace_file)
+	print_summary(_events, hook_name, trace_path)
+
+def print_summary(events, hook_name, trace_path):
+	"""Prints the slowest files and the time spent per validator and per git command to stderr."""
+
+	try:
+		slowest_count = int(os.environ.get(slowest_env_variable, default_slowest_count))
+	except ValueError:
+		slowest_count = default_slowest_count
+	file_events = sorted((event for event in events if event["cat"] == "file"), key=lambda event: event["dur"], reverse=True)
+	hook_ms = sum(event["dur"] for event in events if event["cat"] == "hook") / 1000.0
+
+	lines = ["", "Profile of %s: %.1f ms, trace written to %s" % (hook_name, hook_ms, trace_path)]
+	if file_events:
+		lines.append("Slowest files:")
+		lines.append("  %10s %10s %10s %10s  %-9s %s" % ("wall ms", "cpu ms", "parse ms", "bytes", "validator", "path"))
+		for event in file_events[:slowest_count]:
+			args = event["args"]
+			lines.append("  %10.1f %10.1f %10.1f %10d  %-9s %s" % (event["dur"] / 1000.0, args["cpu_ms"], args.get("parse_ms", 0),
+				args["bytes"], args["validator"], event["name"]))
+		lines.append("Time per validator:")
+		for name, count, total_ms in _totals(file_events, lambda event: event["args"]["validator"]):
+			lines.append("  %-24s %6d files %10.1f ms" % (name, count, total_ms))
+	git_events = [event for event in events if event["cat"] == "git"]
+	if git_events:
+		lines.append("Time per git command:")
+		for name, count, total_ms in _totals(git_events, lambda event: event["name"]):
+			lines.append("  %-24s %6d calls %10.1f ms" % (name, count, total_ms))
+	sys.stderr.write("\n".join(lines) + "\n")
+
+def _totals(events, get_name):
+	totals = {}
+	for event in events:
+		count, total_us = totals.get(get_name(event), (0, 0))
+		totals[get_name(event)] = (count + 1, total_us + event["dur"])
+	return sorted(((name, count, total_us / 1000.0) for name, (count, total_us) in totals.items()), key=lambda total: total[2], reverse=True)
+
+if os.environ.get(profile_env_variable):
+	enable(None if os.environ[profile_env_variable] in ("1", "true") else os.environ[profile_env_variable])
@@ -0,0 +1,178 @@
+#!/usr/bin/env python
+from __future__ import print_function
+import os
+import time
+import subprocess
+import utils
+import config
+import profiling
+import commit_message_validator
+from git_objects import get_changed_files, get_object_types, empty_tree_sha1, null_sha1
+
+try:
+	import fcntl
+except ImportError:
+	# windows has no flock, every push validates in process there
+	fcntl = None
+
+worker_slots_directory_name = "worker-slots"
+slot_poll_interval_seconds = 0.1
+
+server_busy_error = "[ERROR] The server is busy validating other pushes, try pushing again later"
+
+class WorkerSlots(object):
+	"""The worker processes shared by every push the repository receives at the same time.
+
+	Each slot is a lock file that a push holds with flock while it validates, so however many pushes come in at once,
+	no more validator processes run than there are slots. The system releases the locks of a hook that dies.
+
+	Args:
+		slot_count: the number of slots
+	"""
+
+	def __init__(self, slot_count):
+		self.slot_count = slot_count
+		self._directory = os.path.join(utils.get_hooks_data_dir(), worker_slots_directory_name)
+		self._held = []
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, exc_type, exc_value, traceback):
+		self.release()
+
+	def acquire(self, wanted, timeout):
+		"""Claims up to wanted free slots, waiting for at least one to be free.
+
+		Args:
+			wanted: the number of slots to claim at most
+			timeout: the most seconds to wait for a free slot
+		Returns:
+			the number of slots claimed, 0 if none became free in time
+		"""
+
+		if fcntl is None:
+			return 1
+		if not os.path.isdir(self._directory):
+			try:
+				os.makedirs(self._directory)
+			except OSError:
+				# another push may have created it in the meantime
+				if not os.path.isdir(self._directory):
+					raise
+
+		deadline = time.time() + timeout
+		with profiling.span("wait for worker slots", "validation", wanted=wanted):
+			while True:
+				for slot in range(self.slot_count):
+					if len(self._held) >= wanted:
+						break
+					slot_file = open(os.path.join(self._directory, "slot-%d.lock" % slot), "a")
+					try:
+						fcntl.flock(slot_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+					except (IOError, OSError):
+						# held by another push
+						slot_file.close()
+						continue
+					self._held.append(slot_file)
+				if self._held or time.time() >= deadline:
+					return len(self._held)
+				time.sleep(slot_poll_interval_seconds)
+
+	def release(self):
+		for slot_file in self._held:
+			fcntl.flock(slot_file, fcntl.LOCK_UN)
+			slot_file.close()
+		self._held = []
+
+def validate_ref_updates(ref_updates, workers=None):
+	"""Validates what a push brings into the repository, before the refs are updated.
+
+	The files are read from their blobs, the working tree of a server is either missing or unrelated.
+	Only the commits that no ref reaches yet have their messages checked, the others were validated when they were pushed.
+
+	Args:
+		ref_updates: a list of (old SHA, new SHA, ref name) of the refs being pushed
+		workers: the number of worker processes to claim at most, overrides GIT_HOOKS_WORKERS and the config
+	Returns:
+		a list of (ref name, errors) of the refs that have errors
+	"""
+
+	# deleting a ref brings nothing in
+	ref_updates = [ref_update for ref_update in ref_updates if ref_update[1] != null_sha1]
+	object_types = get_object_types(sorted(set("%s^{commit}" % sha1 for old_sha1, new_sha1, ref_name in ref_updates
+		for sha1 in (old_sha1, new_sha1) if sha1 != null_sha1)))
+
+	# the non deleted files of every ref along with their blobs, once per distinct file across all refs
+	unique_files = utils.UniqueFiles()
+	file_indices_by_ref = []
+	invalid_commits_by_ref = []
+	for old_sha1, new_sha1, ref_name in ref_updates:
+		# tags of trees or blobs bring in no commits
+		if object_types["%s^{commit}" % new_sha1] is None or not has_new_commits(new_sha1):
+			continue
+		if old_sha1 != null_sha1 and object_types["%s^{commit}" % old_sha1] is not None:
+			diff_args = ["diff", old_sha1, new_sha1]
+		else:
+			# new refs are compared with the branch HEAD points to, like pre-push compares them with master
+			diff_args = ["diff", get_merge_base("HEAD", new_sha1) or empty_tree_sha1, new_sha1]
+		invalid_commits_by_ref.append(commit_message_validator.get_invalid_commits([new_sha1, "--not", "--all"]))
+		file_indices_by_ref.append((ref_name, unique_files.add_ref(diff_args, get_changed_files(diff_args))))
+
+	errors_by_file = validate_files_in_slots(unique_files.files, unique_files.changed_lines, workers) if unique_files.files else []
+	if errors_by_file is None:
+		return [(ref_name, [server_busy_error]) for ref_name, ref_file_indices in file_indices_by_ref]
+
+	errors_by_ref = []
+	for (ref_name, ref_file_indices), invalid_commits in zip(file_indices_by_ref, invalid_commits_by_ref):
+		# files skipped by fail fast have no errors to report
+		errors = [error for i in ref_file_indices if errors_by_file[i] is not None for error in errors_by_file[i]]
+		errors.extend(commit_message_validator.get_commit_message_errors(invalid_commits))
+		if errors:
+			skipped_message = utils.get_skipped_files_message([errors_by_file[i] for i in ref_file_indices])
+			if skipped_message is not None:
+				errors.append(skipped_message)
+			errors_by_ref.append((ref_name, errors))
+	return errors_by_ref
+
+def validate_files_in_slots(files, changed_lines, workers=None):
+	"""Validates files with as many of the shared worker slots as are free, waiting for one if they're all taken.
+
+	Args:
+		files: the list of [status, path, blob SHA] of the files to be validated
+		changed_lines: a dict of file to the changed line ranges the validator should be limited to, see utils.get_changed_lines
+		workers: the number of worker processes to claim at most, overrides GIT_HOOKS_WORKERS and the config
+	Returns:
+		a list with the list of errors of each file, None for the files skipped by fail fast,
+		or None if no worker slot became free in time
+	"""
+
+	compiled_config = config.get_compiled_config()
+	slot_count = compiled_config.server_max_workers or utils.get_worker_count(0)
+	with WorkerSlots(slot_count) as worker_slots:
+		claimed_workers = worker_slots.acquire(min(utils.get_worker_count(workers), slot_count), compiled_config.server_queue_timeout_seconds)
+		if not claimed_workers:
+			return None
+		# not through the daemon, it can't see the objects git keeps in quarantine until the push is accepted
+		with profiling.span("validate files", "validation", files=len(files), workers=claimed_workers):
+			return utils.validate_files_in_process(files, claimed_workers, changed_lines)
+
+def has_new_commits(sha1):
+	"""Checks whether a commit or its ancestors aren't reachable from any ref yet."""
+
+	with profiling.span("git rev-list", "git", revision=sha1):
+		output = subprocess.check_output(["git", "rev-list", "-n", "1", sha1, "--not", "--all"], universal_newlines=True)
+	return bool(output.strip())
+
+def get_merge_base(ref, sha1):
+	"""Finds the best common ancestor of a ref and a commit.
+
+	Returns:
+		the SHA of the merge base, or None if the ref doesn't exist yet or the histories are unrelated
+	"""
+
+	try:
+		with open(os.devnull, "w") as devnull, profiling.span("git merge-base", "git", ref=ref):
+			return subprocess.check_output(["git", "merge-base", ref, sha1], stderr=devnull, universal_newlines=True).strip()
+	except subprocess.CalledProcessError:
+		return None
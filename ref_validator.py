@@ -1,39 +1,162 @@
-import subprocess
+from __future__ import print_function
 import sys
 import os
+import time
+from collections import Counter
+from itertools import islice
 from optparse import OptionParser
-from utils import print_error, print_success, get_validation_errors_in_files, ref_exists
+from utils import print_error, print_success, get_validation_errors_in_files, get_validation_errors_by_file, get_fail_fast_threshold, get_skipped_files_message, get_validated_extension, ref_exists
+from git_objects import iter_changed_files, iter_commit_changes, empty_tree_sha1
+from commit_message_validator import get_invalid_commits, get_commit_message_errors
+import profiling
+import text_rules
 
-empty_tree_sha1 = "4b825dc642cb6eb9a060e54bf8d69288fbee4904"
+# files are validated in batches of this size so memory stays flat however many files the diff has
+default_batch_size = 500
 
-def validate_files(f):
+def validate_files(f, workers=None, fail_fast=None):
 	print_success("Validating the following files:\n\t%s" % "\n\t".join(f))
 
-	os.chdir("..")
-
-	errors = get_validation_errors_in_files(f)
+	errors = get_validation_errors_in_files([["M", path] for path in f], workers, fail_fast=fail_fast)
 
 	if errors:
 		print_error("\n".join(errors))
 
 	print_success("Done :)")
 
-def validate_repo(ref_1, ref_2="master"):
+def validate_repo(ref_1, ref_2="master", workers=None, batch_size=default_batch_size, fail_fast=None):
 	print_success("Validating %s against %s" % (ref_1, ref_2))
 
-	diff_output = subprocess.check_output(["git", "diff", "--name-status", ref_1, ref_2], universal_newlines=True)
+	# the blobs of ref_1 are streamed straight from git, whatever is checked out
+	changed_files = iter_changed_files(["diff", ref_2, ref_1])
+
+	# the threshold applies to the whole diff, not to each batch
+	fail_fast = get_fail_fast_threshold(fail_fast)
+	failed_count = 0
+
+	# errors are printed batch by batch as they're found
+	start = time.time()
+	validated_count = 0
+	while True:
+		with profiling.span("git diff", "git", ref=ref_1):
+			batch = list(islice(changed_files, batch_size))
+		if not batch:
+			break
+		errors_by_file = get_validation_errors_by_file(batch, workers, fail_fast=fail_fast - failed_count if fail_fast is not None else 0)
+		for errors in errors_by_file:
+			if errors:
+				print_error("\n".join(errors))
+				failed_count += 1
+		validated_count += len(batch)
+		print_progress(validated_count, start)
+		if fail_fast is not None and failed_count >= fail_fast:
+			# the rest of the diff is only listed to count it
+			errors_by_file.extend(None for f in changed_files)
+			skipped_message = get_skipped_files_message(errors_by_file)
+			if skipped_message is not None:
+				print_error(skipped_message)
+			break
+
+	print_success("Done :)")
 
-	all_files = [ f.split("\t") for f in diff_output.split("\n") if f ]
+def validate_commits(ref_1, ref_2="master", workers=None, batch_size=default_batch_size):
+	"""Validates the files every commit between the refs changed, reporting the errors each commit introduced.
+
+	Each blob is validated once however many commits it appears in, and the errors of a commit are the ones
+	its files have that they didn't have before it, so an error is only reported by the commit that introduced it.
+	"""
+
+	print_success("Validating every commit of %s against %s" % (ref_1, ref_2))
+
+	# against the empty tree every commit of ref_1 is validated
+	revision_args = [ref_1] if ref_2 == empty_tree_sha1 else ["%s..%s" % (ref_2, ref_1)]
+
+	# the files to validate keyed by path and blob, with the status of the first commit they appear in
+	files_by_key = {}
+	commits = []
+	with profiling.span("git log", "git", ref=ref_1):
+		for sha1, subject, changed_files in iter_commit_changes(revision_args):
+			commit_files = []
+			for status, path, old_sha, new_sha in changed_files:
+				if get_validated_extension(path) is None:
+					continue
+				files_by_key.setdefault((path, new_sha), [status, path, new_sha])
+				commit_files.append((path, old_sha if status.startswith("M") else None, new_sha))
+			if commit_files:
+				commits.append((sha1, subject, commit_files))
+	# the blobs modified files had before the range are needed to tell the errors a commit introduced from the ones it kept,
+	# those changed within the range were validated with the commit that made them
+	for sha1, subject, commit_files in commits:
+		for path, old_sha, new_sha in commit_files:
+			if old_sha is not None:
+				files_by_key.setdefault((path, old_sha), ["M", path, old_sha])
+
+	# the blobs of every commit are validated together, so the pool works on many commits at a time
+	errors_by_key = {}
+	keys = list(files_by_key)
+	start = time.time()
+	for i in range(0, len(keys), batch_size):
+		batch_keys = keys[i:i + batch_size]
+		# every commit is reported on, not only the first ones with errors
+		errors_by_file = get_validation_errors_by_file([files_by_key[key] for key in batch_keys], workers, fail_fast=0)
+		for key, errors in zip(batch_keys, errors_by_file):
+			if errors:
+				errors_by_key[key] = errors
+		print_progress(i + len(batch_keys), start)
+
+	offending_commit_count = 0
+	for sha1, subject, commit_files in commits:
+		errors = []
+		for path, old_sha, new_sha in commit_files:
+			errors.extend(get_introduced_errors(errors_by_key.get((path, new_sha), []), errors_by_key.get((path, old_sha), [])))
+		if errors:
+			offending_commit_count += 1
+			print_error("Errors introduced by %s %s:" % (sha1[:12], subject))
+			print_error("\n".join(errors))
+
+	print_success("%d of %d commits introduced errors" % (offending_commit_count, len(commits)))
+	print_success("Done :)")
 
-	os.chdir("..")
+def get_introduced_errors(errors, previous_errors):
+	"""Finds the errors of a file that its previous version didn't have.
+
+	Errors are compared without the line and column of text rule matches, which shift when lines are added above them.
+	A rule matching more often than before introduced the extra matches, the last ones are reported for them.
+
+	Args:
+		errors: the errors of the file, starting with the line naming it
+		previous_errors: the errors of the version of the file before the commit
+	Returns:
+		the new errors, starting with the line naming the file, or an empty list
+	"""
+
+	previous_counts = Counter(text_rules.get_error_key(error) for error in previous_errors)
+	introduced_errors = []
+	for error in errors:
+		key = text_rules.get_error_key(error)
+		if previous_counts[key] > 0:
+			previous_counts[key] -= 1
+		else:
+			introduced_errors.append(error)
+	if introduced_errors and introduced_errors[0] != errors[0]:
+		introduced_errors.insert(0, errors[0])
+	return introduced_errors
 
-	errors = get_validation_errors_in_files(all_files)
+def validate_commit_messages(ref_1, ref_2="master"):
+	print_success("Validating the commit messages of %s against %s" % (ref_1, ref_2))
 
+	# against the empty tree every commit of ref_1 is validated
+	errors = get_commit_message_errors(get_invalid_commits([ref_1] if ref_2 == empty_tree_sha1 else ["%s..%s" % (ref_2, ref_1)]))
 	if errors:
 		print_error("\n".join(errors))
 
 	print_success("Done :)")
 
+def print_progress(validated_count, start):
+	elapsed = max(time.time() - start, 0.001)
+	print("... %d files checked (%.1f files/sec)" % (validated_count, validated_count / elapsed), file=sys.stderr)
+	sys.stderr.flush()
+
 if __name__ == "__main__":
 	parser = OptionParser(usage="python %s <ref_1> [ref_2] OR python %s --file <list of absolute file paths>" % (__file__, __file__))
 	description_lines = ["Validates the diff between two refs (tags, commits, branches) or validates a collection of files using the --file option",
@@ -43,23 +166,40 @@ if __name__ == "__main__":
 	parser.set_description("\n\t- ".join(description_lines))
 	parser.format_description = lambda _: parser.description
 	parser.add_option("-f", "--file", action="store_true", dest="file_validation", help="Validate a collection of files")
+	parser.add_option("-b", "--batch-size", type="int", dest="batch_size", default=default_batch_size, help="Number of files validated at a time when validating refs (default %d)" % default_batch_size)
+	parser.add_option("-w", "--workers", type="int", dest="workers", help="Number of worker processes to validate with, 0 for one per cpu (overrides GIT_HOOKS_WORKERS and the config)")
+	parser.add_option("-x", "--fail-fast", type="int", dest="fail_fast", help="Stop after this many files with errors, 0 to validate every file (overrides GIT_HOOKS_FAIL_FAST and the config)")
+
+	parser.add_option("-c", "--per-commit", action="store_true", dest="per_commit", default=False, help="Validate the files changed by every commit between the refs instead of their net diff, reporting the commit that introduced each error")
+	parser.add_option("-m", "--commit-messages", action="store_true", dest="commit_messages", default=False, help="Also validate the message of every commit between the refs")
+	parser.add_option("-p", "--profile", action="store_true", dest="profile", help="Time every file and git command, printing the slowest files and writing a Chrome trace (also turned on by %s)" % profiling.profile_env_variable)
 
 	(options, args) = parser.parse_args()
+	if options.profile:
+		profiling.enable()
+
+	# run from the repository the git-hooks directory lives in
+	if options.file_validation:
+		args = [os.path.abspath(path) for path in args]
+	os.chdir("..")
 
 	if len(args) == 0:
 		parser.print_help()
 		sys.exit(1)
 	elif options.file_validation:
-		validate_files(args)
+		validate_files(args, options.workers, options.fail_fast)
 	elif len(args) == 1:
 		ref = args[0]
 		if not ref_exists(ref):
 			print_error("'%s' ref does not exist" % ref)
 			sys.exit(1)
-		if ref.endswith("master"):
-			validate_repo(ref, empty_tree_sha1)
+		base_ref = empty_tree_sha1 if ref.endswith("master") else "master"
+		if options.per_commit:
+			validate_commits(ref, base_ref, options.workers, options.batch_size)
 		else:
-			validate_repo(ref)
+			validate_repo(ref, base_ref, options.workers, options.batch_size, options.fail_fast)
+		if options.commit_messages:
+			validate_commit_messages(ref, base_ref)
 	elif len(args) == 2:
 		ref_1, ref_2 = args[0], args[1]
 		if not ref_exists(ref_1):
@@ -68,7 +208,12 @@ if __name__ == "__main__":
 		elif not ref_exists(ref_2):
 			print_error("'%s' ref does not exist" % ref_2)
 			sys.exit(1)
-		validate_repo(ref_1, ref_2)
+		if options.per_commit:
+			validate_commits(ref_1, ref_2, options.workers, options.batch_size)
+		else:
+			validate_repo(ref_1, ref_2, options.workers, options.batch_size, options.fail_fast)
+		if options.commit_messages:
+			validate_commit_messages(ref_1, ref_2)
 	else:
 		print_error("You must provide at most 2 arguments representing refs to be validated. Run with --help for help.")
 		sys.exit(1)
@@ -1,11 +1,44 @@
 #!/usr/bin/env python
 from __future__ import print_function
 from utils import print_success, print_error
+from optparse import OptionParser
 import os
+import sys
+import subprocess
+import hook_history
 
-enabled_githooks = os.popen("ls -l ../.git/hooks | grep '^l' | sed 's/.*\///'").read().split()
+parser = OptionParser(usage="python %s [options]" % os.path.basename(__file__))
+parser.set_description("Shows the enabled git hooks, the validation daemon and how long the hooks took lately")
+parser.add_option("-n", "--runs", type="int", dest="runs", default=100, help="Number of recent runs of each hook to sum up")
+(options, args) = parser.parse_args()
+
+# a bare repository receiving pushes on a server keeps its hooks in the repository itself
+is_bare_repository = not os.path.exists("../.git") and os.path.isfile("../HEAD") and os.path.isdir("../hooks")
+hooks_directory = "../hooks" if is_bare_repository else "../.git/hooks"
+enabled_githooks = sorted(f for f in os.listdir(hooks_directory) if os.path.islink(os.path.join(hooks_directory, f)))
 
 if not enabled_githooks:
 	print_error("No git hooks are currently enabled!")
 else:
 	print_success("Currently enabled git hooks are: %s" % ", ".join(enabled_githooks))
+
+if not is_bare_repository:
+	subprocess.call([sys.executable, "validation_daemon.py", "status"])
+
+# the history is kept in the repository the hooks run in
+os.chdir("..")
+runs = hook_history.read_history(options.runs)
+if not runs:
+	print("No hook runs recorded yet")
+	sys.exit(0)
+
+print("\nThe last %d runs of each hook:" % options.runs)
+print("%-12s %6s %9s %9s %7s %8s" % ("hook", "runs", "p50 ms", "p95 ms", "files", "cached"))
+for hook, run_count, p50_ms, p95_ms, files, cache_hit_rate, ms_per_file in hook_history.summarize(runs):
+	cached = "%.0f%%" % (cache_hit_rate * 100) if cache_hit_rate is not None else "-"
+	print("%-12s %6d %9.0f %9.0f %7d %8s" % (hook, run_count, p50_ms, p95_ms, files, cached))
+	for extension, extension_ms in sorted(ms_per_file.items()):
+		print("  %-10s %.1f ms per file" % (extension, extension_ms))
+
+for regression in hook_history.find_regressions(runs):
+	print_error(regression)
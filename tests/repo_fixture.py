@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+import os
+import sys
+import json
+import shutil
+import tempfile
+import subprocess
+
+hooks_directory = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# every extension the schema requires, turned off unless a test turns it on
+disabled_file_validation = {
+	".java": {"validate": False, "skip_test_directories": True},
+	".js": {"validate": False},
+	".feature": {"validate": False, "unallowed_annotations": []},
+	".json": {"validate": False},
+	".xml": {"validate": False},
+}
+
+class TempRepo(object):
+	"""A throwaway git repository with a hooks config, the hooks are run from this checkout of them.
+
+	Args:
+		file_validation: the entries of the "file_validation" section of the config the test needs
+		extra_config: other top level sections of the config
+	"""
+
+	def __init__(self, file_validation, **extra_config):
+		self.path = tempfile.mkdtemp(prefix="git-hooks-test-")
+		self.git("init", "-q")
+		# the hooks compare against master whatever the default branch name is
+		self.git("symbolic-ref", "HEAD", "refs/heads/master")
+		self.git("config", "user.name", "Test User")
+		self.git("config", "user.email", "test@example.com")
+		config = dict(extra_config, file_validation=dict(disabled_file_validation, **file_validation), test_directories=[])
+		self.write("git-hooks-config.json", json.dumps(config, indent=4))
+		self.git("add", "git-hooks-config.json")
+		self.git("commit", "-q", "-m", "Add the hooks config Issue: TEST-1")
+
+	def write(self, path, contents):
+		full_path = os.path.join(self.path, path)
+		if not os.path.isdir(os.path.dirname(full_path)):
+			os.makedirs(os.path.dirname(full_path))
+		with open(full_path, "wb") as fp:
+			fp.write(contents.encode("utf-8") if not isinstance(contents, bytes) else contents)
+
+	def git(self, *args):
+		return subprocess.check_output(["git"] + list(args), cwd=self.path, universal_newlines=True)
+
+	def commit(self, message="Change Issue: TEST-1"):
+		self.git("add", "-A")
+		self.git("commit", "-q", "--no-verify", "-m", message)
+		return self.git("rev-parse", "HEAD").strip()
+
+	def run_script(self, script, *args, **options):
+		"""Runs one of the hook scripts from the root of the repository, like git does.
+
+		Args:
+			script: the file name of the script
+			args: the arguments of the script
+			directory: run from this directory of the repository instead, for the scripts that change to its parent
+			stdin: the text written to the script's stdin, like the refs git gives pre-push
+		Returns:
+			the (exit code, output) of the script
+		"""
+
+		cwd = os.path.join(self.path, options.get("directory", ""))
+		if not os.path.isdir(cwd):
+			os.makedirs(cwd)
+		process = subprocess.Popen([sys.executable, os.path.join(hooks_directory, script)] + list(args), cwd=cwd,
+			stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, universal_newlines=True)
+		output = process.communicate(options.get("stdin", ""))[0]
+		return process.returncode, output
+
+	def remove(self):
+		shutil.rmtree(self.path)
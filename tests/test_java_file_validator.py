@@ -0,0 +1,36 @@
+#!/usr/bin/env python
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from file_validators import java_file_validator
+
+api_enum = b"""package com.example.api_1_0;
+
+/** An enum. */
+public enum Level {
+	/** The lowest level. */
+	LOW(1),
+	MEDIUM(2),
+	HIGH(3);
+
+	private Level(int value) {}
+}
+"""
+
+class ChangedEnumConstantsTest(unittest.TestCase):
+
+	def test_only_changed_constants_are_checked(self):
+		errors = java_file_validator.validate_java_file(("M", "Level.java"), api_enum, changed_lines=[[8, 8]])
+		self.assertEqual(errors, ["[ERROR] Errors exist in Level.java", "\t- Public enum constant 'HIGH' in public API enum requires javadoc"])
+
+	def test_unchanged_constants_of_an_edited_enum_are_not_reported(self):
+		self.assertEqual(java_file_validator.validate_java_file(("M", "Level.java"), api_enum, changed_lines=[[6, 6]]), [])
+
+	def test_every_constant_is_checked_without_changed_lines(self):
+		errors = java_file_validator.validate_java_file(("M", "Level.java"), api_enum)
+		self.assertEqual(len(errors), 3)
+
+if __name__ == "__main__":
+	unittest.main()
@@ -0,0 +1,39 @@
+#!/usr/bin/env python
+import os
+import sys
+import json
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from file_validators import json_file_validator
+
+invalid_documents = [
+	'{"key": "control\x01character"}',
+	'["fine", "bad \\q escape"]',
+	'[1,\n 2,\n "bad \\u12x4 escape"]',
+	'{"key": "unterminated',
+	'{"tab\tin key": 1}',
+	'[' + '"0123456789", ' * 50 + '"tab\tafter a few chunks"]',
+	'{"key" "value"}',
+	'[1, 2,]',
+	'{"key": 1} extra',
+	# broken strings where a delimiter is expected
+	'[1 "ab',
+	'{"a" "b\x01"}',
+]
+
+class StreamingErrorTest(unittest.TestCase):
+
+	def test_errors_match_json_loads(self):
+		for document in invalid_documents:
+			with self.assertRaises(ValueError) as expected:
+				json.loads(document)
+			# chunks small enough that strings and tokens are cut by them
+			for chunk_size in [3, 7, len(document)]:
+				chunks = [document[i:i + chunk_size].encode("utf-8") for i in range(0, len(document), chunk_size)]
+				with self.assertRaises(json_file_validator.JsonSyntaxError) as got:
+					json_file_validator.check_json_syntax(chunks)
+				self.assertEqual(str(got.exception), str(expected.exception), repr(document))
+
+if __name__ == "__main__":
+	unittest.main()
@@ -0,0 +1,84 @@
+#!/usr/bin/env python
+import shutil
+import tempfile
+import unittest
+import subprocess
+from repo_fixture import TempRepo
+
+def java_source(changed_line):
+	lines = ["/*", " * Copyright 2010 - 2020", " */", "package com.example;", "", "public class A {",
+		"\tpublic void log() { System.out.print(\"old\"); }", "", "\tpublic int value() { return 1; }", "}", ""]
+	line_number, text = changed_line
+	lines[line_number - 1] = text
+	return "\n".join(lines)
+
+class ChangedLinesPerRefTest(unittest.TestCase):
+
+	def setUp(self):
+		self.repo = TempRepo({".java": {"validate": True, "skip_test_directories": True, "changed_lines_only": True}})
+		self.repo.write("src/A.java", java_source((9, "\tpublic int value() { return 1; }")))
+		self.base = self.repo.commit()
+
+	def tearDown(self):
+		self.repo.remove()
+
+	def test_lines_changed_by_one_ref_are_not_checked_in_another_refs_blob(self):
+		# ref a edits the line with the print statement, ref b leaves it alone and changes another line
+		self.repo.git("checkout", "-q", "-b", "a")
+		self.repo.write("src/A.java", java_source((7, "\tpublic void log() { System.out.print(\"new\"); }")))
+		a = self.repo.commit()
+		self.repo.git("checkout", "-q", "-b", "b", self.base)
+		self.repo.write("src/A.java", java_source((9, "\tpublic int value() { return 2; }")))
+		b = self.repo.commit()
+
+		stdin = "refs/heads/a %s refs/heads/a %s\nrefs/heads/b %s refs/heads/b %s\n" % (a, self.base, b, self.base)
+		return_code, output = self.repo.run_script("pre-push", "origin", "origin", stdin=stdin)
+		self.assertEqual(return_code, 1, output)
+		self.assertIn("Errors in refs/heads/a", output)
+		self.assertNotIn("Errors in refs/heads/b", output)
+
+class CommitMessagesOnRemoteTest(unittest.TestCase):
+
+	def setUp(self):
+		self.repo = TempRepo({})
+		self.remote_path = tempfile.mkdtemp(prefix="git-hooks-test-remote-")
+		subprocess.check_call(["git", "init", "-q", "--bare", self.remote_path])
+		self.repo.git("remote", "add", "origin", self.remote_path)
+		self.repo.git("push", "-q", "origin", "master")
+
+	def tearDown(self):
+		self.repo.remove()
+		shutil.rmtree(self.remote_path)
+
+	def test_commits_on_the_remote_are_not_checked_after_merging_master(self):
+		self.repo.git("checkout", "-q", "-b", "feat")
+		self.repo.write("feat.txt", "feat")
+		self.repo.commit()
+		self.repo.git("push", "-q", "origin", "feat")
+		remote_sha1 = self.repo.git("rev-parse", "feat").strip()
+
+		# a commit pushed to master without the hooks, then merged into the branch
+		self.repo.git("checkout", "-q", "master")
+		self.repo.write("legacy.txt", "legacy")
+		self.repo.commit("legacy commit pushed before hooks")
+		self.repo.git("push", "-q", "--no-verify", "origin", "master")
+		self.repo.git("checkout", "-q", "feat")
+		self.repo.git("merge", "-q", "--no-edit", "master")
+		self.repo.write("feat.txt", "feat again")
+		local_sha1 = self.repo.commit("Change feat Issue: TEST-2")
+
+		stdin = "refs/heads/feat %s refs/heads/feat %s\n" % (local_sha1, remote_sha1)
+		return_code, output = self.repo.run_script("pre-push", "origin", self.remote_path, stdin=stdin)
+		self.assertEqual(return_code, 0, output)
+
+		# the pusher's own commits are still checked
+		self.repo.write("feat.txt", "feat once more")
+		local_sha1 = self.repo.commit("quick fix")
+		stdin = "refs/heads/feat %s refs/heads/feat %s\n" % (local_sha1, remote_sha1)
+		return_code, output = self.repo.run_script("pre-push", "origin", self.remote_path, stdin=stdin)
+		self.assertEqual(return_code, 1, output)
+		self.assertIn("quick fix", output)
+		self.assertNotIn("legacy commit", output)
+
+if __name__ == "__main__":
+	unittest.main()
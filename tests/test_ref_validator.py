@@ -0,0 +1,38 @@
+#!/usr/bin/env python
+import unittest
+from repo_fixture import TempRepo
+
+class PerCommitTest(unittest.TestCase):
+
+	def setUp(self):
+		self.repo = TempRepo({".js": {"validate": True, "text_rules": [{"id": "no-console", "literal": "console.log", "message": "Remove console.log"}]}})
+		self.repo.git("checkout", "-q", "-b", "feature")
+
+	def tearDown(self):
+		self.repo.remove()
+
+	def test_match_on_shifted_line_is_blamed_on_the_commit_adding_it(self):
+		self.repo.write("src/a.js", "function f() {\n\tconsole.log(1);\n}\n")
+		adding_commit = self.repo.commit()
+		# only adds a line above the existing match, which moves it from line 2 to line 3
+		self.repo.write("src/a.js", "// logs one\nfunction f() {\n\tconsole.log(1);\n}\n")
+		shifting_commit = self.repo.commit()
+
+		return_code, output = self.repo.run_script("ref_validator.py", "--per-commit", "feature", directory="git-hooks")
+		self.assertIn("Errors introduced by %s" % adding_commit[:12], output)
+		self.assertIn("line 2, column 2", output)
+		self.assertNotIn(shifting_commit[:12], output)
+		self.assertIn("1 of 2 commits introduced errors", output)
+
+	def test_extra_match_of_a_rule_is_blamed_on_the_commit_adding_it(self):
+		self.repo.write("src/a.js", "function f() {\n\tconsole.log(1);\n}\n")
+		self.repo.commit()
+		self.repo.write("src/a.js", "function f() {\n\tconsole.log(1);\n\tconsole.log(2);\n}\n")
+		second_commit = self.repo.commit()
+
+		return_code, output = self.repo.run_script("ref_validator.py", "--per-commit", "feature", directory="git-hooks")
+		self.assertIn("Errors introduced by %s" % second_commit[:12], output)
+		self.assertIn("2 of 2 commits introduced errors", output)
+
+if __name__ == "__main__":
+	unittest.main()
@@ -0,0 +1,31 @@
+#!/usr/bin/env python
+import unittest
+from repo_fixture import TempRepo
+
+debugger_file = "function f() {\n\tdebugger;\n}\n"
+
+class PathDependentCacheKeyTest(unittest.TestCase):
+
+	def setUp(self):
+		self.repo = TempRepo({".js": {"validate": True, "minified_files": "skip"}}, validation_cache={"enabled": True})
+
+	def tearDown(self):
+		self.repo.remove()
+
+	def test_vendored_blob_is_validated_again_under_another_path(self):
+		# skipped as vendored code, which caches no errors for the blob
+		self.repo.write("vendor/x.js", debugger_file)
+		self.repo.git("add", "vendor/x.js")
+		return_code, output = self.repo.run_script("pre-commit")
+		self.assertEqual(return_code, 0, output)
+		self.repo.commit()
+
+		# the same blob outside the vendored directory is checked
+		self.repo.write("src/x.js", debugger_file)
+		self.repo.git("add", "src/x.js")
+		return_code, output = self.repo.run_script("pre-commit")
+		self.assertEqual(return_code, 1, output)
+		self.assertIn("Remove the debugger keyword", output)
+
+if __name__ == "__main__":
+	unittest.main()
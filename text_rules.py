@@ -0,0 +1,195 @@
+#!/usr/bin/env python
+import re
+from collections import namedtuple
+
+# rule_id: the name the rule is reported and overridden by
+# literal: the exact text the rule bans, None for a regex rule
+# regex: the regular expression the rule bans, ^ and $ match at line boundaries, None for a literal rule
+# message: what is reported for each match
+TextRule = namedtuple("TextRule", ["rule_id", "literal", "regex", "message"])
+
+# checked on top of the configured rules, a configured rule with the same id replaces one of these
+default_rules_by_extension = {
+	".java": [
+		TextRule("java-print-statement", "System.out.print", None, "Print statement found"),
+		TextRule("java-backport-import", None, r"^[ \t]*import[ \t]+(?:static[ \t]+)?edu\.emory\.mathcs\.backport\.java\.util\b",
+			"Are you sure you want to be importing something from 'edu.emory' and not 'java.util'? If so, bypass the git hooks!"),
+	],
+}
+
+# the groups of a regex are numbered differently once it's combined with the others
+backreference_pattern = re.compile(r"\\[1-9]|\(\?P=")
+
+# a rule that matches all over a file is reported this many times, then summed up
+max_reported_matches = 10
+
+# the parts of a rule's errors that change when lines are added or removed above its matches
+error_location_pattern = re.compile(r", line \d+, column \d+\]$")
+more_matches_pattern = re.compile(r"^\t- \.\.\.and \d+ more matches of ")
+
+class TextRuleMatcher(object):
+	"""Checks a file against many text rules in one scan.
+
+	The literals of all rules are merged into a trie shaped regex, so each position costs one branch per distinct next
+	character however many literals there are, and the regex rules are added as alternatives of the same regex.
+	Where the combined regex hits, every rule is tried at that position, so rules overlapping each other are all reported.
+
+	Args:
+		rules: the TextRules to check
+	Raises:
+		ValueError: if a regex is invalid, matches the empty string or has a backreference
+	"""
+
+	def __init__(self, rules):
+		self.rules = list(rules)
+		self._rule_ids_by_literal = {}
+		self._regex_rules = []
+		for rule in self.rules:
+			if rule.literal is not None:
+				self._rule_ids_by_literal.setdefault(rule.literal, []).append(rule.rule_id)
+				continue
+			try:
+				pattern = re.compile(rule.regex, re.MULTILINE)
+			except re.error as e:
+				raise ValueError("the regex of text rule '%s' is invalid: %s" % (rule.rule_id, e))
+			if pattern.match("") is not None:
+				raise ValueError("the regex of text rule '%s' matches the empty string" % rule.rule_id)
+			if backreference_pattern.search(rule.regex):
+				raise ValueError("the regex of text rule '%s' has a backreference, which text rules don't support" % rule.rule_id)
+			self._regex_rules.append((rule.rule_id, pattern))
+		self._literal_lengths = sorted(set(len(literal) for literal in self._rule_ids_by_literal))
+		self._messages = dict((rule.rule_id, rule.message) for rule in self.rules)
+
+		alternatives = []
+		if self._rule_ids_by_literal:
+			alternatives.append(_get_trie_pattern(self._rule_ids_by_literal))
+		if self._regex_rules:
+			# grouped on their own, the regex engine factors out what they start with, e.g. a \b they all share
+			alternatives.append("(?:%s)" % "|".join("(?:%s)" % pattern.pattern for rule_id, pattern in self._regex_rules))
+		try:
+			self._pattern = re.compile("|".join(alternatives), re.MULTILINE) if alternatives else None
+		except re.error as e:
+			# e.g. a regex with inline flags that only apply at the start of a pattern
+			raise ValueError("the text rule regexes can't be combined: %s" % e)
+
+	def find_matches(self, text):
+		"""Finds the matches of every rule in a text, each rule's matches not overlapping each other.
+
+		Args:
+			text: the text to check
+		Returns:
+			a list of (rule id, offset) ordered by offset
+		"""
+
+		matches = []
+		if self._pattern is None:
+			return matches
+		# where the last match of each rule ended, a rule doesn't match again inside its own match
+		match_ends = {}
+		search = self._pattern.search
+		match = search(text)
+		while match is not None:
+			start = match.start()
+			for rule_id, end in self._get_rules_matching_at(text, start):
+				if match_ends.get(rule_id, 0) <= start:
+					match_ends[rule_id] = end
+					matches.append((rule_id, start))
+			match = search(text, start + 1)
+		return matches
+
+	def get_errors(self, contents, changed_lines=None):
+		"""Checks a file against the rules.
+
+		Args:
+			contents: the contents of the file as bytes
+			changed_lines: the [first line, last line] ranges a diff changed to only report matches on, or None for the whole file
+		Returns:
+			a list of errors, one per match with the rule id, line and column
+		"""
+
+		if self._pattern is None:
+			return []
+		text = contents.decode("utf-8", "replace")
+		errors = []
+		match_counts = {}
+		line = 1
+		line_start = 0
+		position = 0
+		for rule_id, offset in self.find_matches(text):
+			# the matches come in order, so the lines are counted as they go
+			newlines = text.count("\n", position, offset)
+			if newlines:
+				line += newlines
+				line_start = text.rfind("\n", position, offset) + 1
+			position = offset
+			if changed_lines is not None and not any(first_line <= line <= last_line for first_line, last_line in changed_lines):
+				continue
+			match_counts[rule_id] = match_counts.get(rule_id, 0) + 1
+			if match_counts[rule_id] <= max_reported_matches:
+				errors.append("\t- %s [%s, line %d, column %d]" % (self._messages[rule_id], rule_id, line, offset - line_start + 1))
+		for rule_id, match_count in sorted(match_counts.items()):
+			if match_count > max_reported_matches:
+				errors.append("\t- ...and %d more matches of [%s]" % (match_count - max_reported_matches, rule_id))
+		return errors
+
+	def _get_rules_matching_at(self, text, start):
+		# the trie matched the longest literal, the shorter ones ending at a prefix of it matched too
+		for length in self._literal_lengths:
+			rule_ids = self._rule_ids_by_literal.get(text[start:start + length])
+			if rule_ids is not None:
+				for rule_id in rule_ids:
+					yield rule_id, start + length
+		for rule_id, pattern in self._regex_rules:
+			match = pattern.match(text, start)
+			if match is not None:
+				yield rule_id, max(match.end(), start + 1)
+
+def get_error_key(error):
+	"""Returns an error without the location of its match, to tell whether a match was already there before lines moved.
+
+	Args:
+		error: an error from get_errors or from a validator
+	Returns:
+		the error without its line, column or match count, errors that aren't from a text rule are returned as they are
+	"""
+
+	return more_matches_pattern.sub("\t- ...and more matches of ", error_location_pattern.sub("]", error))
+
+def get_rules(extension, configured_rules):
+	"""Combines the default text rules of an extension with the ones configured for it.
+
+	Args:
+		extension: the file extension, including the period
+		configured_rules: the "text_rules" entries of the extension's config
+	Returns:
+		a list of TextRules
+	"""
+
+	rules = [TextRule(rule["id"], rule.get("literal"), rule.get("regex"), rule["message"]) for rule in configured_rules]
+	configured_ids = set(rule.rule_id for rule in rules)
+	return [rule for rule in default_rules_by_extension.get(extension, []) if rule.rule_id not in configured_ids] + rules
+
+def _get_trie_pattern(literals):
+	trie = {}
+	for literal in literals:
+		node = trie
+		for character in literal:
+			node = node.setdefault(character, {})
+		# the empty key marks the end of a literal
+		node[""] = {}
+	return _get_node_pattern(trie)
+
+def _get_node_pattern(node):
+	# a chain of nodes with a single child each becomes one literal run, so long literals don't recurse per character
+	prefix = []
+	while len(node) == 1 and "" not in node:
+		character, node = next(iter(node.items()))
+		prefix.append(re.escape(character))
+	branches = [re.escape(character) + _get_node_pattern(child) for character, child in sorted(node.items()) if character]
+	if not branches:
+		return "".join(prefix)
+	pattern = branches[0] if len(branches) == 1 else "(?:%s)" % "|".join(branches)
+	if "" in node:
+		# a literal ends here, longer ones are tried first
+		pattern = "(?:%s)?" % pattern
+	return "".join(prefix) + pattern
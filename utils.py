@@ -2,13 +2,21 @@
 from __future__ import print_function
 import os
 import sys
+import time
 import subprocess
-import json
-import jsonschema
-from file_validators import *
+import config
+import git_objects
+import profiling
+import hook_history
+import validation_cache as validation_cache_module
+import validation_daemon
+import validation_budget
+import file_validators
 
 git_hooks = ["applypatch-msg", "pre-applypatch", "pre-rebase", "commit-msg",
-			"pre-commit", "prepare-commit-msg", "post-update", "pre-push", "update"]
+			"pre-commit", "prepare-commit-msg", "post-update", "pre-push", "pre-receive", "update"]
+# run by the repository pushes are received in rather than in a checkout
+server_hooks = ["pre-receive", "update"]
 versioned_hooks = [f for f in os.listdir(".") if f in git_hooks]
 
 is_terminal = True
@@ -21,44 +29,441 @@ is_windows = sys.platform == "win32"
 
 is_python3 = sys.version_info >= (3, 0)
 
-def get_validation_errors_in_files(files):
+def get_validation_errors_in_files(files, workers=None, changed_lines=None, fail_fast=None):
+	"""Validates a list of files, in the validation daemon if one is running.
+
+	Args:
+		files: the list of [status, path] or [status, path, blob SHA] of the files to be validated
+		workers: the number of worker processes, overrides GIT_HOOKS_WORKERS and the config
+		changed_lines: a dict of file to the changed line ranges the validator should be limited to, see get_changed_lines
+		fail_fast: the number of files with errors to stop validating after, 0 to validate every file,
+			overrides GIT_HOOKS_FAIL_FAST and the config
+	Returns:
+		a list of all errors, ending with a note of how many files were skipped if validation stopped early
+	"""
+
+	errors_by_file = get_validation_errors_by_file(files, workers, changed_lines, fail_fast)
+	errors = [error for file_errors in errors_by_file if file_errors is not None for error in file_errors]
+	skipped_message = get_skipped_files_message(errors_by_file)
+	if skipped_message is not None:
+		errors.append(skipped_message)
+	return errors
+
+def get_validation_errors_by_file(files, workers=None, changed_lines=None, fail_fast=None):
+	"""Validates a list of files, in the validation daemon if one is running.
+
+	Args:
+		files: the list of [status, path] or [status, path, blob SHA] of the files to be validated
+		workers: the number of worker processes, overrides GIT_HOOKS_WORKERS and the config
+		changed_lines: a dict of file to the changed line ranges the validator should be limited to, see get_changed_lines
+		fail_fast: the number of files with errors to stop validating after, 0 to validate every file,
+			overrides GIT_HOOKS_FAIL_FAST and the config
+	Returns:
+		a list with the list of errors of each file, in the same order as the files,
+		None for the files that weren't validated because validation stopped early
+	"""
+
+	with profiling.span("validate files", "validation", files=len(files)):
+		errors_by_file = validation_daemon.get_validation_errors_by_file(files, workers, changed_lines, fail_fast)
+		if errors_by_file is None:
+			errors_by_file = validate_files_in_process(files, workers, changed_lines, fail_fast)
+	return errors_by_file
+
+def get_skipped_files_message(errors_by_file):
+	"""Describes the files fail fast skipped.
+
+	Args:
+		errors_by_file: the list with the list of errors of each file, None for the skipped files
+	Returns:
+		the message or None if no file was skipped
+	"""
+
+	skipped_count = sum(1 for file_errors in errors_by_file if file_errors is None)
+	if not skipped_count:
+		return None
+	return "[SKIPPED] Validation stopped at the first errors (fail fast), %d more file%s not validated" % (skipped_count,
+		" was" if skipped_count == 1 else "s were")
+
+def get_changed_lines(diff_args, files):
+	"""Finds the changed lines of the modified files whose validators are configured to only check changed lines.
+
+	Args:
+		diff_args: the git diff command the files were listed with, e.g. ["diff-index", "--cached", "HEAD"]
+		files: the list of [status, path] or [status, path, blob SHA] of the changed files
+	Returns:
+		a dict of get_changed_lines_key of a file to a list of [first line, last line] ranges,
+		empty if no validator checks only changed lines
+	"""
+
+	compiled_config = config.get_compiled_config()
+	if not compiled_config.changed_lines_only_extensions:
+		return {}
+	# added files are validated whole
+	checked_files = [f for f in files if f[0].startswith("M") and compiled_config.checks_changed_lines_only(get_validated_extension(f[1]))]
+	if not checked_files:
+		return {}
+	# patterns rather than paths so the command line stays short however many files changed
+	line_ranges_by_path = git_objects.get_changed_line_ranges(diff_args, ["*" + extension for extension in sorted(compiled_config.changed_lines_only_extensions)])
+	return dict((get_changed_lines_key(f), line_ranges_by_path[f[1]]) for f in checked_files if f[1] in line_ranges_by_path)
+
+def get_changed_lines_key(f):
+	"""Returns the key of a file in the dicts of get_changed_lines.
+
+	Refs pushed together can change the same path to different blobs, so a file read from git is keyed by its blob as well.
+	The key is a string so the dict can be sent to the validation daemon as JSON.
+
+	Args:
+		f: the [status, path] or [status, path, blob SHA] of the file
+	"""
+
+	return f[1] if len(f) < 3 else "%s:%s" % (f[2], f[1])
+
+class UniqueFiles(object):
+	"""Collects the files several pushed refs change, each distinct file once, so a file is validated once however many refs change it.
+
+	Attributes:
+		files: the distinct [status, path, blob SHA] files of all refs
+		changed_lines: the changed line ranges of the files, see get_changed_lines
+	"""
+
+	def __init__(self):
+		self.files = []
+		self.changed_lines = {}
+		self._indices = {}
+
+	def add_ref(self, diff_args, files):
+		"""Adds the files a ref changes.
+
+		Args:
+			diff_args: the git diff command the files were listed with, e.g. ["diff", "<old sha1>", "<new sha1>"]
+			files: the list of [status, path, blob SHA] of the non deleted files the ref changes
+		Returns:
+			the indices of the ref's files in files
+		"""
+
+		# a blob changed by several refs is checked on the lines any of them changed, refs with other blobs of the path don't add to it
+		for file_key, line_ranges in get_changed_lines(diff_args, files).items():
+			self.changed_lines.setdefault(file_key, []).extend(line_ranges)
+		indices = []
+		for f in files:
+			# the same blob at the same path with the same status always validates the same way
+			file_key = tuple(f)
+			if file_key not in self._indices:
+				self._indices[file_key] = len(self.files)
+				self.files.append(f)
+			indices.append(self._indices[file_key])
+		return indices
+
+def validate_files_in_process(files, workers=None, changed_lines=None, fail_fast=None):
 	"""Validates a list of files using the file validators.
 
+	Files are read from git by blob SHA when one is given and from the working tree otherwise.
+	Files whose blobs were validated before get their errors from the validation cache.
+	Large batches are spread over a pool of worker processes, biggest files first.
+	With fail fast, no file is started once enough files have errors and the ones being validated are cancelled.
+	Files whose validation goes over its budget are reported as skipped without failing, and are skipped straight away
+	on later runs until their validator or budget changes.
+
 	Args:
-		files: the list of files to be validated
+		files: the list of [status, path] or [status, path, blob SHA] of the files to be validated
+		workers: the number of worker processes, overrides GIT_HOOKS_WORKERS and the config
+		changed_lines: a dict of file to the changed line ranges the validator should be limited to, see get_changed_lines
+		fail_fast: the number of files with errors to stop validating after, 0 to validate every file,
+			overrides GIT_HOOKS_FAIL_FAST and the config
 	Returns:
-		a list of all errors
+		a list with the list of errors of each file, in the same order as the files,
+		None for the files that weren't validated because validation stopped early
 	"""
 
-	errors = []
+	changed_lines = changed_lines or {}
+	fail_fast = get_fail_fast_threshold(fail_fast)
 
 	# validate changed files that have validators
-	for f in files:
+	errors_by_file = [[] for f in files]
+	files_to_validate = []
+	for i, f in enumerate(files):
 		path = f[1]
-		if not os.path.isfile(path):
+		# files with a blob SHA are read from git, the rest from the working tree
+		if len(f) < 3 and not os.path.isfile(path):
 			print_error("Could not find file '%s'" % path)
 			continue
-		if path.endswith(".java") and validation_enabled(".java") and not is_in_test_directory(path):
-			errors.extend(java_file_validator.validate_java_file(f))
-		elif path.endswith(".js") and validation_enabled(".js"):
-			errors.extend(javascript_file_validator.validate_javascript_file(f))
-		elif path.endswith(".json") and validation_enabled(".json"):
-			errors.extend(json_file_validator.validate_json_file(f))
-		elif path.endswith(".xml") and validation_enabled(".xml"):
-			errors.extend(xml_file_validator.validate_xml_file(f))
-		elif path.endswith(".feature") and validation_enabled(".feature"):
-			errors.extend(feature_file_validator.validate_feature_file(f, get_config()["file_validation"][".feature"]["unallowed_annotations"]))
+		if get_validated_extension(path) is not None:
+			files_to_validate.append(i)
 
-	return errors
+	compiled_config = config.get_compiled_config()
+	validation_cache = validation_cache_module.open_cache(compiled_config.cache_max_entries) if compiled_config.cache_enabled else None
+	over_budget_files = validation_budget.OverBudgetFiles() if compiled_config.has_validation_budgets else None
+
+	# only files whose blobs haven't been validated before need to run through the validators
+	cache_keys = {}
+	blob_shas = {}
+	cache_misses = []
+	files_to_run = []
+	failed_count = 0
+	with git_objects.BlobReader() as blob_reader:
+		for position, i in enumerate(files_to_validate):
+			if fail_fast is not None and failed_count >= fail_fast:
+				# the cached errors were enough to stop at, nothing else is read
+				for skipped_index in files_to_validate[position:]:
+					errors_by_file[skipped_index] = None
+				break
+			f = files[i]
+			status, path = f[0], f[1]
+			blob_sha = f[2] if len(f) > 2 else None
+			# pre-push may list the same path as added in one ref and modified in another
+			file_changed_lines = changed_lines.get(get_changed_lines_key(f)) if status.startswith("M") else None
+			contents = None
+			if blob_sha is None and (validation_cache is not None or over_budget_files is not None):
+				contents = read_file(path)
+				blob_sha = validation_cache_module.get_blob_sha(contents)
+			if over_budget_files is not None:
+				blob_shas[i] = blob_sha
+				extension = get_validated_extension(path)
+				budget = compiled_config.get_validation_budget(extension)
+				over_budget = over_budget_files.get(blob_sha, file_validators.get_validator_version(extension), budget)
+				if over_budget is not None:
+					print_error(validation_budget.get_skipped_message(path, over_budget, budget, remembered=True))
+					continue
+			if validation_cache is not None:
+				cache_keys[i] = get_cache_key(validation_cache, f, blob_sha, file_changed_lines)
+				cached_errors = validation_cache.get(cache_keys[i], path)
+				if cached_errors is not None:
+					errors_by_file[i] = cached_errors
+					if cached_errors:
+						failed_count += 1
+					continue
+			if contents is None and blob_sha is not None:
+				with profiling.span("git cat-file", "git", path=path):
+					contents = blob_reader.read(blob_sha)
+			elif contents is None:
+				contents = read_file(path)
+			if contents is None:
+				print_error("Could not find blob %s of file '%s'" % (blob_sha, path))
+				continue
+			cache_misses.append(i)
+			files_to_run.append(((status, path), contents, file_changed_lines))
+
+	# the files with errors in the cache count towards the threshold
+	remaining_failures = fail_fast - failed_count if fail_fast is not None else None
+	workers = get_worker_count(workers)
+	if workers > 1 and len(files_to_run) >= compiled_config.min_parallel_batch_size:
+		results = validate_files_in_pool(files_to_run, workers, remaining_failures)
+	else:
+		# small batches are faster in process than paying for the pool startup
+		results = []
+		for job in files_to_run:
+			if remaining_failures is not None and remaining_failures <= 0:
+				results.append(None)
+				continue
+			results.append(validate_file(*job))
+			if _has_errors(results[-1]) and remaining_failures is not None:
+				remaining_failures -= 1
+
+	for i, file_errors in zip(cache_misses, results):
+		if isinstance(file_errors, validation_budget.OverBudget):
+			# reported rather than failed, the file is too big or slow for its validator, not wrong
+			extension = get_validated_extension(files[i][1])
+			budget = compiled_config.get_validation_budget(extension)
+			print_error(validation_budget.get_skipped_message(files[i][1], file_errors, budget))
+			over_budget_files.put(blob_shas[i], file_validators.get_validator_version(extension), budget, file_errors)
+			continue
+		errors_by_file[i] = file_errors
+		# skipped files aren't cached, they were never validated
+		if validation_cache is not None and file_errors is not None:
+			validation_cache.put(cache_keys[i], files[i][1], file_errors)
+	if validation_cache is not None:
+		hook_history.add_files(len(files_to_validate), validation_cache.hits, validation_cache.misses)
+		validation_cache.close()
+	else:
+		hook_history.add_files(len(files_to_validate))
+	if over_budget_files is not None:
+		over_budget_files.save()
+
+	return errors_by_file
+
+def get_cache_key(validation_cache, f, blob_sha, changed_lines=None):
+	# the cache key is built without importing the validator so cache hits never pay for its imports
+	extension = get_validated_extension(f[1])
+	return validation_cache.get_key(blob_sha, file_validators.get_validator_id(extension), file_validators.get_validator_version(extension),
+		config.get_config()["file_validation"][extension], f[0], changed_lines,
+		f[1] if file_validators.validators_by_extension[extension].depends_on_path else None)
+
+def validate_files_in_pool(files, workers, fail_fast=None):
+	"""Validates files in a pool of worker processes.
+
+	Args:
+		files: a list of (file, contents, changed lines) to be validated
+		workers: the number of worker processes
+		fail_fast: the number of files with errors after which the pool is stopped, None to validate every file
+	Returns:
+		a list containing the list of errors of each file, in the same order as the files, an OverBudget for the files
+		stopped by the watchdog, and None for the files that were queued or being validated when the pool was stopped
+	"""
+
+	# schedule the biggest files first so a big file doesn't end up running alone at the end
+	order = sorted(range(len(files)), key=lambda i: len(files[i][1]), reverse=True)
+
+	errors_by_file = [None] * len(files)
+	failed_count = 0
+	pool = _create_pool(min(workers, len(files)))
+	try:
+		# results are taken as they come so the pool can be stopped as soon as the threshold is reached
+		for i, result, stats, events in pool.imap_unordered(_validate_file_job, [(i, files[i]) for i in order], chunksize=1):
+			# the workers hand their statistics and profiling events back along with the errors
+			hook_history.add_stats(stats)
+			profiling.add_events(events)
+			errors_by_file[i] = result
+			if _has_errors(result):
+				failed_count += 1
+				if fail_fast is not None and failed_count >= fail_fast:
+					break
+		if fail_fast is not None and failed_count >= fail_fast:
+			# kills the workers, cancelling the files they're validating along with the queued ones
+			pool.terminate()
+		else:
+			pool.close()
+	except BaseException:
+		pool.terminate()
+		raise
+	finally:
+		pool.join()
+
+	return errors_by_file
+
+def _has_errors(result):
+	# files stopped by the watchdog don't count towards fail fast
+	return bool(result) and not isinstance(result, validation_budget.OverBudget)
+
+def _validate_file_job(indexed_job):
+	i, job = indexed_job
+	result = validate_file(*job)
+	return i, result, hook_history.take_stats(), profiling.take_events()
+
+def validate_file(f, contents=None, changed_lines=None):
+	"""Validates one file with its validator.
+
+	Args:
+		f: the (status, path) of the file
+		contents: the contents of the file as bytes, read from the working tree if not given
+		changed_lines: the changed line ranges to limit the validator to, if it's configured to only check changed lines
+	Returns:
+		a list of errors, or an OverBudget if the watchdog stopped the validator for going over its budget
+	"""
+
+	extension = get_validated_extension(f[1])
+	if extension is None:
+		return []
+	if contents is None:
+		contents = read_file(f[1])
+	compiled_config = config.get_compiled_config()
+	validator = file_validators.get_validator(extension)
+	arguments = compiled_config.get_validator_arguments(extension)
+	checks_changed_lines_only = changed_lines is not None and compiled_config.checks_changed_lines_only(extension)
+	if checks_changed_lines_only:
+		arguments = dict(arguments, changed_lines=changed_lines)
+
+	# the text rules of the extension run in one scan after its validator
+	def validate():
+		errors = validator((f[0], f[1]), contents=contents, **arguments)
+		text_rule_matcher = compiled_config.get_text_rule_matcher(extension)
+		if text_rule_matcher is not None:
+			with profiling.span("text rules", "text_rules", rules=len(text_rule_matcher.rules)):
+				rule_errors = text_rule_matcher.get_errors(contents, changed_lines if checks_changed_lines_only else None)
+			if rule_errors:
+				errors = (errors or ["[ERROR] Errors exist in " + f[1]]) + rule_errors
+		return errors
+
+	start = time.time()
+	with profiling.span(f[1], "file", validator=extension, bytes=len(contents)):
+		result = validation_budget.call_within_budget(validate, *compiled_config.get_validation_budget(extension))
+	hook_history.add_validation(extension, time.time() - start, len(contents))
+	return result
+
+def read_file(path):
+	with open(path, "rb") as fp:
+		return fp.read()
+
+def get_validated_extension(path):
+	"""Finds out whether a file should be validated, without importing its validator.
+
+	Args:
+		path: the path of the file
+	Returns:
+		the extension of the file's validator or None if the file should not be validated
+	"""
+
+	extension = os.path.splitext(path)[1]
+	entry = file_validators.validators_by_extension.get(extension)
+	if entry is None or not validation_enabled(extension):
+		return None
+	if entry.skips_test_directories and is_in_test_directory(path):
+		return None
+	return extension
+
+def get_worker_count(workers=None):
+	"""Works out how many worker processes validation may use.
+
+	Args:
+		workers: the number of workers requested on the command line, if any
+	Returns:
+		the number of workers, 1 meaning validation runs in process
+	"""
+
+	if workers is None:
+		workers = os.environ.get("GIT_HOOKS_WORKERS")
+	if workers is None:
+		workers = config.get_compiled_config().workers
+	try:
+		workers = int(workers)
+	except ValueError:
+		print_error("The number of workers must be an integer, got '%s'" % workers)
+		sys.exit(1)
+	if workers <= 0:
+		import multiprocessing
+		workers = multiprocessing.cpu_count()
+	if is_windows:
+		# windows can't fork, and spawned workers would re-run the hook script itself
+		return 1
+	return workers
+
+def get_fail_fast_threshold(fail_fast=None):
+	"""Works out after how many files with errors validation stops.
+
+	Args:
+		fail_fast: the threshold requested on the command line, if any
+	Returns:
+		the number of files with errors to stop after, None meaning every file is validated
+	"""
+
+	if fail_fast is None:
+		fail_fast = os.environ.get("GIT_HOOKS_FAIL_FAST")
+	if fail_fast is None:
+		return config.get_compiled_config().fail_fast_threshold
+	try:
+		fail_fast = int(fail_fast)
+	except ValueError:
+		print_error("The fail fast threshold must be an integer, got '%s'" % fail_fast)
+		sys.exit(1)
+	# 0 turns fail fast off
+	return fail_fast if fail_fast > 0 else None
+
+def _create_pool(workers):
+	import multiprocessing
+	# forked workers inherit the loaded config and validators instead of re-importing the hook script
+	if hasattr(multiprocessing, "get_context"):
+		return multiprocessing.get_context("fork").Pool(workers, initializer=_init_worker)
+	return multiprocessing.Pool(workers, initializer=_init_worker)
+
+def _init_worker():
+	# a forked worker starts with what the hook recorded before the fork, which the hook already has
+	profiling.clear_events()
+	hook_history.clear_stats()
 
 def is_in_test_directory(path):
-	for test_directory in get_config()["test_directories"]:
-		if path.startswith(test_directory):
-			return True
-	return False
+	return config.get_compiled_config().is_in_test_directory(path)
 
 def validation_enabled(file_extension):
-	return get_config()["file_validation"][file_extension]["validate"]
+	return config.get_compiled_config().validation_enabled(file_extension)
 
 def print_error(message):
 	if is_terminal and not is_windows:
@@ -73,7 +478,8 @@ def print_success(message):
 		print(message)
 
 def get_author_first_name():
-	user_name = subprocess.check_output(["git", "config", "user.name"], universal_newlines=True)
+	with profiling.span("git config", "git"):
+		user_name = subprocess.check_output(["git", "config", "user.name"], universal_newlines=True)
 	# return with a prepending space so sentences make sense without a name too
 	return " " + user_name.split()[0]
 
@@ -86,28 +492,59 @@ def ref_exists(ref):
 	"""
 
 	try:
-		subprocess.check_output(["git", "show", ref], universal_newlines=True)
+		with profiling.span("git show", "git", ref=ref):
+			subprocess.check_output(["git", "show", ref], universal_newlines=True)
 	except subprocess.CalledProcessError:
 		return False
 	return True
 
+_hooks_data_dir = None
+
+def get_hooks_data_dir():
+	"""Returns the directory inside the git dir where the hooks keep their local state.
+
+	The directory is created on first use. In a bare repository the git-hooks directory holds the hooks themselves,
+	so their state goes to git-hooks-data instead.
+	"""
+
+	global _hooks_data_dir
+	if _hooks_data_dir is None:
+		if os.path.isdir(".git"):
+			_hooks_data_dir = os.path.join(".git", "git-hooks")
+		else:
+			# worktrees and submodules have a .git file instead of a directory, and bare repositories have neither
+			is_bare, git_dir = subprocess.check_output(["git", "rev-parse", "--is-bare-repository", "--git-dir"],
+				universal_newlines=True).splitlines()
+			_hooks_data_dir = os.path.join(git_dir, "git-hooks-data" if is_bare == "true" else "git-hooks")
+		if not os.path.isdir(_hooks_data_dir):
+			try:
+				os.makedirs(_hooks_data_dir)
+			except OSError:
+				# another hook process may have created it in the meantime
+				if not os.path.isdir(_hooks_data_dir):
+					raise
+	return _hooks_data_dir
+
+def write_file_atomically(path, contents):
+	"""Replaces a file in the hooks data dir through a temporary file, so a concurrent hook never reads half of it.
+
+	Args:
+		path: the path of the file
+		contents: the text to write
+	Raises:
+		IOError or OSError: if the file can't be written
+	"""
+
+	temp_path = "%s.%d" % (path, os.getpid())
+	with open(temp_path, "w") as temp_file:
+		temp_file.write(contents)
+	# rename doesn't replace an existing file on windows
+	if is_windows and os.path.exists(path):
+		os.remove(path)
+	os.rename(temp_path, path)
+
 def get_config():
-	if not os.path.isfile("./git-hooks-config.json"):
-		print_error("You must have a file named 'git-hooks-config.json' one level outside of your git-hooks submodule directory.")
-		sys.exit(1)
-	config_schema = json.load(open("./git-hooks/config-schema.json"))
-	with open("./git-hooks-config.json") as user_config_file:
-		try:
-			user_config = json.load(user_config_file)
-			if not user_config:
-				print_error("'git-hooks-config.json' is empty!")
-				sys.exit(1)
-			jsonschema.validate(user_config, config_schema)
-		except (ValueError, jsonschema.exceptions.ValidationError) as ve:
-			print_error(ve.message)
-			print_error("Ensure that your 'git-hooks-config.json' file adheres to the schema provided in the git-hooks submodule.")
-			sys.exit(1)
-		return user_config
+	return config.get_config()
 
 if __name__ == '__main__':
 	get_config()
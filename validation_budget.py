@@ -0,0 +1,168 @@
+#!/usr/bin/env python
+from __future__ import print_function
+import os
+import sys
+import json
+import time
+import signal
+import collections
+import utils
+
+over_budget_file_name = "over-budget.json"
+# the files that went over budget are few, the oldest are forgotten past this many
+max_over_budget_entries = 1000
+
+# how often the watchdog looks at the time and memory used by the validator
+check_interval_seconds = 0.05
+
+try:
+	import resource
+except ImportError:
+	resource = None
+
+# stands in for the errors of a file whose validation the watchdog stopped, for 'time' or 'memory' after some seconds
+OverBudget = collections.namedtuple("OverBudget", ["reason", "seconds"])
+
+class _BudgetExceeded(BaseException):
+	# not an Exception so the validators' own error handling doesn't catch it
+	def __init__(self, reason):
+		BaseException.__init__(self, reason)
+		self.reason = reason
+
+class _Watchdog(object):
+
+	def __init__(self, seconds, memory_bytes):
+		self.seconds = seconds
+		self.memory_bytes = memory_bytes
+		self.active = False
+		self.start = None
+		self.start_memory = None
+
+	def check(self, signal_number, frame):
+		# the validator may have returned just before the signal was handled
+		if not self.active:
+			return
+		if self.seconds and time.time() - self.start > self.seconds:
+			self.active = False
+			raise _BudgetExceeded("time")
+		if self.memory_bytes and _get_memory_usage() - self.start_memory > self.memory_bytes:
+			self.active = False
+			raise _BudgetExceeded("memory")
+
+def call_within_budget(function, seconds=None, memory_mb=None):
+	"""Calls a function under a watchdog that stops it once it has run for too long or grown the process too much.
+
+	The watchdog interrupts python code, a long call into a C extension is only stopped once it returns.
+	Without SIGALRM, e.g. on windows, or outside the main thread, the function runs without a budget.
+
+	Args:
+		function: the function to call without arguments
+		seconds: the most seconds it may run for, None for no limit
+		memory_mb: the most MB it may grow the resident memory of the process by, None for no limit
+	Returns:
+		what the function returned, or an OverBudget if it was stopped
+	"""
+
+	if not (seconds or memory_mb) or not hasattr(signal, "setitimer"):
+		return function()
+
+	watchdog = _Watchdog(seconds, memory_mb * 1024 * 1024 if memory_mb else None)
+	try:
+		previous_handler = signal.signal(signal.SIGALRM, watchdog.check)
+	except ValueError:
+		# only the main thread can handle signals
+		return function()
+	watchdog.start = time.time()
+	watchdog.start_memory = _get_memory_usage() if memory_mb else 0
+	watchdog.active = True
+	signal.setitimer(signal.ITIMER_REAL, check_interval_seconds, check_interval_seconds)
+	try:
+		result = function()
+		watchdog.active = False
+		return result
+	except _BudgetExceeded as e:
+		return OverBudget(e.reason, time.time() - watchdog.start)
+	finally:
+		watchdog.active = False
+		signal.setitimer(signal.ITIMER_REAL, 0)
+		signal.signal(signal.SIGALRM, previous_handler)
+
+def get_skipped_message(path, over_budget, budget, remembered=False):
+	"""Describes a file the watchdog stopped.
+
+	Args:
+		path: the path of the file
+		over_budget: the OverBudget of the file
+		budget: the (seconds, memory MB) budget of its validator
+		remembered: whether it was stopped on an earlier run and skipped straight away this time
+	"""
+
+	seconds, memory_mb = budget
+	limit = "the %ss time budget" % seconds if over_budget.reason == "time" else "the %d MB memory budget" % memory_mb
+	if remembered:
+		return "[SKIPPED] %s: over budget, it went over %s after %.1fs on an earlier run" % (path, limit, over_budget.seconds)
+	return "[SKIPPED] %s: over budget, stopped after %.1fs for going over %s" % (path, over_budget.seconds, limit)
+
+class OverBudgetFiles(object):
+	"""Remembers the blobs whose validation went over budget, so later runs skip them straight away.
+
+	A blob is only skipped for the validator version and budget it went over, a new validator or a bigger budget tries it again.
+	"""
+
+	def __init__(self):
+		self._path = os.path.join(utils.get_hooks_data_dir(), over_budget_file_name)
+		self._entries = None
+		self._changed = False
+
+	def get(self, blob_sha, validator_version, budget):
+		"""Looks up a blob that went over budget before.
+
+		Returns:
+			its OverBudget or None if it wasn't stopped before with this validator version and budget
+		"""
+
+		entry = self._load().get(blob_sha)
+		if entry is None or entry["validator_version"] != validator_version or entry["budget"] != list(budget):
+			return None
+		return OverBudget(entry["reason"], entry["seconds"])
+
+	def put(self, blob_sha, validator_version, budget, over_budget):
+		self._load()[blob_sha] = {"validator_version": validator_version, "budget": list(budget),
+			"reason": over_budget.reason, "seconds": over_budget.seconds, "recorded": time.time()}
+		self._changed = True
+
+	def save(self):
+		if not self._changed:
+			return
+		entries = self._load()
+		if len(entries) > max_over_budget_entries:
+			newest = sorted(entries, key=lambda blob_sha: entries[blob_sha]["recorded"], reverse=True)[:max_over_budget_entries]
+			entries = dict((blob_sha, entries[blob_sha]) for blob_sha in newest)
+		try:
+			utils.write_file_atomically(self._path, json.dumps(entries))
+		except (IOError, OSError):
+			# remembering is only an optimization
+			pass
+		self._changed = False
+
+	def _load(self):
+		if self._entries is None:
+			try:
+				with open(self._path, "r") as over_budget_file:
+					self._entries = json.load(over_budget_file)
+			except (IOError, OSError, ValueError):
+				self._entries = {}
+		return self._entries
+
+def _get_memory_usage():
+	# the resident memory of the process in bytes, from /proc on linux and the peak from getrusage elsewhere
+	try:
+		with open("/proc/self/statm", "r") as statm:
+			return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+	except (IOError, OSError, ValueError, IndexError):
+		pass
+	if resource is None:
+		return 0
+	max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+	# ru_maxrss is in bytes on macOS and in kilobytes everywhere else
+	return max_rss if sys.platform == "darwin" else max_rss * 1024
@@ -0,0 +1,137 @@
+#!/usr/bin/env python
+from __future__ import print_function
+import os
+import json
+import time
+import hashlib
+import datetime
+import utils
+
+try:
+	import sqlite3
+except ImportError:
+	# some python builds ship without sqlite, validation then simply runs uncached
+	sqlite3 = None
+
+cache_file_name = "validation-cache.sqlite"
+
+# errors mention the path of the file, which isn't part of the blob, so it's swapped for this marker when stored
+path_marker = "\0path\0"
+
+class ValidationCache(object):
+	"""A persistent cache of validation errors keyed by git blob SHA.
+
+	Entries are evicted least recently used first once the cache holds more than max_entries.
+
+	Args:
+		cache_path: the path of the sqlite database
+		max_entries: the maximum number of entries to keep
+	"""
+
+	def __init__(self, cache_path, max_entries):
+		self.max_entries = max_entries
+		self.hits = 0
+		self.misses = 0
+		self._connection = sqlite3.connect(cache_path, timeout=10)
+		self._connection.execute("CREATE TABLE IF NOT EXISTS validation_results "
+			"(key TEXT PRIMARY KEY, errors TEXT NOT NULL, last_used REAL NOT NULL)")
+		self._connection.execute("CREATE INDEX IF NOT EXISTS validation_results_last_used ON validation_results (last_used)")
+		self._connection.commit()
+		self._used_keys = []
+		self._new_entries = []
+
+	def get_key(self, blob_sha, validator_id, validator_version, validator_config, file_status, changed_lines=None, path=None):
+		"""Builds the cache key of a validation.
+
+		Args:
+			blob_sha: the git blob SHA of the file contents
+			validator_id: the name of the validator
+			validator_version: a hash of the validator's source
+			validator_config: the part of the user config the validator depends on
+			file_status: the git status letter of the file, some rules only apply to added files
+			changed_lines: the line ranges the validator was limited to, if any
+			path: the path of the file, for validators whose errors depend on it
+		Returns:
+			the key as a hex string
+		"""
+
+		key_parts = [blob_sha, validator_id, validator_version,
+			json.dumps(validator_config, sort_keys=True), file_status[:1],
+			# the java copyright rule depends on the current year
+			str(datetime.date.today().year)]
+		if changed_lines is not None:
+			key_parts.append(json.dumps(changed_lines))
+		if path is not None:
+			key_parts.append("path:" + path)
+		return hashlib.sha1("\n".join(key_parts).encode("utf-8")).hexdigest()
+
+	def get(self, key, path):
+		"""Looks up the errors of a previous validation.
+
+		Args:
+			key: the key from get_key
+			path: the path of the file being validated
+		Returns:
+			the list of errors or None if the validation isn't cached
+		"""
+
+		row = self._connection.execute("SELECT errors FROM validation_results WHERE key = ?", (key,)).fetchone()
+		if row is None:
+			self.misses += 1
+			return None
+		self.hits += 1
+		self._used_keys.append(key)
+		return [error.replace(path_marker, path) for error in json.loads(row[0])]
+
+	def put(self, key, path, errors):
+		self._new_entries.append((key, json.dumps([error.replace(path, path_marker) for error in errors])))
+
+	def close(self):
+		"""Writes the new entries and access times in one transaction and evicts old entries."""
+
+		now = time.time()
+		try:
+			with self._connection:
+				self._connection.executemany("UPDATE validation_results SET last_used = ? WHERE key = ?",
+					[(now, key) for key in self._used_keys])
+				self._connection.executemany("INSERT OR REPLACE INTO validation_results (key, errors, last_used) VALUES (?, ?, ?)",
+					[(key, errors, now) for key, errors in self._new_entries])
+				entry_count = self._connection.execute("SELECT COUNT(*) FROM validation_results").fetchone()[0]
+				if entry_count > self.max_entries:
+					# evict down to 90% so eviction doesn't run again on every hook
+					self._connection.execute("DELETE FROM validation_results WHERE key IN "
+						"(SELECT key FROM validation_results ORDER BY last_used LIMIT ?)",
+						(entry_count - int(self.max_entries * 0.9),))
+		except sqlite3.Error:
+			# another hook holding the lock too long only costs us this run's entries
+			pass
+		finally:
+			self._connection.close()
+
+def open_cache(max_entries):
+	"""Opens the validation cache in the git dir.
+
+	Args:
+		max_entries: the maximum number of entries to keep
+	Returns:
+		a ValidationCache or None if the cache can't be used
+	"""
+
+	if sqlite3 is None:
+		return None
+	try:
+		return ValidationCache(os.path.join(utils.get_hooks_data_dir(), cache_file_name), max_entries)
+	except sqlite3.Error as e:
+		utils.print_error("Could not open the validation cache, validating without it: %s" % e)
+		return None
+
+def get_blob_sha(contents):
+	"""Computes the git blob SHA of some file contents, the same as 'git hash-object'.
+
+	Args:
+		contents: the file contents as bytes
+	Returns:
+		the SHA as a hex string
+	"""
+
+	return hashlib.sha1(("blob %d\0" % len(contents)).encode("ascii") + contents).hexdigest()
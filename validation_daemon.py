@@ -0,0 +1,249 @@
+#!/usr/bin/env python
+from __future__ import print_function
+import os
+import sys
+import json
+import time
+import socket
+import subprocess
+import utils
+import config
+import profiling
+import hook_history
+
+try:
+	import socketserver
+except ImportError:
+	import SocketServer as socketserver
+
+try:
+	from StringIO import StringIO
+except ImportError:
+	from io import StringIO
+
+socket_file_name = "daemon.sock"
+log_file_name = "daemon.log"
+
+# the daemon exits by itself when no hook has used it for this long
+idle_timeout_seconds = 3 * 60 * 60
+connect_timeout_seconds = 1
+start_timeout_seconds = 10
+
+# set in the daemon process so its own validations aren't forwarded back to it
+in_daemon = False
+
+class ValidationDaemon(object):
+	"""Serves validation requests from the hooks with validators, config and caches kept warm.
+
+	Args:
+		socket_path: the path of the unix socket to listen on
+	"""
+
+	def __init__(self, socket_path):
+		self.socket_path = socket_path
+		self.started = time.time()
+		self.last_request = self.started
+		self.requests_served = 0
+		self.running = True
+		self._code_signature = get_code_signature()
+
+	def serve(self):
+		server = socketserver.UnixStreamServer(self.socket_path, _RequestHandler)
+		server.validation_daemon = self
+		server.timeout = 60
+		try:
+			while self.running and time.time() - self.last_request < idle_timeout_seconds:
+				server.handle_request()
+		finally:
+			server.server_close()
+			if os.path.exists(self.socket_path):
+				os.remove(self.socket_path)
+
+	def handle_request(self, request):
+		self.last_request = time.time()
+		self.requests_served += 1
+		command = request.get("command")
+
+		if command == "status":
+			return {"status": "ok", "pid": os.getpid(), "uptime": time.time() - self.started, "requests_served": self.requests_served}
+		elif command == "stop":
+			self.running = False
+			return {"status": "ok"}
+		elif command == "validate":
+			if get_code_signature() != self._code_signature:
+				# the hooks were updated, let the client validate in process and exit so the old code isn't used
+				self.running = False
+				return {"status": "stale"}
+			config.reload_if_changed()
+			# the events of a profiled hook are recorded here and sent back with the errors
+			profiling.enabled = bool(request.get("profile"))
+			profiling.clear_events()
+			hook_history.clear_stats()
+			# anything the validators print goes back to the hook instead of the daemon log
+			output = StringIO()
+			stdout = sys.stdout
+			sys.stdout = output
+			try:
+				errors_by_file = utils.validate_files_in_process(request["files"], request.get("workers"), request.get("changed_lines"),
+					request.get("fail_fast"))
+			except (Exception, SystemExit) as e:
+				return {"status": "error", "message": str(e)}
+			finally:
+				sys.stdout = stdout
+				profiling.enabled = False
+			return {"status": "ok", "errors_by_file": errors_by_file, "output": output.getvalue(), "events": profiling.take_events(),
+				"stats": hook_history.take_stats()}
+		return {"status": "error", "message": "Unknown command '%s'" % command}
+
+class _RequestHandler(socketserver.StreamRequestHandler):
+
+	def handle(self):
+		try:
+			request = json.loads(self.rfile.readline().decode("utf-8"))
+		except ValueError:
+			return
+		response = self.server.validation_daemon.handle_request(request)
+		self.wfile.write(json.dumps(response).encode("utf-8"))
+
+def is_supported():
+	return hasattr(socket, "AF_UNIX")
+
+def get_socket_path():
+	return os.path.join(utils.get_hooks_data_dir(), socket_file_name)
+
+def request(command, **arguments):
+	"""Sends a request to the daemon of the current repository.
+
+	Args:
+		command: one of 'validate', 'status' or 'stop'
+		arguments: the arguments of the command
+	Returns:
+		the response or None if the daemon isn't running
+	"""
+
+	if in_daemon or not is_supported():
+		return None
+	socket_path = get_socket_path()
+	if not os.path.exists(socket_path):
+		return None
+
+	arguments["command"] = command
+	client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+	chunks = []
+	try:
+		client.settimeout(connect_timeout_seconds)
+		client.connect(socket_path)
+		# validation can take a while
+		client.settimeout(None)
+		client.sendall((json.dumps(arguments) + "\n").encode("utf-8"))
+		while True:
+			chunk = client.recv(65536)
+			if not chunk:
+				break
+			chunks.append(chunk)
+	except socket.error:
+		# a socket left behind by a daemon that died
+		return None
+	finally:
+		client.close()
+
+	try:
+		return json.loads(b"".join(chunks).decode("utf-8"))
+	except ValueError:
+		return None
+
+def get_validation_errors_by_file(files, workers=None, changed_lines=None, fail_fast=None):
+	"""Validates files in the daemon.
+
+	Args:
+		files: the list of files to be validated
+		workers: the number of worker processes requested, if any
+		changed_lines: a dict of file to the changed line ranges the validator should be limited to, see utils.get_changed_lines
+		fail_fast: the number of files with errors to stop validating after, if requested
+	Returns:
+		a list with the list of errors of each file, None for the files skipped by fail fast,
+		or None if the daemon couldn't validate the files
+	"""
+
+	# the daemon's environment is not the hook's
+	if workers is None:
+		workers = os.environ.get("GIT_HOOKS_WORKERS")
+	if fail_fast is None:
+		fail_fast = os.environ.get("GIT_HOOKS_FAIL_FAST")
+	response = request("validate", files=files, workers=workers, changed_lines=changed_lines, fail_fast=fail_fast, profile=profiling.enabled)
+	if response is None or response.get("status") != "ok":
+		return None
+	if response["output"]:
+		sys.stdout.write(response["output"])
+	profiling.add_events(response.get("events", []))
+	hook_history.add_stats(response.get("stats", {}))
+	return response["errors_by_file"]
+
+def get_code_signature():
+	hooks_directory = os.path.dirname(os.path.abspath(__file__))
+	signature = []
+	for directory in [hooks_directory, os.path.join(hooks_directory, "file_validators")]:
+		for file_name in sorted(os.listdir(directory)):
+			if file_name.endswith(".py"):
+				signature.append((file_name, os.path.getmtime(os.path.join(directory, file_name))))
+	return signature
+
+def start():
+	if request("status") is not None:
+		utils.print_success("The validation daemon is already running")
+		return True
+	if not is_supported():
+		utils.print_error("The validation daemon needs unix sockets, which this platform doesn't have")
+		return False
+
+	popen_arguments = {}
+	if hasattr(os, "setsid"):
+		# don't let the daemon die with the terminal that started it
+		popen_arguments["preexec_fn"] = os.setsid
+	with open(os.devnull, "r") as devnull, open(os.path.join(utils.get_hooks_data_dir(), log_file_name), "a") as log_file:
+		subprocess.Popen([sys.executable, os.path.abspath(__file__), "serve"], cwd=os.path.dirname(os.path.abspath(__file__)),
+			stdin=devnull, stdout=log_file, stderr=subprocess.STDOUT, close_fds=True, **popen_arguments)
+
+	deadline = time.time() + start_timeout_seconds
+	while time.time() < deadline:
+		if request("status") is not None:
+			utils.print_success("Started the validation daemon")
+			return True
+		time.sleep(0.1)
+	utils.print_error("The validation daemon did not start, see %s" % os.path.join(utils.get_hooks_data_dir(), log_file_name))
+	return False
+
+def stop():
+	if request("stop") is None:
+		utils.print_success("The validation daemon is not running")
+	else:
+		utils.print_success("Stopped the validation daemon")
+
+def print_status():
+	response = request("status")
+	if response is None:
+		utils.print_success("The validation daemon is not running")
+	else:
+		utils.print_success("The validation daemon is running (pid %d, up for %d minutes, %d requests served)" %
+			(response["pid"], response["uptime"] // 60, response["requests_served"]))
+
+def serve():
+	global in_daemon
+	in_daemon = True
+	socket_path = get_socket_path()
+	if os.path.exists(socket_path):
+		os.remove(socket_path)
+	# warm up the config before the first hook needs it
+	config.get_compiled_config()
+	ValidationDaemon(socket_path).serve()
+
+if __name__ == "__main__":
+	commands = {"start": start, "stop": stop, "status": print_status, "serve": serve}
+	if len(sys.argv) != 2 or sys.argv[1] not in commands:
+		print("usage: python %s start|stop|status" % __file__)
+		sys.exit(1)
+
+	# run from the repository the git-hooks directory lives in
+	os.chdir("..")
+	if commands[sys.argv[1]]() is False:
+		sys.exit(1)
@@ -0,0 +1,270 @@
+#!/usr/bin/env python
+from __future__ import print_function
+import os
+import sys
+import time
+import errno
+import select
+import struct
+import subprocess
+from optparse import OptionParser
+import utils
+import config
+import validation_daemon
+from utils import print_error, print_success
+
+default_debounce_seconds = 0.5
+default_poll_interval_seconds = 2.0
+default_cpu_percent = 25
+# files are validated a few at a time so the watcher can rest in between and stay under its CPU cap
+validation_batch_size = 20
+
+class InotifyWatcher(object):
+	"""Reports the files written in the repository, using inotify through ctypes.
+
+	Every non ignored directory is watched, and directories created later are added as they appear.
+
+	Raises:
+		OSError: if inotify isn't available or the watch limit is reached, the caller should poll instead
+	"""
+
+	in_close_write = 0x00000008
+	in_moved_to = 0x00000080
+	in_create = 0x00000100
+	in_q_overflow = 0x00004000
+	in_isdir = 0x40000000
+	watch_mask = in_close_write | in_moved_to | in_create
+	event_header = struct.Struct("iIII")
+
+	def __init__(self, directories):
+		import ctypes
+		import ctypes.util
+		self._libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+		if not hasattr(self._libc, "inotify_init"):
+			raise OSError(errno.ENOSYS, "inotify is not available")
+		self._fd = self._libc.inotify_init()
+		if self._fd < 0:
+			raise OSError(ctypes.get_errno(), "inotify_init failed")
+		self._directories_by_watch = {}
+		for directory in directories:
+			self.add_directory(directory)
+
+	def add_directory(self, directory):
+		import ctypes
+		watch = self._libc.inotify_add_watch(self._fd, directory.encode(sys.getfilesystemencoding()), self.watch_mask)
+		if watch < 0:
+			error = ctypes.get_errno()
+			# the directory may be gone already
+			if error != errno.ENOENT:
+				raise OSError(error, "Could not watch '%s'" % directory)
+			return
+		self._directories_by_watch[watch] = directory
+
+	def wait(self, timeout):
+		"""Waits for files to be written.
+
+		Args:
+			timeout: the most seconds to wait for, or None to wait until something is written
+		Returns:
+			the paths written since the last call, which may be none
+		"""
+
+		if not select.select([self._fd], [], [], timeout)[0]:
+			return []
+		data = os.read(self._fd, 65536)
+		paths = []
+		offset = 0
+		while offset < len(data):
+			watch, mask, cookie, length = self.event_header.unpack_from(data, offset)
+			name = data[offset + self.event_header.size:offset + self.event_header.size + length].rstrip(b"\0").decode(sys.getfilesystemencoding())
+			offset += self.event_header.size + length
+			if mask & self.in_q_overflow:
+				# events were dropped, so everything that changed is looked up again
+				paths.extend(get_changed_paths())
+				continue
+			directory = self._directories_by_watch.get(watch)
+			if directory is None or not name:
+				continue
+			path = os.path.normpath(os.path.join(directory, name))
+			if not mask & self.in_isdir:
+				if mask & (self.in_close_write | self.in_moved_to):
+					paths.append(path)
+			elif not is_ignored_directory(path):
+				# files may have been written in a new directory before its watch was added
+				for new_directory, subdirectories, file_names in os.walk(path):
+					self.add_directory(new_directory)
+					paths.extend(os.path.join(new_directory, file_name) for file_name in file_names)
+		return paths
+
+	def close(self):
+		os.close(self._fd)
+
+class PollingWatcher(object):
+	"""Reports the files written in the repository by asking git for the changed files every interval and comparing their mtimes.
+
+	Args:
+		interval: the seconds between two polls
+	"""
+
+	def __init__(self, interval):
+		self.interval = interval
+		self._next_poll = time.time()
+		self._signatures = {}
+
+	def wait(self, timeout):
+		"""Waits for the next poll, or for timeout seconds if that's sooner.
+
+		Args:
+			timeout: the most seconds to wait for, or None to wait for the next poll
+		Returns:
+			the paths written since the last call, which may be none
+		"""
+
+		delay = max(self._next_poll - time.time(), 0)
+		if timeout is not None and delay > timeout:
+			time.sleep(timeout)
+			return []
+		time.sleep(delay)
+		self._next_poll = time.time() + self.interval
+
+		paths = []
+		signatures = {}
+		for path in get_changed_paths():
+			try:
+				stat = os.stat(path)
+			except OSError:
+				continue
+			signatures[path] = (stat.st_mtime, stat.st_size)
+			if self._signatures.get(path) != signatures[path]:
+				paths.append(path)
+		self._signatures = signatures
+		return paths
+
+	def close(self):
+		pass
+
+def watch(watcher, debounce_seconds=default_debounce_seconds, cpu_percent=default_cpu_percent):
+	"""Validates the files the watcher reports until interrupted, storing the results in the validation cache.
+
+	Args:
+		watcher: an InotifyWatcher or a PollingWatcher
+		debounce_seconds: how long no file must be written for before validating, editors often write in bursts
+		cpu_percent: the share of one cpu the validation may use on average
+	"""
+
+	code_signature = validation_daemon.get_code_signature()
+	# the files changed before the watcher started are validated first
+	pending = set(path for path in get_changed_paths() if utils.get_validated_extension(path) is not None)
+	last_change = 0
+	while True:
+		changed_paths = watcher.wait(debounce_seconds if pending else None)
+		changed_paths = [path for path in changed_paths if utils.get_validated_extension(path) is not None]
+		if changed_paths:
+			pending.update(changed_paths)
+			last_change = time.time()
+			continue
+		if not pending or time.time() - last_change < debounce_seconds:
+			continue
+
+		if validation_daemon.get_code_signature() != code_signature:
+			print_error("The git hooks were updated, restart the watcher to use them")
+			return
+		config.reload_if_changed()
+		paths = sorted(path for path in pending if os.path.isfile(path))
+		pending.clear()
+		for i in range(0, len(paths), validation_batch_size):
+			validate_paths(paths[i:i + validation_batch_size], cpu_percent)
+
+def validate_paths(paths, cpu_percent):
+	"""Validates files from the working tree with the status they'd be committed with, then rests to respect the CPU cap."""
+
+	tracked_paths = get_paths_in_head(paths)
+	files = [["M" if path in tracked_paths else "A", path] for path in paths]
+	start = time.time()
+	# the lines changed since HEAD are the ones pre-commit will check once they're staged,
+	# and fail fast is off since every saved file needs its own result
+	errors_by_file = utils.validate_files_in_process(files, 1, utils.get_changed_lines(["diff", "HEAD"], files), 0)
+	elapsed = time.time() - start
+
+	for path, errors in zip(paths, errors_by_file):
+		if errors:
+			print_error("\n".join(errors))
+		else:
+			print_success("%s passed the git hook validation" % path)
+	sys.stdout.flush()
+
+	# rest in proportion to the work just done so the average stays under the cap
+	time.sleep(elapsed * (100 - cpu_percent) / float(cpu_percent))
+
+def get_changed_paths():
+	"""Lists the modified tracked files and the untracked files that aren't ignored."""
+
+	output = subprocess.check_output(["git", "ls-files", "-z", "--modified", "--others", "--exclude-standard"])
+	return sorted(set(path.decode("utf-8") for path in output.split(b"\0") if path))
+
+def get_paths_in_head(paths):
+	"""Finds out which of the paths are in HEAD, the others would be committed as added files."""
+
+	try:
+		with open(os.devnull, "w") as devnull:
+			output = subprocess.check_output(["git", "ls-tree", "-z", "--name-only", "HEAD", "--"] + paths, stderr=devnull)
+	except subprocess.CalledProcessError:
+		# no commits yet
+		return set()
+	return set(path.decode("utf-8") for path in output.split(b"\0") if path)
+
+def get_watched_directories():
+	"""Lists the directories holding files that are tracked or untracked but not ignored."""
+
+	output = subprocess.check_output(["git", "ls-files", "-z", "--cached", "--others", "--exclude-standard"])
+	directories = set(["."])
+	for path in output.split(b"\0"):
+		directory = os.path.dirname(path.decode("utf-8"))
+		while directory and directory not in directories:
+			directories.add(directory)
+			directory = os.path.dirname(directory)
+	return sorted(directories)
+
+def is_ignored_directory(path):
+	if path == ".git" or path.startswith(".git" + os.sep):
+		return True
+	return subprocess.call(["git", "check-ignore", "-q", path]) == 0
+
+if __name__ == "__main__":
+	parser = OptionParser(usage="python %s [options]" % __file__)
+	parser.set_description("Validates files in the background as soon as they're saved, so pre-commit only has to look up the results")
+	parser.add_option("-d", "--debounce", type="float", dest="debounce", default=default_debounce_seconds, help="Seconds without writes to wait for before validating (default %s)" % default_debounce_seconds)
+	parser.add_option("-c", "--cpu-percent", type="int", dest="cpu_percent", default=default_cpu_percent, help="Share of one cpu the validation may use on average (default %d)" % default_cpu_percent)
+	parser.add_option("-p", "--poll", action="store_true", dest="poll", default=False, help="Poll for changes instead of using inotify")
+	parser.add_option("-i", "--interval", type="float", dest="interval", default=default_poll_interval_seconds, help="Seconds between two polls (default %s)" % default_poll_interval_seconds)
+	(options, args) = parser.parse_args()
+
+	if not 0 < options.cpu_percent <= 100:
+		print_error("The cpu share must be between 1 and 100")
+		sys.exit(1)
+
+	# run from the repository the git-hooks directory lives in
+	os.chdir("..")
+
+	if not config.get_compiled_config().cache_enabled:
+		print_error("The watcher stores its results in the validation cache, which is disabled in the config")
+		sys.exit(1)
+	if hasattr(os, "nice"):
+		os.nice(10)
+
+	watcher = None
+	if not options.poll and sys.platform.startswith("linux"):
+		try:
+			watcher = InotifyWatcher(get_watched_directories())
+		except OSError as e:
+			print_error("Could not use inotify (%s), polling instead" % e)
+	if watcher is None:
+		watcher = PollingWatcher(options.interval)
+
+	print_success("Watching for changes, press Ctrl-C to stop")
+	try:
+		watch(watcher, options.debounce, options.cpu_percent)
+	except KeyboardInterrupt:
+		pass
+	finally:
+		watcher.close()